@@ -5,17 +5,21 @@
 # - Detección de cambios valor viejo → valor nuevo
 # ==============================================
 
+import hashlib
 import streamlit as st
 import pandas as pd
 import numpy as np
 from io import BytesIO
 from datetime import datetime
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode, JsCode
+from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
 from zoneinfo import ZoneInfo
 import smtplib
 from email.message import EmailMessage
 import requests
 import msal
+import contador
+import tiempos
+import transaccion
 
 # ------ Configuración de vista ----------
 st.set_page_config(layout="wide")
@@ -93,7 +97,8 @@ def get_access_token():
         authority=f"https://login.microsoftonline.com/{TENANT_ID}",
         client_credential=CLIENT_SECRET
     )
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+    with tiempos.span("graph.token"):
+        result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
     if "access_token" not in result:
         st.error(f"❌ No se pudo obtener token de acceso: {result}")
         raise Exception("No se pudo obtener token de acceso")
@@ -160,26 +165,31 @@ def _get_site_and_drive(token):
 
 def get_file_from_sharepoint(path):
     token = get_access_token()
-    site_id, drive_id = _get_site_and_drive(token)
+    with tiempos.span("graph.sitio"):
+        site_id, drive_id = _get_site_and_drive(token)
     headers = {"Authorization": f"Bearer {token}"}
     url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{path}:/content"
-    resp = requests.get(url, headers=headers)
+    with tiempos.span("graph.descarga"):
+        resp = requests.get(url, headers=headers)
     if resp.status_code != 200:
         raise Exception(f"Error descargando archivo {path}: {resp.status_code} {resp.text}")
     return BytesIO(resp.content)
 
 def upload_file_to_sharepoint(path, file_bytes):
     token = get_access_token()
-    site_id, drive_id = _get_site_and_drive(token)
+    with tiempos.span("graph.sitio"):
+        site_id, drive_id = _get_site_and_drive(token)
     headers = {"Authorization": f"Bearer {token}"}
     url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{path}:/content"
-    resp = requests.put(url, headers=headers, data=file_bytes.getvalue())
+    with tiempos.span("graph.subida"):
+        resp = requests.put(url, headers=headers, data=file_bytes.getvalue())
     if resp.status_code not in (200, 201):
         raise Exception(f"Error subiendo archivo {path}: {resp.status_code} {resp.text}")
 
 def ensure_folder(path):
     token = get_access_token()
-    site_id, drive_id = _get_site_and_drive(token)
+    with tiempos.span("graph.sitio"):
+        site_id, drive_id = _get_site_and_drive(token)
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
     url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{path}"
@@ -215,32 +225,11 @@ def enviar_correo_con_adjuntos(asunto, cuerpo, archivos_adjuntos):
             filename=nombre_archivo
         )
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
+    with tiempos.span("smtp"), smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
         smtp.starttls()
         smtp.login(SMTP_USER, SMTP_PASS)
         smtp.send_message(msg)
 
-# ========= Contador persistente =========
-def _leer_contador_hoy():
-    fecha_hoy = datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%d%m%Y")
-    contador_actual = 0
-    try:
-        stream = get_file_from_sharepoint(f"{FOLDER_PATH}/contador_envios.txt")
-        contenido = stream.read().decode("utf-8").strip()
-        partes = contenido.split(",")
-        if len(partes) == 2:
-            fecha_guardada, cnt = partes
-            if fecha_guardada == fecha_hoy:
-                contador_actual = int(cnt)
-    except Exception:
-        contador_actual = 0
-    return fecha_hoy, contador_actual
-
-def _guardar_contador_hoy(fecha_ddmmaaaa, nuevo_contador):
-    contenido = f"{fecha_ddmmaaaa},{nuevo_contador}".encode("utf-8")
-    out = BytesIO(contenido)
-    upload_file_to_sharepoint(f"{FOLDER_PATH}/contador_envios.txt", out)
-
 # ========= Normalización para comparar =========
 PHANTOM_PATTERNS = [r"^Unnamed", r"::auto_unique_id::", r"^index$", r"^Index$"]
 
@@ -332,11 +321,89 @@ def detectar_cambios(df_original, df_modificado, tipo_archivo):
     return cambios
 
 # ========= Manejo de archivos =========
+def _cargar_en_sesion(nombre_modo, nombre_archivo):
+    # El DataFrame vive en la sesión: se descarga una vez y las ediciones del
+    # grid se aplican sobre él celda a celda
+    key = f"gestor_df_{nombre_modo}"
+    if key not in st.session_state:
+        file_stream = get_file_from_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}")
+        with tiempos.span("read_excel"):
+            df = pd.read_excel(file_stream, dtype={0: str, 1: str})
+        df[ROWKEY] = np.arange(len(df)).astype(str)
+        st.session_state[key] = df
+    return st.session_state[key]
+
+def _valor_para_columna(df, col, valor):
+    # El grid devuelve el valor del editor (a menudo texto): se convierte al dtype de la
+    # columna. Si no encaja (p. ej. texto en una columna numérica), la columna se
+    # ensancha (int64 -> float64 -> object) en lugar de fallar en cada rerun.
+    serie = df[col]
+    vacio = valor is None or (isinstance(valor, str) and not valor.strip())
+    if pd.api.types.is_bool_dtype(serie):
+        if isinstance(valor, (bool, np.bool_)): return bool(valor)
+    elif pd.api.types.is_numeric_dtype(serie):
+        numero = np.nan if vacio else pd.to_numeric(valor, errors="coerce")
+        if vacio or not pd.isna(numero):
+            if pd.api.types.is_integer_dtype(serie) and not vacio and float(numero).is_integer(): return int(numero)
+            if pd.api.types.is_integer_dtype(serie): df[col] = serie.astype("float64")
+            return float(numero)
+    elif pd.api.types.is_datetime64_any_dtype(serie):
+        fecha = pd.NaT if vacio else pd.to_datetime(valor, errors="coerce")
+        if vacio or not pd.isna(fecha): return fecha
+    elif vacio or isinstance(valor, str):
+        return None if vacio else valor
+    df[col] = serie.astype(object)
+    return valor
+
+def _firma_evento(evento):
+    if not evento or evento.get("type") != "cellValueChanged": return None
+    return ((evento.get("data") or {}).get(ROWKEY), (evento.get("colDef") or {}).get("field"),
+            repr(evento.get("oldValue")), repr(evento.get("newValue")))
+
+def _evento_en_sincronia(df, evento):
+    # El valor anterior del evento debe ser el que tiene la sesión: si no, hubo una
+    # edición que no llegó como evento (ver manejar_archivo)
+    rid = (evento.get("data") or {}).get(ROWKEY)
+    col = (evento.get("colDef") or {}).get("field")
+    if rid is None or col not in df.columns: return True
+    actual = df.iat[int(rid), df.columns.get_loc(col)]
+    # Se convierte sobre una copia de la celda: si la columna se ensancha, no afecta a df
+    anterior = _valor_para_columna(df.iloc[[int(rid)]][[col]].copy(), col, evento.get("oldValue"))
+    if pd.isna(actual) or pd.isna(anterior): return pd.isna(actual) and pd.isna(anterior)
+    return actual == anterior
+
+def _aplicar_evento_celda(df, evento):
+    # Evento cellValueChanged del grid: solo fila (ROWKEY), columna y valor nuevo.
+    # Devuelve True si modificó el DataFrame.
+    if not evento or evento.get("type") != "cellValueChanged": return False
+    rid = (evento.get("data") or {}).get(ROWKEY)
+    col = (evento.get("colDef") or {}).get("field")
+    if rid is None or col not in df.columns or col == ROWKEY: return False
+    valor = _valor_para_columna(df, col, evento.get("newValue"))
+    df.iat[int(rid), df.columns.get_loc(col)] = valor
+    return True
+
+def _sincronizar_con_grid(df, datos):
+    # Datos completos que devuelve el grid (una fila por ROWKEY): se aplican las celdas
+    # que difieren de la sesión, con el mismo tipado que un evento. Devuelve cuántas.
+    if datos is None or ROWKEY not in datos.columns: return 0
+    grid = datos.drop_duplicates(subset=[ROWKEY]).set_index(ROWKEY)
+    cols = [c for c in df.columns if c != ROWKEY and c in grid.columns]
+    presentes = df[ROWKEY].isin(grid.index).to_numpy()
+    grid = grid.reindex(df[ROWKEY])[cols]
+    for c in cols:
+        # Las fechas vuelven del navegador como texto ISO
+        if pd.api.types.is_datetime64_any_dtype(df[c]): grid[c] = pd.to_datetime(grid[c], errors="coerce", utc=True).dt.tz_localize(None)
+    distintas = normalize_df_for_compare(df[cols]).to_numpy() != normalize_df_for_compare(grid).to_numpy()
+    filas, columnas = np.nonzero(distintas & presentes[:, None])
+    for i, j in zip(filas, columnas):
+        col = cols[j]
+        df.iat[i, df.columns.get_loc(col)] = _valor_para_columna(df, col, grid.iat[i, j])
+    return len(filas)
+
 def manejar_archivo(nombre_modo, nombre_archivo, autosize=True):
 
-    file_stream = get_file_from_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}")
-    df_original = pd.read_excel(file_stream, dtype={0: str, 1: str})
-    df_original[ROWKEY] = np.arange(len(df_original)).astype(str)
+    df_original = _cargar_en_sesion(nombre_modo, nombre_archivo)
 
     st.success(f"📂 Cargado {nombre_archivo} ✅")
 
@@ -358,28 +425,110 @@ def manejar_archivo(nombre_modo, nombre_archivo, autosize=True):
         domLayout="normal",                    # <-- asegurar layout normal (no autoHeight/fit)
         suppressHorizontalScroll=False,        # <-- permitir la barra horizontal
         suppressColumnVirtualisation=False,    # <-- evitar virtualización que a veces cambia el comportamiento de scroll
-        
+        getRowId=JsCode(f"function(params) {{ return params.data['{ROWKEY}']; }}"),
     )
 
     grid_options = gb.build()
 
-    grid_response = AgGrid(
-        df_original,
-        gridOptions=grid_options,
-        height=500,
-        fit_columns_on_grid_load=False,
-        enable_enterprise_modules=False,
-        update_mode=GridUpdateMode.VALUE_CHANGED,
-        data_return_mode=DataReturnMode.AS_INPUT,
-        allow_unsafe_jscode=True,
-        theme="balham",
-        reload_data=False
-    )
+    # Modo delta: cada edición dispara un rerun con el evento de la celda
+    # (fila, columna, valor nuevo), no con el grid completo
+    with tiempos.span("editor"):
+        grid_response = AgGrid(
+            df_original,
+            gridOptions=grid_options,
+            height=500,
+            fit_columns_on_grid_load=False,
+            enable_enterprise_modules=False,
+            update_on=["cellValueChanged"],
+            allow_unsafe_jscode=True,
+            theme="balham",
+            reload_data=False,
+            key=f"grid_{nombre_modo}",
+        )
+
+    # streamlit-aggrid informa solo el último evento de cada rerun, y event_data se
+    # repite en los reruns siguientes. Cada edición dispara su propio rerun
+    # (update_on), así que lo normal es un evento por rerun. Un evento ya aplicado no
+    # se vuelve a aplicar, por ejemplo tras recargar el libro después de guardar.
+    # Si dos ediciones llegan dentro del mismo rerun, solo llega el evento de la
+    # última: el valor anterior no coincide con la sesión y, en lugar del evento, se
+    # aplican las diferencias con los datos completos que devuelve el grid.
+    with tiempos.span("ediciones"):
+        evento = grid_response.event_data
+        firma = _firma_evento(evento)
+        key_evento = f"gestor_evento_{nombre_modo}"
+        if firma is not None and firma != st.session_state.get(key_evento):
+            st.session_state[key_evento] = firma
+            if _evento_en_sincronia(df_original, evento):
+                _aplicar_evento_celda(df_original, evento)
+            else:
+                _sincronizar_con_grid(df_original, grid_response.data)
+    return df_original
+
+# ========= Guardado (pasos de la transacción) =========
+def _huella_guardado(modificados):
+    # Resumen de los datos a guardar: un reintento con otros datos empieza de cero
+    h = hashlib.sha256()
+    for nombre_modo, df, nombre_archivo in modificados:
+        h.update(f"{nombre_modo}|{nombre_archivo}|{'|'.join(map(str, df.columns))}".encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(normalize_df_for_compare(df), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _preparar_guardado(tx, nombre_modo, df_modificado, nombre_archivo):
+    # Diff contra el original y Excel nuevo; el libro queda en la carpeta de la
+    # transacción (al reintentar, el original ya puede ser la versión subida).
+    # El original se conserva: si la persona edita de nuevo después de publicar y la
+    # transacción empieza de nuevo, el diff sigue partiendo de la versión previa
+    base = tx.archivo_conservado(f"{nombre_modo}_base.xlsx")
+    if not tx.conservado(f"publicado:{nombre_modo}"):
+        with open(base, "wb") as f:
+            f.write(get_file_from_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}").getvalue())
+    with tiempos.span("read_excel"):
+        df_original = pd.read_excel(base, dtype={0: str, 1: str})
+    df_original[ROWKEY] = np.arange(len(df_original)).astype(str)
+
+    with tiempos.span("diff"):
+        cambios = detectar_cambios(df_original, df_modificado, nombre_modo)
+
+    df_a_guardar = df_modificado.copy()
+    if ROWKEY in df_a_guardar.columns:
+        df_a_guardar = df_a_guardar.drop(columns=[ROWKEY])
+
+    with tiempos.span("to_excel"), open(tx.archivo(f"{nombre_modo}.xlsx"), "wb") as f:
+        df_a_guardar.to_excel(f, index=False)
+    return cambios
 
-    df_modificado = pd.DataFrame(grid_response["data"])
-    return df_modificado
+def _subir_backup(backup_folder, path, bytes_excel):
+    ensure_folder(backup_folder)
+    upload_file_to_sharepoint(path, bytes_excel)
+
+def _enviar_correo_guardado(cuerpo_correo, archivos_adjuntos):
+    # El número del día se reserva con escritura condicional (contador.py, el mismo
+    # que usa el outbox de masterfile.py); si el envío falla, se devuelve
+    fecha_ddmmaaaa = contador.fecha_hoy()
+    with tiempos.span("contador"):
+        version = contador.next_version(fecha_ddmmaaaa)
+    if version == 1:
+        asunto_correo = f"Masterfile Sutel Fijo y Movilidad {fecha_ddmmaaaa}"
+    else:
+        asunto_correo = f"Masterfile Sutel y Movilidad {fecha_ddmmaaaa} V{version}"
+
+    try:
+        enviar_correo_con_adjuntos(
+            asunto=asunto_correo,
+            cuerpo=cuerpo_correo + "Un saludo",
+            archivos_adjuntos=archivos_adjuntos
+        )
+    except Exception:
+        try:
+            contador.liberar_version(fecha_ddmmaaaa, version)
+        except Exception as e:
+            st.warning(f"⚠️ No se pudo liberar el número de envío V{version}: {e}")
+        raise
+    return {"fecha": fecha_ddmmaaaa, "contador": version}
 
 # ================== INTERFAZ PRINCIPAL ==================
+tiempos.iniciar_rerun()
 try:
     tab_fijo, tab_movilidad = st.tabs(["📄 Masterfile Fijo", "📄 Masterfile Movilidad"])
 
@@ -389,69 +538,57 @@ try:
     with tab_movilidad:
         df_movilidad = manejar_archivo("Movilidad", ARCHIVOS["Movilidad"])
 
+    if "guardado_clave" in st.session_state:
+        st.warning("⚠️ El último guardado quedó incompleto. Al guardar de nuevo se retoma desde donde quedó, sin repetir las subidas ya hechas.")
     if st.button("💾 Guardar nueva versión de Masterfile"):
-        timestamp = datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%Y%m%d_%H%M%S")
-        archivos_adjuntos = []
-        cuerpo_correo = f"Buen día,\n\nSe adjunta nueva versión de Masterfile con los cambios realizados el {timestamp}.\n\n"
-
-        for nombre_modo, df_modificado, nombre_archivo in [
-            ("Fijo", df_fijo, ARCHIVOS["Fijo"]),
-            ("Movilidad", df_movilidad, ARCHIVOS["Movilidad"])
-        ]:
-            df_original_stream = get_file_from_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}")
-            df_original = pd.read_excel(df_original_stream, dtype={0: str, 1: str})
-            df_original[ROWKEY] = np.arange(len(df_original)).astype(str)
-
-            cambios = detectar_cambios(df_original, df_modificado, nombre_modo)
-            if cambios:
-                filas_cambiadas = "\n" + "\n".join([f"• {c}" for c in cambios])
-            else:
-                filas_cambiadas = "Ningún cambio detectado"
-
-            cuerpo_correo += f"📌 Cambios en entorno {nombre_modo}:\n{filas_cambiadas}\n\n"
-
-            df_a_guardar = df_modificado.copy()
-            if ROWKEY in df_a_guardar.columns:
-                df_a_guardar = df_a_guardar.drop(columns=[ROWKEY])
-
-            nuevo_nombre = f"{nombre_archivo.replace('.xlsx','')}_{timestamp}.xlsx"
-            bytes_excel = BytesIO()
-            df_a_guardar.to_excel(bytes_excel, index=False)
-            bytes_excel.seek(0)
-
-            backup_folder = f"{FOLDER_PATH}/Backups/{nombre_modo}"
-            ensure_folder(backup_folder)
-            upload_file_to_sharepoint(f"{backup_folder}/{nuevo_nombre}", bytes_excel)
-
-            bytes_excel.seek(0)
-            upload_file_to_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}", bytes_excel)
-
-            bytes_excel.seek(0)
-            archivos_adjuntos.append((BytesIO(bytes_excel.getvalue()), nuevo_nombre))
-
-        fecha_ddmmaaaa, contador_actual = _leer_contador_hoy()
-        if contador_actual == 0:
-            asunto_correo = f"Masterfile Sutel Fijo y Movilidad {fecha_ddmmaaaa}"
-            siguiente_contador = 1
-        else:
-            asunto_correo = f"Masterfile Sutel y Movilidad {fecha_ddmmaaaa} V{contador_actual + 1}"
-            siguiente_contador = contador_actual + 1
-
-        try:
-            enviar_correo_con_adjuntos(
-                asunto=asunto_correo,
-                cuerpo=cuerpo_correo + "Un saludo",
-                archivos_adjuntos=archivos_adjuntos
-            )
-            _guardar_contador_hoy(fecha_ddmmaaaa, siguiente_contador)
-            st.success("📧 Correo enviado notificando la nueva versión de ambos Masterfiles.")
-        except Exception as e:
-            st.error(f"Error al enviar correo: {e}")
+        with tiempos.medicion("guardado") as med_guardado:
+            # El guardado es una transacción con bitácora de pasos (ver transaccion.py):
+            # si algo falla (p. ej. el SMTP después de subir), el reintento retoma desde
+            # el primer paso incompleto sin volver a subir ni respaldar nada
+            modificados = [("Fijo", df_fijo, ARCHIVOS["Fijo"]), ("Movilidad", df_movilidad, ARCHIVOS["Movilidad"])]
+            clave = st.session_state.setdefault("guardado_clave", transaccion.nueva_clave())
+            tx = transaccion.abrir(clave, _huella_guardado(modificados))
+            timestamp = tx.dato("timestamp", lambda: datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%Y%m%d_%H%M%S"))
+            archivos_adjuntos = []
+            cuerpo_correo = f"Buen día,\n\nSe adjunta nueva versión de Masterfile con los cambios realizados el {timestamp}.\n\n"
+
+            for nombre_modo, df_modificado, nombre_archivo in modificados:
+                cambios = tx.paso(f"preparar:{nombre_modo}", lambda: _preparar_guardado(tx, nombre_modo, df_modificado, nombre_archivo))
+                if cambios:
+                    filas_cambiadas = "\n" + "\n".join([f"• {c}" for c in cambios])
+                else:
+                    filas_cambiadas = "Ningún cambio detectado"
+
+                cuerpo_correo += f"📌 Cambios en entorno {nombre_modo}:\n{filas_cambiadas}\n\n"
+
+                nuevo_nombre = f"{nombre_archivo.replace('.xlsx','')}_{timestamp}.xlsx"
+                with open(tx.archivo(f"{nombre_modo}.xlsx"), "rb") as f:
+                    bytes_excel = BytesIO(f.read())
+
+                backup_folder = f"{FOLDER_PATH}/Backups/{nombre_modo}"
+                tx.paso(f"backup:{nombre_modo}", lambda: _subir_backup(backup_folder, f"{backup_folder}/{nuevo_nombre}", bytes_excel))
+                tx.paso(f"sobrescritura:{nombre_modo}", lambda: upload_file_to_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}", bytes_excel))
+                tx.conservar(f"publicado:{nombre_modo}", True)
+
+                archivos_adjuntos.append((bytes_excel, nuevo_nombre))
+
+            try:
+                # El contador se actualiza al reservar el número, antes de enviar: si
+                # falla, el correo no salió y el reintento repite solo este paso
+                tx.paso("correo", lambda: _enviar_correo_guardado(cuerpo_correo, archivos_adjuntos))
+                tx.terminar()
+                st.session_state.pop("guardado_clave", None)
+                # La próxima carga parte de la versión recién guardada. Mientras el
+                # guardado siga pendiente, la sesión conserva sus ediciones.
+                for nombre_modo in ARCHIVOS: st.session_state.pop(f"gestor_df_{nombre_modo}", None)
+                st.success("📧 Correo enviado notificando la nueva versión de ambos Masterfiles.")
+            except Exception as e:
+                st.error(f"Error al enviar correo: {e}. Los archivos ya quedaron guardados; al reintentar solo se completan los pasos pendientes.")
+        if med_guardado is not None: st.session_state["tiempos_guardado"] = med_guardado.resumen()
 
 except Exception as e:
     st.error(f"Error: {e}")
 
-
-
-
-
+med_rerun = tiempos.finalizar_rerun()
+if med_rerun is not None:
+    tiempos.mostrar_panel({"Último rerun": med_rerun.resumen(), "Último guardado": st.session_state.get("tiempos_guardado")})
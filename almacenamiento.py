@@ -0,0 +1,140 @@
+# ==============================================================
+# Capa de almacenamiento: una sola interfaz para los Masterfiles,
+# backups, catálogo y contador, con backends intercambiables
+# desde secrets (`almacenamiento`):
+#
+#   "graph"      Microsoft Graph (sharepoint_graph.py, por defecto)
+#   "office365"  SharePoint REST vía Office365-REST-Python-Client
+#                (almacenamiento_office365.py)
+#   "local"      un directorio local (almacenamiento_local.py):
+#                trabajo sin red y benchmarks
+#
+# Todos los backends usan rutas relativas a la raíz de la
+# biblioteca y devuelven driveItems con el formato de Graph
+# (id, name, eTag, size, lastModifiedDateTime, file/folder).
+# Los reintentos ante throttling viven aquí (reintentar) y los
+# comparten todos los backends. Las funciones opcionales de un
+# backend (upload_if_match, drive_delta) simplemente no se definen
+# si no las puede ofrecer; aquí se comprueba antes de despachar.
+# ==============================================================
+
+import time
+import tempfile
+import importlib
+import threading
+from opciones import get_secret_opcional
+
+FOLDER_PATH = "01. Documentos MedUX/Automatizacion/Masterfile"
+
+BACKENDS = {
+    "graph": "sharepoint_graph",
+    "office365": "almacenamiento_office365",
+    "local": "almacenamiento_local",
+}
+BACKEND = get_secret_opcional("almacenamiento", "graph").strip().lower()
+
+MAX_REINTENTOS_HTTP = 5
+RETRY_AFTER_MAX = 60
+DESCARGA_CHUNK = 1024 * 1024
+DESCARGA_SPOOL_MAX = int(float(get_secret_opcional("descarga_spool_max_mb", 16)) * 1024 * 1024)
+
+class DeltaExpirado(Exception):
+    # El token de cambios ya no es válido (HTTP 410 en Graph): hay que volver a empezar
+    pass
+
+class NoSoportado(Exception):
+    # El backend no ofrece la operación (p. ej. office365 sin escritura condicional atómica)
+    pass
+
+# ========= Reintentos =========
+def _espera(resp, intento):
+    try: espera = float(resp.headers.get("Retry-After", 2 ** intento))
+    except (AttributeError, ValueError): espera = 2 ** intento
+    return min(espera, RETRY_AFTER_MAX)
+
+def reintentar(llamada):
+    # Reintenta throttling (429) y no disponibilidad (503) respetando Retry-After.
+    # `llamada` devuelve una respuesta HTTP o lanza una excepción con `.response`
+    # (como las de requests y Office365-REST-Python-Client).
+    for intento in range(MAX_REINTENTOS_HTTP):
+        error = None
+        try:
+            resp = llamada()
+        except Exception as e:
+            resp, error = getattr(e, "response", None), e
+        if getattr(resp, "status_code", None) not in (429, 503) or intento == MAX_REINTENTOS_HTTP - 1:
+            if error is not None: raise error
+            return resp
+        time.sleep(_espera(resp, intento))
+
+def archivo_temporal():
+    # Destino de las descargas: en memoria hasta DESCARGA_SPOOL_MAX, en disco por encima
+    return tempfile.SpooledTemporaryFile(max_size=DESCARGA_SPOOL_MAX, prefix="masterfile-")
+
+# ========= Selección del backend =========
+_modulo = None
+_lock = threading.Lock()
+
+def backend():
+    # El módulo se importa al primer uso: cada backend lee sus propios secrets
+    global _modulo
+    with _lock:
+        if _modulo is None: _modulo = importlib.import_module(BACKENDS[BACKEND])
+        return _modulo
+
+def usar(nombre):
+    # Cambia de backend en caliente (benchmarks, pruebas sin red)
+    global BACKEND, _modulo
+    if nombre not in BACKENDS: raise ValueError(f"Backend de almacenamiento desconocido: {nombre}")
+    with _lock:
+        BACKEND, _modulo = nombre, None
+    return backend()
+
+# ========= Interfaz =========
+def get_file_from_sharepoint(path):
+    # Archivo posicionado al inicio (file-like); error si no existe
+    return backend().get_file_from_sharepoint(path)
+
+def get_file_if_exists(path):
+    # BytesIO con el contenido, o None si no existe (archivos chicos: catálogo, contador)
+    return backend().get_file_if_exists(path)
+
+def upload_file_to_sharepoint(path, file_bytes):
+    # BytesIO u objeto bytes-like; sobrescribe y devuelve el driveItem
+    return backend().upload_file_to_sharepoint(path, file_bytes)
+
+def upload_if_match(path, data, etag):
+    # Solo escribe si el archivo sigue en la versión `etag` (o no existe, con etag=None);
+    # None si otra escritura ganó la carrera. Un backend que no puede comparar y escribir
+    # de forma atómica no la define: comparar antes de subir perdería escrituras en silencio
+    return _opcional("upload_if_match", "escritura condicional")(path, data, etag)
+
+def get_item_metadata(path):
+    # driveItem (eTag = versión) o None si no existe
+    return backend().get_item_metadata(path)
+
+def ensure_folder(path):
+    return backend().ensure_folder(path)
+
+def list_children(path):
+    return backend().list_children(path)
+
+def create_sharing_link(path, link_type="view", scope="organization"):
+    return backend().create_sharing_link(path, link_type, scope)
+
+def preparar():
+    # Precalentado opcional del backend (p. ej. token y sitio/drive en Graph)
+    preparar_backend = getattr(backend(), "preparar", None)
+    if preparar_backend is not None: preparar_backend()
+
+def _opcional(nombre, descripcion):
+    funcion = getattr(backend(), nombre, None)
+    if funcion is None: raise NoSoportado(f"El backend de almacenamiento '{BACKEND}' no ofrece {descripcion}")
+    return funcion
+
+def soporta_delta():
+    return hasattr(backend(), "drive_delta")
+
+def drive_delta(delta_link=None):
+    # (driveItems cambiados, nuevo enlace/token); ver vigilancia.py
+    return _opcional("drive_delta", "consulta de cambios")(delta_link)
@@ -0,0 +1,101 @@
+# ==============================================================
+# Backend "local" de almacenamiento.py: la biblioteca es un
+# directorio (secret `almacenamiento_local_dir`). Sirve para
+# trabajar sin red y para benchmarks sin latencia de SharePoint.
+#
+# Cada escritura reemplaza el archivo de forma atómica, así que un
+# archivo abierto para lectura conserva su versión. El eTag combina
+# un id estable por ruta con el inodo y la marca de modificación.
+# ==============================================================
+
+import os
+import time
+import hashlib
+import threading
+from io import BytesIO
+from datetime import datetime, timezone
+from pathlib import Path
+from opciones import get_secret_opcional
+import tiempos
+
+RAIZ = os.path.abspath(get_secret_opcional("almacenamiento_local_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "almacenamiento_local")))
+
+# Las escrituras condicionales comparan y reemplazan bajo este lock (un proceso)
+_lock = threading.Lock()
+
+def _abs(path):
+    destino = os.path.abspath(os.path.join(RAIZ, path))
+    if os.path.commonpath([destino, RAIZ]) != RAIZ: raise ValueError(f"Ruta fuera del almacenamiento local: {path}")
+    return destino
+
+def _item(path):
+    try: info = os.stat(_abs(path))
+    except FileNotFoundError: return None
+    item_id = hashlib.sha1(path.strip("/").encode("utf-8")).hexdigest()[:32]
+    item = {
+        "id": item_id,
+        "name": os.path.basename(path.rstrip("/")),
+        "eTag": f'"{{{item_id}}},{info.st_ino}.{info.st_mtime_ns}"',
+        "lastModifiedDateTime": datetime.fromtimestamp(info.st_mtime, timezone.utc).isoformat(),
+    }
+    if os.path.isdir(_abs(path)): item["folder"] = {"childCount": len(os.listdir(_abs(path)))}
+    else: item.update({"file": {}, "size": info.st_size})
+    return item
+
+def _escribir(path, file_bytes):
+    data = memoryview(file_bytes.getbuffer() if hasattr(file_bytes, "getbuffer") else file_bytes)
+    destino = _abs(path)
+    if not os.path.isdir(os.path.dirname(destino)): raise Exception(f"Error subida {path}: no existe la carpeta")
+    tmp = f"{destino}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f: f.write(data)
+    os.replace(tmp, destino)
+    return _item(path)
+
+# ========= Interfaz (ver almacenamiento.py) =========
+def get_file_from_sharepoint(path):
+    with tiempos.span("local.descarga"):
+        try: return open(_abs(path), "rb")
+        except FileNotFoundError: raise Exception(f"Error descarga {path} — no existe")
+
+def get_file_if_exists(path):
+    with tiempos.span("local.descarga"):
+        try: return BytesIO(Path(_abs(path)).read_bytes())
+        except FileNotFoundError: return None
+
+def upload_file_to_sharepoint(path, file_bytes):
+    with tiempos.span("local.subida"), _lock:
+        return _escribir(path, file_bytes)
+
+def upload_if_match(path, data, etag):
+    with tiempos.span("local.subida"), _lock:
+        actual = _item(path)
+        if (actual["eTag"] if actual else None) != etag: return None
+        return _escribir(path, data)
+
+def get_item_metadata(path):
+    return _item(path)
+
+def ensure_folder(path):
+    os.makedirs(_abs(path), exist_ok=True)
+
+def create_sharing_link(path, link_type="view", scope="organization"):
+    return Path(_abs(path)).as_uri()
+
+def list_children(path):
+    try: nombres = sorted(os.listdir(_abs(path)))
+    except FileNotFoundError: return []
+    return [i for i in (_item(f"{path}/{n}") for n in nombres if not n.endswith(".tmp")) if i]
+
+def drive_delta(delta_link=None):
+    # El "deltaLink" es la marca de tiempo (ns) de la consulta anterior: se devuelven
+    # los archivos modificados desde entonces (los borrados no se detectan)
+    ahora = time.time_ns()
+    if delta_link is None: return [], f"local:{ahora}"
+    desde = int(delta_link.split(":", 1)[1])
+    cambiados = []
+    for carpeta, _, archivos in os.walk(RAIZ):
+        for n in archivos:
+            completo = os.path.join(carpeta, n)
+            if n.endswith(".tmp") or os.stat(completo).st_mtime_ns <= desde: continue
+            cambiados.append(_item(os.path.relpath(completo, RAIZ).replace(os.sep, "/")))
+    return [i for i in cambiados if i], f"local:{ahora}"
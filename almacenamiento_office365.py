@@ -0,0 +1,128 @@
+# ==============================================================
+# Backend "office365" de almacenamiento.py: SharePoint REST con
+# Office365-REST-Python-Client (usuario + contraseña de aplicación,
+# como acceso.py/app2.py). Las rutas son relativas a la biblioteca
+# (secret `office365_biblioteca`, la misma raíz que el drive de Graph).
+#
+# Limitaciones frente a Graph: no hay consulta de cambios (/delta),
+# así que la vigilancia queda desactivada, ni escritura condicional
+# atómica por eTag, así que el contador de envíos y el catálogo de
+# backups no se pueden actualizar con este backend. Las dos
+# funciones simplemente no existen; almacenamiento.py lo detecta.
+# ==============================================================
+
+import threading
+from io import BytesIO
+from urllib.parse import urlsplit
+from office365.sharepoint.client_context import ClientContext
+from office365.runtime.auth.user_credential import UserCredential
+from office365.runtime.client_request_exception import ClientRequestException
+from config import get_secret
+from opciones import get_secret_opcional
+from almacenamiento import archivo_temporal, reintentar
+import tiempos
+
+SITE_URL = get_secret_opcional("office365_site_url", "https://caseonit.sharepoint.com/sites/Sutel").rstrip("/")
+BIBLIOTECA = get_secret_opcional("office365_biblioteca", "Shared Documents").strip("/")
+SITE_PATH = urlsplit(SITE_URL).path.rstrip("/")
+
+_ctx = None
+_lock = threading.Lock()
+
+def _contexto():
+    global _ctx
+    with _lock:
+        if _ctx is None:
+            _ctx = ClientContext(SITE_URL).with_credentials(UserCredential(get_secret("sharepoint_user"), get_secret("app_password")))
+        return _ctx
+
+def _url(path):
+    # Ruta relativa a la biblioteca -> ruta relativa al servidor
+    return f"{SITE_PATH}/{BIBLIOTECA}/{path.strip('/')}" if path.strip("/") else f"{SITE_PATH}/{BIBLIOTECA}"
+
+def _ejecutar(consulta):
+    return reintentar(lambda: consulta.execute_query())
+
+def _no_existe(e):
+    return getattr(getattr(e, "response", None), "status_code", None) == 404
+
+def _item_archivo(p):
+    return {
+        "id": p.get("UniqueId"),
+        "name": p.get("Name"),
+        "eTag": p.get("ETag"),
+        "size": int(p.get("Length") or 0),
+        "lastModifiedDateTime": p.get("TimeLastModified"),
+        "file": {},
+    }
+
+def _item_carpeta(p):
+    return {
+        "id": p.get("UniqueId"),
+        "name": p.get("Name"),
+        "lastModifiedDateTime": p.get("TimeLastModified"),
+        "folder": {"childCount": p.get("ItemCount", 0)},
+    }
+
+# ========= Interfaz (ver almacenamiento.py) =========
+def get_file_from_sharepoint(path):
+    archivo = archivo_temporal()
+    with tiempos.span("o365.descarga"):
+        try:
+            _ejecutar(_contexto().web.get_file_by_server_relative_path(_url(path)).download(archivo))
+        except ClientRequestException as e:
+            raise Exception(f"Error descarga {path}: {e}")
+    archivo.seek(0)
+    return archivo
+
+def get_file_if_exists(path):
+    buf = BytesIO()
+    with tiempos.span("o365.descarga"):
+        try:
+            _ejecutar(_contexto().web.get_file_by_server_relative_path(_url(path)).download(buf))
+        except ClientRequestException as e:
+            if _no_existe(e): return None
+            raise
+    buf.seek(0)
+    return buf
+
+def upload_file_to_sharepoint(path, file_bytes):
+    data = file_bytes.getvalue() if hasattr(file_bytes, "getvalue") else bytes(file_bytes)
+    carpeta, _, nombre = path.strip("/").rpartition("/")
+    with tiempos.span("o365.subida"):
+        archivo = _ejecutar(_contexto().web.get_folder_by_server_relative_path(_url(carpeta)).upload_file(nombre, data))
+    return _item_archivo(archivo.properties)
+
+def get_item_metadata(path):
+    with tiempos.span("o365.metadata"):
+        try:
+            archivo = _ejecutar(_contexto().web.get_file_by_server_relative_path(_url(path)).get())
+            return _item_archivo(archivo.properties)
+        except ClientRequestException as e:
+            if not _no_existe(e): raise
+        try:
+            carpeta = _ejecutar(_contexto().web.get_folder_by_server_relative_path(_url(path)).get())
+            return _item_carpeta(carpeta.properties)
+        except ClientRequestException as e:
+            if _no_existe(e): return None
+            raise
+
+def ensure_folder(path):
+    with tiempos.span("o365.carpetas"):
+        _ejecutar(_contexto().web.ensure_folder_path(f"{BIBLIOTECA}/{path.strip('/')}"))
+
+def create_sharing_link(path, link_type="view", scope="organization"):
+    url = "{0.scheme}://{0.netloc}".format(urlsplit(SITE_URL)) + _url(path)
+    with tiempos.span("o365.enlace"):
+        return _ejecutar(_contexto().web.create_organization_sharing_link(url, is_edit_link=link_type == "edit")).value
+
+def list_children(path):
+    carpeta = _contexto().web.get_folder_by_server_relative_path(_url(path))
+    with tiempos.span("o365.listado"):
+        try:
+            archivos = _ejecutar(carpeta.files.get())
+            subcarpetas = _ejecutar(carpeta.folders.get())
+        except ClientRequestException as e:
+            if _no_existe(e): return []
+            raise
+    return [_item_carpeta(c.properties) for c in subcarpetas] + [_item_archivo(a.properties) for a in archivos]
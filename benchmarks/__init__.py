@@ -0,0 +1,4 @@
+# ==============================================================
+# Benchmarks de los caminos críticos de la app de Masterfiles
+#   python -m benchmarks --filas 5000 --salida resultados.json
+# ==============================================================
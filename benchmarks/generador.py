@@ -0,0 +1,70 @@
+# ==============================================================
+# Generador de Masterfiles sintéticos (Fijo / Movilidad)
+# ==============================================================
+
+import numpy as np
+import pandas as pd
+from io import BytesIO
+
+PROVINCIAS = ["San José", "Alajuela", "Cartago", "Heredia", "Guanacaste", "Puntarenas", "Limón"]
+ISPS = ["ICE", "Liberty", "Telecable", "Tigo", "Claro", "Cabletica"]
+OPERADORES = ["Kölbi", "Liberty", "Claro"]
+TECNOLOGIAS = ["FTTH", "HFC", "xDSL", "Inalámbrico"]
+ESTADOS = ["Activa", "Inactiva", "En revisión", "Retirada"]
+NOMBRES = ["Ana", "Luis", "María", "José", "Carla", "Diego", "Sofía", "Andrés", "Valeria", "Jorge"]
+APELLIDOS = ["Rodríguez", "Jiménez", "Mora", "Vargas", "Rojas", "Solís", "Castro", "Araya", "Chaves", "Quesada"]
+
+def _categoria(rng, base, filas, cardinalidad):
+    # Usa la lista real y la completa con valores sintéticos hasta la cardinalidad pedida
+    valores = list(base) + [f"{base[0]} {k}" for k in range(max(0, cardinalidad - len(base)))]
+    return rng.choice(valores[:max(cardinalidad, 1)], size=filas)
+
+def generar_masterfile(modo, filas, columnas_extra=0, cardinalidad=50, semilla=0):
+    rng = np.random.default_rng(semilla)
+    datos = {"ID SONDA": np.arange(100000, 100000 + filas)}
+    if modo == "Fijo":
+        datos["Stm"] = [f"STM-{i:05d}" for i in range(filas)]
+        datos["PROVINCIA"] = rng.choice(PROVINCIAS, size=filas)
+        datos["ISP"] = _categoria(rng, ISPS, filas, cardinalidad)
+        datos["TECNOLOGIA"] = rng.choice(TECNOLOGIAS, size=filas)
+        datos["VELOCIDAD BAJADA"] = rng.choice([10, 20, 50, 100, 200, 500, 1000], size=filas)
+        datos["VELOCIDAD SUBIDA"] = rng.choice([2, 5, 10, 50, 100, 500], size=filas)
+        datos["LATITUD"] = rng.uniform(8.0, 11.2, size=filas).round(6)
+        datos["LONGITUD"] = rng.uniform(-86.0, -82.5, size=filas).round(6)
+    else:
+        datos["NOMBRE PANELISTA"] = [f"{a} {b}" for a, b in zip(rng.choice(NOMBRES, size=filas), rng.choice(APELLIDOS, size=filas))]
+        datos["OPERADOR"] = rng.choice(OPERADORES, size=filas)
+        datos["PROVINCIA"] = rng.choice(PROVINCIAS, size=filas)
+        datos["MODELO"] = _categoria(rng, ["Galaxy A54", "iPhone 13", "Redmi Note 12"], filas, cardinalidad)
+        datos["IMEI"] = [str(x) for x in rng.integers(10**14, 10**15, size=filas)]
+    datos["ESTADO"] = rng.choice(ESTADOS, size=filas)
+    datos["FECHA INSTALACION"] = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 900, size=filas), unit="D")
+    for k in range(columnas_extra):
+        datos[f"CAMPO {k + 1}"] = _categoria(rng, [f"Valor {k + 1}"], filas, cardinalidad)
+    df = pd.DataFrame(datos)
+    # Algunas celdas vacías, como en los archivos reales
+    vacias = rng.random(filas) < 0.05
+    df.loc[vacias, "ESTADO"] = np.nan
+    return df
+
+def generar_ediciones(df, tasa_edicion, semilla=1):
+    # Copia de `df` con una fracción `tasa_edicion` de celdas editables modificadas
+    rng = np.random.default_rng(semilla)
+    editado = df.copy()
+    columnas = [c for c in df.columns if c not in ("ID SONDA", "_row_id")]
+    n = int(round(tasa_edicion * len(df) * len(columnas)))
+    filas = rng.integers(0, len(df), size=n)
+    cols = rng.integers(0, len(columnas), size=n)
+    for f, c in zip(filas, cols):
+        col = columnas[c]
+        actual = editado.iat[f, editado.columns.get_loc(col)]
+        if pd.api.types.is_numeric_dtype(editado[col]) and not pd.isna(actual):
+            editado.iat[f, editado.columns.get_loc(col)] = actual + 1
+        elif not pd.api.types.is_datetime64_any_dtype(editado[col]):
+            editado.iat[f, editado.columns.get_loc(col)] = f"editado {f}"
+    return editado
+
+def a_excel(df):
+    buf = BytesIO()
+    df.to_excel(buf, index=False)
+    return buf.getvalue()
@@ -0,0 +1,176 @@
+# ==============================================================
+# Suite de benchmarks: carga, filtros, detección de cambios (app y
+# Gestor), to_excel y pipeline de guardado completo contra el
+# stand-in local de Graph o el backend de directorio local
+# (--almacenamiento). Emite JSON para comparar entre corridas.
+# ==============================================================
+
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+from io import BytesIO
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path: sys.path.insert(0, RAIZ)
+
+from benchmarks.generador import generar_masterfile, generar_ediciones, a_excel
+from cambios import ROWKEY, asignar_rowkey, detectar_cambios
+from filtros import opciones_filtro, aplicar_filtros
+from graph_local import GraphMemoria
+from almacenamiento import FOLDER_PATH
+import almacenamiento
+import esquema
+import carga
+import correo
+import guardado
+
+SCRIPT_GESTOR = os.path.join(RAIZ, "Gestor_MF_Fijo_Movilidad_versio_envio.py")
+NOMBRES_GESTOR = ["ROWKEY", "ID_COL", "PHANTOM_PATTERNS", "drop_phantom_cols", "normalize_df_for_compare", "detectar_cambios"]
+ARCHIVOS = {"Fijo": "MasterfileSutel.xlsx", "Movilidad": "MasterfileSutel_Movilidad.xlsx"}
+
+def cargar_funciones_script(ruta, nombres):
+    # Los scripts de Streamlit ejecutan la UI al importarse: se extraen solo las
+    # definiciones pedidas (funciones y constantes) y se ejecutan aisladas.
+    with open(ruta, encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), filename=ruta)
+    nodos = [
+        n for n in arbol.body
+        if (isinstance(n, ast.FunctionDef) and n.name in nombres)
+        or (isinstance(n, ast.Assign) and all(isinstance(t, ast.Name) and t.id in nombres for t in n.targets))
+    ]
+    ns = {"pd": pd, "np": np}
+    exec(compile(ast.Module(nodos, type_ignores=[]), ruta, "exec"), ns)
+    return ns
+
+def medir(fn, repeticiones, preparar=None):
+    tiempos = []
+    for _ in range(repeticiones):
+        args = preparar() if preparar else ()
+        t0 = time.perf_counter()
+        fn(*args)
+        tiempos.append(time.perf_counter() - t0)
+    return {
+        "repeticiones": repeticiones,
+        "min_s": min(tiempos),
+        "mediana_s": statistics.median(tiempos),
+        "media_s": statistics.fmean(tiempos),
+    }
+
+def _instalar_graph_local(graph):
+    sharepoint_graph = almacenamiento.usar("graph")
+    sharepoint_graph._http = graph
+    sharepoint_graph.get_access_token_cached = lambda: "token-local"
+    return graph.escribir
+
+def _instalar_directorio_local(raiz):
+    almacenamiento.usar("local").RAIZ = raiz
+    def escribir(ruta, datos):
+        destino = os.path.join(raiz, ruta)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, "wb") as f: f.write(datos)
+    return escribir
+
+def _instalar_correo_simulado():
+    # El correo solo se arma (MIME + adjuntos); no se escribe outbox ni se envía.
+    # Devuelve un id de trabajo, como encolar_correo (queda en la bitácora del guardado)
+    def encolar(asunto, cuerpo, adjuntos, versionar=True):
+        return f"simulado_{len(correo.construir_mensaje(cuerpo, adjuntos).as_bytes())}"
+    correo.encolar_correo = encolar
+
+def ejecutar(filas=2000, columnas_extra=10, cardinalidad=50, tasa_edicion=0.01, repeticiones=3, semilla=0, backend="graph-local"):
+    gestor = cargar_funciones_script(SCRIPT_GESTOR, NOMBRES_GESTOR)
+    resultados = {}
+    xlsx = {}
+    modificados = []
+
+    for modo, n_arc in ARCHIVOS.items():
+        df_gen = generar_masterfile(modo, filas, columnas_extra, cardinalidad, semilla)
+        xlsx[modo] = a_excel(df_gen)
+
+        df_raw = pd.read_excel(BytesIO(xlsx[modo]))
+        tipos = esquema.inferir_esquema(df_raw, modo)
+        numeros = esquema.numeros_originales(df_raw, tipos, modo)
+        df = asignar_rowkey(esquema.tipar(df_raw, tipos))
+        df_mod = generar_ediciones(df, tasa_edicion, semilla + 1)
+        modificados.append((modo, df_mod, n_arc))
+
+        cols_filtro = [c for c in df.columns if tipos.get(c) == "texto"][:3]
+        filtros = {c: opciones_filtro(df, c)[::2] for c in cols_filtro}
+
+        # Versiones "crudas" como las lee el Gestor (primeras dos columnas como texto)
+        g_orig = pd.read_excel(BytesIO(xlsx[modo]), dtype={0: str, 1: str})
+        g_orig[ROWKEY] = np.arange(len(g_orig)).astype(str)
+        g_mod = esquema.para_guardar(df_mod, numeros).astype(object)
+        g_mod[ROWKEY] = df_mod[ROWKEY].to_numpy()
+
+        resultados[f"{modo}.read_excel"] = medir(lambda: pd.read_excel(BytesIO(xlsx[modo])), repeticiones)
+        resultados[f"{modo}.tipar"] = medir(lambda: esquema.tipar(df_raw, esquema.inferir_esquema(df_raw, modo)), repeticiones)
+        resultados[f"{modo}.filtros"] = medir(lambda: aplicar_filtros(df, filtros), repeticiones)
+        resultados[f"{modo}.detectar_cambios.masterfile"] = medir(lambda: detectar_cambios(df, df_mod, modo), repeticiones)
+        resultados[f"{modo}.detectar_cambios.gestor"] = medir(lambda: gestor["detectar_cambios"](g_orig, g_mod, modo), repeticiones)
+        resultados[f"{modo}.to_excel"] = medir(lambda: esquema.para_guardar(df_mod, numeros).to_excel(BytesIO(), index=False), repeticiones)
+
+    # Pipeline de guardado completo contra el stand-in local de Graph o un directorio local
+    graph = GraphMemoria() if backend == "graph-local" else None
+    escribir = _instalar_graph_local(graph) if graph is not None else _instalar_directorio_local(tempfile.mkdtemp(prefix="bench-almacenamiento-"))
+    _instalar_correo_simulado()
+
+    def preparar_guardado():
+        for modo, n_arc in ARCHIVOS.items():
+            escribir(f"{FOLDER_PATH}/{n_arc}", xlsx[modo])
+        carga._cargar_version.clear()
+        return ()
+
+    resultados["guardado.pipeline"] = medir(lambda: guardado.guardar_masterfiles(modificados), repeticiones, preparar_guardado)
+    llamadas = {f"{m} {op}": n for (m, op), n in sorted(graph.llamadas.items())} if graph is not None else {}
+
+    return {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "filas": filas,
+            "columnas_extra": columnas_extra,
+            "cardinalidad": cardinalidad,
+            "tasa_edicion": tasa_edicion,
+            "semilla": semilla,
+            "almacenamiento": backend,
+            "bytes_xlsx": {m: len(b) for m, b in xlsx.items()},
+            "llamadas_graph_guardado": llamadas,
+        },
+        "resultados": resultados,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la app de Masterfiles (salida JSON)")
+    parser.add_argument("--filas", type=int, default=2000)
+    parser.add_argument("--columnas-extra", type=int, default=10)
+    parser.add_argument("--cardinalidad", type=int, default=50)
+    parser.add_argument("--tasa-edicion", type=float, default=0.01)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--almacenamiento", choices=["graph-local", "local"], default="graph-local",
+                        help="Backend del pipeline de guardado: stand-in de Graph en memoria o directorio temporal")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, stdout)")
+    args = parser.parse_args(argv)
+
+    reporte = ejecutar(args.filas, args.columnas_extra, args.cardinalidad, args.tasa_edicion, args.repeticiones, args.semilla, args.almacenamiento)
+    texto = json.dumps(reporte, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+if __name__ == "__main__":
+    main()
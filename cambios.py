@@ -0,0 +1,94 @@
+# ==============================================================
+# Detección de cambios entre versiones de un Masterfile
+# ==============================================================
+
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from registro import masterfile
+
+ID_COL = "ID SONDA"
+ROWKEY = "_row_id"
+
+def asignar_rowkey(df):
+    # dtype object explícito: con pandas 3 un array de str se infiere como StringDtype,
+    # que Arrow serializa como LargeUtf8 (el problema original con AgGrid)
+    df[ROWKEY] = pd.Series(np.arange(len(df)).astype(str), index=df.index, dtype=object)
+    return df
+
+COLUMNAS_CAMBIOS = [ROWKEY, "identificador", "columna", "anterior", "nuevo"]
+
+def normalize_val(v):
+    if v is None or (not isinstance(v, str) and pd.isna(v)): return ""
+    return str(v).strip()
+
+def _normalizar_df(df):
+    # Equivalente vectorizado de normalize_val aplicado a todo el DataFrame
+    return df.astype(object).fillna("").astype(str).apply(lambda s: s.str.strip())
+
+def conjunto_cambios(df_orig, df_mod, tipo):
+    # Una fila por celda modificada: (row_id, identificador, columna, anterior, nuevo),
+    # con los valores normalizados a texto. Fila a fila y columna a columna, en el
+    # orden del original; cada fila se identifica por la columna declarada en el
+    # registro (p. ej. Stm) o por su clave.
+    mf = masterfile(tipo)
+    clave, identificador = mf["clave"], mf["identificador"]
+    df_o = df_orig.set_index(ROWKEY)
+    df_m = df_mod.set_index(ROWKEY)
+
+    comunes = df_o.index.intersection(df_m.index)
+    cols = [c for c in df_o.columns if c in df_m.columns]
+    if len(comunes) == 0 or not cols: return pd.DataFrame(columns=COLUMNAS_CAMBIOS)
+
+    o = _normalizar_df(df_o.loc[comunes, cols]).to_numpy()
+    m = _normalizar_df(df_m.loc[comunes, cols]).to_numpy()
+    filas, columnas = np.nonzero(o != m)
+
+    if identificador and identificador in df_o.columns: ident = identificador + " " + df_o.loc[comunes, identificador].astype(object).astype(str)
+    elif clave in df_o.columns: ident = "ID " + df_o.loc[comunes, clave].astype(object).astype(str)
+    else: ident = "Fila " + comunes.astype(str)
+    return pd.DataFrame({
+        ROWKEY: comunes.to_numpy()[filas],
+        "identificador": np.asarray(ident, dtype=object)[filas],
+        "columna": np.asarray(cols, dtype=object)[columnas],
+        "anterior": o[filas, columnas],
+        "nuevo": m[filas, columnas],
+    }, columns=COLUMNAS_CAMBIOS)
+
+def lineas_cambios(conjunto):
+    # Formato de una línea por cambio (correo, historial, vista previa de parches)
+    return [f"{i}: {c} de '{a}' → '{b}'" for i, c, a, b in
+            zip(conjunto["identificador"], conjunto["columna"], conjunto["anterior"], conjunto["nuevo"])]
+
+def detectar_cambios(df_orig, df_mod, tipo):
+    return lineas_cambios(conjunto_cambios(df_orig, df_mod, tipo))
+
+def componer_cambios(previos, nuevos):
+    # Dos conjuntos de cambios consecutivos (versión A -> B y B -> C) como uno solo,
+    # A -> C: una celda editada en ambos va del valor de A al de C, y desaparece si
+    # volvió a su valor original
+    if previos.empty: return nuevos
+    if nuevos.empty: return previos
+    todos = pd.concat([previos, nuevos], ignore_index=True)
+    out = todos.groupby([ROWKEY, "columna"], sort=False).agg(
+        identificador=("identificador", "first"), anterior=("anterior", "first"), nuevo=("nuevo", "last")).reset_index()
+    return out.loc[out["anterior"] != out["nuevo"], COLUMNAS_CAMBIOS].reset_index(drop=True)
+
+def filas_modificadas(df_mod, conjunto):
+    # Filas (versión modificada) que tienen al menos una celda en el conjunto de cambios
+    return df_mod[df_mod[ROWKEY].isin(conjunto[ROWKEY])].drop(columns=[ROWKEY]).reset_index(drop=True)
+
+def huella(df):
+    # Resumen del contenido tal como lo compara el diff (valores normalizados a texto):
+    # dos DataFrames con los mismos datos dan la misma huella aunque cambie el dtype
+    h = hashlib.sha256("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(_normalizar_df(df), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def huella_deltas(deltas_por_modo):
+    # Huella de las ediciones de la sesión ({modo: {row_id: {columna: valor}}}). A
+    # diferencia de huella(df), no cambia cuando la base pasa a ser la versión recién
+    # guardada (que ya pasó por esquema.para_guardar)
+    texto = json.dumps(deltas_por_modo, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
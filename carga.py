@@ -0,0 +1,251 @@
+# ==============================================================
+# Carga de Masterfiles desde SharePoint
+# Cada versión (ruta + eTag) se descarga, parsea y tipa una sola vez
+# por proceso; en los reruns siguientes basta con consultar el eTag.
+# La versión base es compartida por todas las sesiones y de solo
+# lectura: cada sesión guarda únicamente sus ediciones (deltas),
+# por clave de fila, y arma su vista con con_deltas().
+# ==============================================================
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import streamlit as st
+from opciones import get_secret_opcional, opcion_activa
+from almacenamiento import FOLDER_PATH, get_file_from_sharepoint, get_item_metadata
+import almacenamiento
+from cambios import ROWKEY, asignar_rowkey
+from registro import masterfile
+import esquema
+import libro
+import tiempos
+
+PRECALENTAR = opcion_activa("precalentar", True)
+MAX_HILOS_CARGA = int(get_secret_opcional("max_hilos_carga", 4))
+
+log = logging.getLogger(__name__)
+
+class ArchivoDescargado:
+    # Libro original de una versión tal como se descargó (archivo temporal en
+    # memoria o en disco, ver get_file_from_sharepoint). Lo comparten las
+    # sesiones, así que cada lectura reposiciona el archivo bajo un lock.
+    def __init__(self, archivo):
+        self._archivo = archivo
+        self._lock = threading.Lock()
+        self._hojas = None
+
+    @contextmanager
+    def abierto(self):
+        # El archivo al inicio, de uso exclusivo mientras dure el bloque
+        with self._lock:
+            self._archivo.seek(0)
+            yield self._archivo
+
+    def hojas(self):
+        # Nombres de las hojas (solo lee xl/workbook.xml; ver libro.py)
+        if self._hojas is None:
+            with self.abierto() as f: self._hojas = libro.hojas(f)
+        return self._hojas
+
+    def leer_excel(self, hoja=0):
+        with self.abierto() as f: return pd.read_excel(f, sheet_name=hoja)
+
+    def leer(self):
+        # bytes completos: solo al pedir la descarga (st.download_button diferido)
+        with self.abierto() as f: return f.read()
+
+# cache_resource y no cache_data: cache_data entrega una copia deserializada
+# a cada llamada (un DataFrame completo por sesión y por rerun)
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _cargar_version(path, modo, etag):
+    contenido = ArchivoDescargado(get_file_from_sharepoint(path))
+    with tiempos.span("read_excel"):
+        df = contenido.leer_excel()
+    with tiempos.span("tipado"):
+        tipos = esquema.inferir_esquema(df, modo)
+        numeros = esquema.numeros_originales(df, tipos, modo)
+        df = esquema.tipar(df, tipos)
+        esquema.validar_arrow(df, tipos)
+    asignar_rowkey(df)
+    return contenido, df, tipos, numeros
+
+# Las demás hojas del libro se parsean solo cuando alguien las abre
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _cargar_hoja(path, modo, etag, hoja):
+    contenido, _, _, _ = _cargar_version(path, modo, etag)
+    with tiempos.span("read_excel"):
+        df = contenido.leer_excel(hoja)
+    with tiempos.span("tipado"):
+        return esquema.tipar(df, esquema.inferir_esquema(df, None))
+
+def claves_filas(df, modo):
+    # Clave estable de cada fila: la columna clave del registro (p. ej. ID SONDA) como
+    # texto. Otra sesión puede insertar o borrar filas y la posición (ROWKEY) deja de
+    # señalar la misma fila; la clave no. Sin columna clave única se usa ROWKEY.
+    clave = masterfile(modo)["clave"]
+    if clave in df.columns:
+        claves = pd.Index(esquema.tipar(df[[clave]], {clave: "texto"})[clave], dtype=object)
+        if claves.is_unique and not (claves == "").any(): return claves
+    return pd.Index(df[ROWKEY], dtype=object)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _claves_version(path, modo, etag):
+    _, df, _, _ = _cargar_version(path, modo, etag)
+    return claves_filas(df, modo)
+
+def claves_masterfile(modo, nombre_archivo, etag):
+    # Claves de fila de la versión de cargar_masterfile, alineadas por posición con su DataFrame
+    return _claves_version(f"{FOLDER_PATH}/{nombre_archivo}", modo, etag)
+
+def numeros_masterfile(modo, nombre_archivo, etag):
+    # Celdas que eran números en el archivo, para esquema.para_guardar (ver numeros_originales)
+    return _cargar_version(f"{FOLDER_PATH}/{nombre_archivo}", modo, etag)[3]
+
+def cargar_hoja(modo, nombre_archivo, etag, hoja):
+    # Hoja adicional del libro (solo lectura), de la misma versión que cargar_masterfile
+    return _cargar_hoja(f"{FOLDER_PATH}/{nombre_archivo}", modo, etag, hoja)
+
+def cargar_masterfile(modo, nombre_archivo):
+    # Devuelve (ArchivoDescargado con el libro original, DataFrame tipado con ROWKEY, tipos por columna, eTag).
+    # El DataFrame es el compartido del proceso: no se modifica (ver con_deltas).
+    # Con la vigilancia de cambios activa (vigilancia.py) el eTag sale del mapa
+    # local de versiones, sin consultar a Graph en cada rerun.
+    path = f"{FOLDER_PATH}/{nombre_archivo}"
+    etag = _etag_confirmado(path)
+    if etag is None:
+        momento = time.monotonic()
+        item = get_item_metadata(path)
+        if item is None: raise Exception(f"No existe {path}")
+        etag = item["eTag"]
+        _registrar_vigente(path, modo, etag, item.get("id"), momento)
+    contenido, df, tipos, _ = _cargar_version(path, modo, etag)
+    return contenido, df, tipos, etag
+
+# ========= Vista de cada sesión =========
+def con_deltas(df, deltas, claves):
+    # deltas: {clave de fila: {columna: valor}}; claves: claves_masterfile de la base.
+    # Copia superficial de la base con las ediciones aplicadas: solo se duplican
+    # las columnas editadas, el resto sigue apuntando a los datos compartidos.
+    # Las filas que ya no existen en la base se ignoran (ver descartar_huerfanas).
+    if not deltas: return df
+    posiciones = claves.get_indexer(list(deltas))
+    por_columna = {}
+    for i, cols in zip(posiciones, deltas.values()):
+        if i < 0: continue
+        for c, v in cols.items():
+            if c in df.columns: por_columna.setdefault(c, {})[i] = v
+    out = df.copy(deep=False)
+    for c, valores in por_columna.items():
+        serie = df[c].copy()
+        serie.iloc[list(valores)] = list(valores.values())
+        out[c] = serie
+    return out
+
+def descartar_huerfanas(deltas, claves):
+    # Quita (y devuelve) las ediciones de filas cuya clave ya no existe en la base,
+    # p. ej. porque otra sesión las borró
+    huerfanas = [k for k, i in zip(list(deltas), claves.get_indexer(list(deltas))) if i < 0] if deltas else []
+    for k in huerfanas: del deltas[k]
+    return huerfanas
+
+# ========= Versión vigente e invalidación =========
+# path -> {"modo", "etag", "id", "momento"} de la última versión vista o publicada
+# en este proceso; `momento` (time.monotonic) es cuándo se consultó
+_vigentes = {}
+_lock_vigentes = threading.Lock()
+# La vigilancia fija desde cuándo sigue los cambios y hasta cuándo vale su última consulta
+_vigilancia = {"desde": None, "hasta": 0.0}
+
+def _registrar_vigente(path, modo, etag, item_id=None, momento=None):
+    # Si la versión cambió (otra sesión u otro proceso guardó), la anterior
+    # deja de servirse y se libera de la caché compartida
+    with _lock_vigentes:
+        anterior = _vigentes.get(path)
+        _vigentes[path] = {
+            "modo": modo, "etag": etag,
+            "id": item_id or (anterior or {}).get("id"),
+            "momento": time.monotonic() if momento is None else momento,
+        }
+    if anterior is not None and anterior["etag"] != etag:
+        _liberar_version(path, anterior["modo"], anterior["etag"])
+
+def _liberar_version(path, modo, etag):
+    _cargar_version.clear(path, modo, etag)
+    _claves_version.clear(path, modo, etag)
+
+def _etag_confirmado(path):
+    # Solo se confía en el mapa si la vigilancia está al día y ya seguía los
+    # cambios cuando se registró esa versión
+    with _lock_vigentes:
+        v = _vigentes.get(path)
+        desde, hasta = _vigilancia["desde"], _vigilancia["hasta"]
+    if v is None or desde is None or v["momento"] < desde or time.monotonic() > hasta: return None
+    return v["etag"]
+
+def etag_vigente(nombre_archivo):
+    v = _vigentes.get(f"{FOLDER_PATH}/{nombre_archivo}")
+    return v["etag"] if v else None
+
+def publicar(modo, nombre_archivo, etag, item_id=None):
+    # Lo llama el guardado tras sobrescribir un Masterfile: todas las sesiones
+    # del proceso pasan a la nueva versión en su siguiente rerun
+    _registrar_vigente(f"{FOLDER_PATH}/{nombre_archivo}", modo, etag, item_id)
+
+def aplicar_cambios_remotos(items, momento):
+    # driveItems devueltos por /delta: actualiza las versiones conocidas (por id)
+    # y devuelve los paths de Masterfile que cambiaron
+    with _lock_vigentes:
+        por_id = {v["id"]: path for path, v in _vigentes.items() if v["id"]}
+    cambiados = []
+    for item in items:
+        path = por_id.get(item.get("id"))
+        if path is None: continue
+        v = _vigentes[path]
+        if "deleted" in item:
+            with _lock_vigentes: _vigentes.pop(path, None)
+            _liberar_version(path, v["modo"], v["etag"])
+            cambiados.append(path)
+        elif item.get("eTag") and item["eTag"] != v["etag"]:
+            _registrar_vigente(path, v["modo"], item["eTag"], item["id"], momento)
+            cambiados.append(path)
+    return cambiados
+
+def confirmar_vigilancia(desde, hasta):
+    # desde: momento en que empezó el seguimiento actual (None lo desactiva);
+    # hasta: límite de validez de la última consulta
+    with _lock_vigentes:
+        _vigilancia["desde"], _vigilancia["hasta"] = desde, hasta
+
+def cargar_varios(archivos):
+    # {modo: nombre_archivo} -> {modo: resultado de cargar_masterfile}; descarga y
+    # parseo en paralelo (la red y read_excel dominan, no el GIL del script)
+    if len(archivos) <= 1:
+        return {modo: cargar_masterfile(modo, n) for modo, n in archivos.items()}
+    with tiempos.span("carga.paralela"), ThreadPoolExecutor(min(len(archivos), MAX_HILOS_CARGA), thread_name_prefix="carga") as pool:
+        futuros = {modo: pool.submit(tiempos.propagar(cargar_masterfile), modo, n) for modo, n in archivos.items()}
+        return {modo: f.result() for modo, f in futuros.items()}
+
+# ========= Precalentado en segundo plano =========
+_precalentado = None
+_lock_precalentado = threading.Lock()
+
+def _precalentar(archivos):
+    # Token, sitio/drive y los Masterfiles quedan en la caché compartida del proceso;
+    # si un rerun pide lo mismo mientras tanto, espera a este cálculo en vez de repetirlo
+    try:
+        almacenamiento.preparar()
+        cargar_varios(archivos)
+    except Exception:
+        log.exception("Falló el precalentado de Masterfiles")
+
+def precalentar(archivos):
+    # Una sola vez por proceso, al primer rerun; no bloquea el render
+    global _precalentado
+    if not PRECALENTAR: return
+    with _lock_precalentado:
+        if _precalentado is None:
+            _precalentado = threading.Thread(target=_precalentar, args=(dict(archivos),), name="precalentado-masterfiles", daemon=True)
+            _precalentado.start()
@@ -0,0 +1,117 @@
+# ==============================================================
+# Catálogo de backups del Masterfile
+# Índice JSON en la carpeta Backups: una sola lectura para listar
+# versiones y comparar cualquier par sin recorrer la carpeta.
+# Las escrituras son condicionales por eTag (como contador.py): si
+# otra sesión actualizó el índice entre la lectura y la subida, se
+# relee y se vuelve a aplicar el cambio.
+# ==============================================================
+
+import streamlit as st
+import pandas as pd
+import json
+import re
+import time
+import random
+from almacenamiento import (
+    FOLDER_PATH, get_file_from_sharepoint, get_file_if_exists,
+    get_item_metadata, upload_if_match, ensure_folder, list_children,
+)
+from cambios import asignar_rowkey, conjunto_cambios, lineas_cambios
+from registro import masterfile
+import esquema
+
+BACKUPS_PATH = f"{FOLDER_PATH}/Backups"
+CATALOGO_PATH = f"{BACKUPS_PATH}/catalogo_backups.json"
+MAX_MUESTRA_CAMBIOS = 5
+MAX_REINTENTOS = 8
+
+_RE_TIMESTAMP = re.compile(r"_(\d{8}_\d{6})\.xlsx$")
+
+# ========= Lectura / escritura del índice =========
+def _leer_catalogo_remoto():
+    # (entradas, eTag); eTag None si el índice todavía no existe. La metadata se lee
+    # antes que el contenido: si cambia en medio, la subida condicional falla y se relee
+    item = get_item_metadata(CATALOGO_PATH)
+    if item is None: return [], None
+    stream = get_file_if_exists(CATALOGO_PATH)
+    entradas = json.loads(stream.getvalue().decode("utf-8")).get("backups", []) if stream is not None else []
+    return entradas, item["eTag"]
+
+def _actualizar_catalogo(modificar):
+    # modificar(entradas) -> entradas a guardar; se reaplica sobre el índice releído
+    # cada vez que otra sesión escribió primero
+    ensure_folder(BACKUPS_PATH)
+    for intento in range(MAX_REINTENTOS):
+        entradas, etag = _leer_catalogo_remoto()
+        nuevas = sorted(modificar(entradas), key=lambda e: (e["modo"], e["timestamp"]))
+        contenido = json.dumps({"version": 1, "backups": nuevas}, ensure_ascii=False, indent=1)
+        if upload_if_match(CATALOGO_PATH, contenido.encode("utf-8"), etag) is not None:
+            leer_catalogo.clear()
+            return nuevas
+        time.sleep(random.uniform(0, 0.2 * 2 ** intento))
+    raise Exception(f"No se pudo actualizar {CATALOGO_PATH}: demasiados conflictos de escritura")
+
+@st.cache_data(ttl=300)
+def leer_catalogo():
+    return _leer_catalogo_remoto()[0]
+
+def entrada_backup(modo, archivo, ruta, timestamp, item, filas, cambios):
+    # cambios: conjunto de cambios (DataFrame); el índice guarda el total y una muestra
+    return {
+        "modo": modo,
+        "archivo": archivo,
+        "ruta": ruta,
+        "timestamp": timestamp,
+        "size": (item or {}).get("size"),
+        "eTag": (item or {}).get("eTag"),
+        "filas": filas,
+        "n_cambios": len(cambios),
+        "muestra_cambios": lineas_cambios(cambios.head(MAX_MUESTRA_CAMBIOS)),
+    }
+
+def registrar_backups(nuevas):
+    if not nuevas: return
+    rutas = {e["ruta"] for e in nuevas}
+    _actualizar_catalogo(lambda entradas: [e for e in entradas if e["ruta"] not in rutas] + list(nuevas))
+
+def reconstruir_catalogo(archivos):
+    # Migración: indexa backups existentes que aún no están en el catálogo.
+    # Es la única operación que recorre las carpetas de Backups (una sola vez:
+    # los reintentos solo vuelven a combinar con el índice releído).
+    encontradas = []
+    for modo, archivo in archivos.items():
+        carpeta = f"{FOLDER_PATH}/{masterfile(modo)['backups']}"
+        for item in list_children(carpeta):
+            m = _RE_TIMESTAMP.search(item["name"])
+            if "file" not in item or m is None: continue
+            encontradas.append({
+                "modo": modo, "archivo": archivo, "ruta": f"{carpeta}/{item['name']}", "timestamp": m.group(1),
+                "size": item.get("size"), "eTag": item.get("eTag"),
+                "filas": None, "n_cambios": None, "muestra_cambios": [],
+            })
+    agregadas = []
+    def combinar(entradas):
+        conocidas = {e["ruta"] for e in entradas}
+        agregadas[:] = [e for e in encontradas if e["ruta"] not in conocidas]
+        return entradas + agregadas
+    _actualizar_catalogo(combinar)
+    return len(agregadas)
+
+def versiones(modo):
+    return sorted((e for e in leer_catalogo() if e["modo"] == modo), key=lambda e: e["timestamp"], reverse=True)
+
+# ========= Snapshots y comparación =========
+@st.cache_data(max_entries=8, show_spinner=False)
+def cargar_snapshot(ruta, modo, etag=None):
+    # Los backups son inmutables: (ruta, eTag) identifica el contenido
+    with get_file_from_sharepoint(ruta) as archivo:
+        df = pd.read_excel(archivo)
+    df = esquema.tipar(df, esquema.inferir_esquema(df, modo))
+    asignar_rowkey(df)
+    return df
+
+def comparar_versiones(entrada_base, entrada_nueva):
+    df_a = cargar_snapshot(entrada_base["ruta"], entrada_base["modo"], entrada_base.get("eTag"))
+    df_b = cargar_snapshot(entrada_nueva["ruta"], entrada_nueva["modo"], entrada_nueva.get("eTag"))
+    return conjunto_cambios(df_a, df_b, entrada_nueva["modo"])
@@ -0,0 +1,67 @@
+# ==============================================================
+# Contador diario de envíos (versión del asunto del correo)
+# Escrituras condicionales por eTag: dos personas guardando a la vez
+# nunca obtienen el mismo número. El último valor y su eTag se
+# mantienen en memoria, así que en el caso normal cada envío cuesta
+# una sola subida (sin descarga previa).
+# ==============================================================
+
+import time
+import random
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from almacenamiento import FOLDER_PATH, get_file_if_exists, get_item_metadata, upload_if_match
+
+CONTADOR_PATH = f"{FOLDER_PATH}/contador_envios.txt"
+MAX_REINTENTOS = 8
+
+_lock = threading.Lock()
+_cache = None   # {"fecha", "cnt", "etag"} tal como quedó en SharePoint tras la última lectura/escritura
+
+def fecha_hoy():
+    return datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%d%m%Y")
+
+def _parsear(texto):
+    # Formato "ddmmaaaa,cnt"; un contenido inválido es un error, no un 0 silencioso
+    f_guardada, cnt = texto.strip().split(",")
+    return f_guardada, int(cnt)
+
+def _leer_remoto():
+    item = get_item_metadata(CONTADOR_PATH)
+    if item is None:
+        return {"fecha": None, "cnt": 0, "etag": None}
+    stream = get_file_if_exists(CONTADOR_PATH)
+    fecha, cnt = _parsear(stream.getvalue().decode("utf-8")) if stream is not None else (None, 0)
+    return {"fecha": fecha, "cnt": cnt, "etag": item["eTag"]}
+
+def _escribir(estado, fecha, cnt):
+    # Devuelve el nuevo estado o None si hubo conflicto de eTag
+    item = upload_if_match(CONTADOR_PATH, f"{fecha},{cnt}".encode("utf-8"), estado["etag"])
+    return None if item is None else {"fecha": fecha, "cnt": cnt, "etag": item["eTag"]}
+
+def _con_reintentos(calcular):
+    # calcular(estado) -> (fecha, cnt) a escribir, o None si no hay nada que hacer
+    global _cache
+    with _lock:
+        for intento in range(MAX_REINTENTOS):
+            if _cache is None: _cache = _leer_remoto()
+            destino = calcular(_cache)
+            if destino is None: return None
+            nuevo = _escribir(_cache, *destino)
+            if nuevo is not None:
+                _cache = nuevo
+                return nuevo["cnt"]
+            # Otra sesión escribió primero: releer y volver a intentar
+            _cache = None
+            time.sleep(random.uniform(0, 0.2 * 2 ** intento))
+    raise Exception(f"No se pudo actualizar {CONTADOR_PATH}: demasiados conflictos de escritura")
+
+def next_version(fecha):
+    # Reserva y devuelve el número de envío del día (1 = primer envío de `fecha`)
+    return _con_reintentos(lambda e: (fecha, e["cnt"] + 1 if e["fecha"] == fecha else 1))
+
+def liberar_version(fecha, version):
+    # Devuelve un número reservado que no llegó a usarse (p. ej. el correo falló),
+    # solo si nadie reservó otro después.
+    return _con_reintentos(lambda e: (fecha, version - 1) if (e["fecha"], e["cnt"]) == (fecha, version) else None)
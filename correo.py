@@ -0,0 +1,239 @@
+# ==============================================================
+# Envío de correo en segundo plano
+# Outbox persistente en disco + worker con reintentos (backoff)
+# y una conexión SMTP autenticada que se reutiliza entre envíos.
+# ==============================================================
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from config import get_secret
+from opciones import get_secret_opcional, opcion_activa
+import contador
+import tiempos
+
+SMTP_SERVER = get_secret("smtp_server")
+SMTP_PORT = get_secret("smtp_port")
+SMTP_USER = get_secret("smtp_user")
+SMTP_PASS = get_secret("smtp_pass")
+EMAIL_FROM = get_secret("email_from")
+EMAIL_TO = get_secret("email_to")
+# Para pruebas contra el sumidero SMTP local sin TLS (ver graph_local.py):
+#   python graph_local.py --smtp-puerto 1025   (smtp_server=127.0.0.1, smtp_port=1025, smtp_starttls=false)
+SMTP_STARTTLS = opcion_activa("smtp_starttls", True)
+
+OUTBOX_DIR = get_secret_opcional("outbox_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox"))
+FALLIDOS_DIR = os.path.join(OUTBOX_DIR, "fallidos")
+
+MAX_INTENTOS = 8
+BACKOFF_BASE = 5        # segundos; se duplica en cada intento fallido
+BACKOFF_MAX = 600
+ESPERA_MAX = 30         # el worker revisa el outbox al menos cada ESPERA_MAX segundos
+SMTP_IDLE = 60          # la conexión se cierra tras este tiempo sin envíos
+
+log = logging.getLogger(__name__)
+
+# ========= Construcción del mensaje =========
+def construir_mensaje(cuerpo, adjuntos):
+    # adjuntos: [(datos, nombre, (maintype, subtype))], tal como los arma payload_correo
+    # (smtplib y email se importan al usarse: no hacen falta para pintar la app)
+    from email.message import EmailMessage
+    msg = EmailMessage()
+    msg["From"], msg["To"] = EMAIL_FROM, EMAIL_TO
+    msg.set_content(cuerpo)
+    for datos, nombre, (maintype, subtype) in adjuntos:
+        # email acepta memoryview directamente: el adjunto se codifica desde el buffer original
+        msg.add_attachment(datos, maintype=maintype, subtype=subtype, filename=nombre)
+    return msg
+
+def asunto_versionado(asunto_base, fecha, version):
+    return f"{asunto_base} {fecha}" + (f" V{version}" if version > 1 else "")
+
+# ========= Outbox en disco =========
+def _ruta(job_id, ext, carpeta=OUTBOX_DIR):
+    return os.path.join(carpeta, f"{job_id}.{ext}")
+
+def _escribir_atomico(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _escribir_mensaje(path, msg):
+    # Igual que msg.as_bytes(), pero volcado directo al archivo (sin armar el .eml en memoria)
+    from email.generator import BytesGenerator
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        BytesGenerator(f, mangle_from_=False, policy=msg.policy).flatten(msg)
+    os.replace(tmp, path)
+
+def _guardar_meta(meta, carpeta=OUTBOX_DIR):
+    _escribir_atomico(_ruta(meta["id"], "json", carpeta), json.dumps(meta).encode("utf-8"))
+
+def encolar_correo(asunto_base, cuerpo, adjuntos, versionar=True):
+    # El asunto definitivo (con la versión del día) se arma al enviar; si el
+    # envío falla la versión reservada se libera, así el contador solo
+    # avanza con correos que salieron realmente.
+    job_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}"
+    os.makedirs(OUTBOX_DIR, exist_ok=True)
+    _escribir_mensaje(_ruta(job_id, "eml"), construir_mensaje(cuerpo, adjuntos))
+    # El .json se escribe al final: es lo que hace visible el trabajo al worker
+    _guardar_meta({
+        "id": job_id, "asunto_base": asunto_base, "versionar": versionar,
+        "creado": time.time(), "intentos": 0, "proximo_intento": 0, "ultimo_error": None,
+    })
+    iniciar_despachador().despertar()
+    return job_id
+
+def _listar(carpeta):
+    if not os.path.isdir(carpeta): return []
+    metas = []
+    for nombre in sorted(os.listdir(carpeta)):
+        if not nombre.endswith(".json"): continue
+        try:
+            with open(os.path.join(carpeta, nombre), "rb") as f:
+                metas.append(json.loads(f.read()))
+        except (OSError, ValueError):
+            continue
+    return metas
+
+def pendientes():
+    return _listar(OUTBOX_DIR)
+
+def fallidos():
+    return _listar(FALLIDOS_DIR)
+
+def _descartar(job_id):
+    for ext in ("json", "eml"):
+        try: os.remove(_ruta(job_id, ext))
+        except FileNotFoundError: pass
+
+def _mover_a_fallidos(meta):
+    os.makedirs(FALLIDOS_DIR, exist_ok=True)
+    try: os.replace(_ruta(meta["id"], "eml"), _ruta(meta["id"], "eml", FALLIDOS_DIR))
+    except FileNotFoundError: pass
+    _guardar_meta(meta, FALLIDOS_DIR)
+    os.remove(_ruta(meta["id"], "json"))
+
+# ========= Worker =========
+class _Despachador:
+    def __init__(self):
+        self._smtp = None
+        self._ultimo_uso = 0.0
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._bucle, name="outbox-correo", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def despertar(self):
+        self._evento.set()
+
+    def _conexion(self):
+        import smtplib
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250: return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._cerrar()
+        smtp = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS: smtp.starttls()
+        if SMTP_USER: smtp.login(SMTP_USER, SMTP_PASS)
+        self._smtp = smtp
+        return smtp
+
+    def _cerrar(self):
+        import smtplib
+        if self._smtp is None: return
+        try: self._smtp.quit()
+        except (smtplib.SMTPException, OSError): pass
+        self._smtp = None
+
+    def _enviar(self, meta):
+        # Se mide en el hilo del worker: cada envío es su propia medición
+        with tiempos.medicion("envio_correo"):
+            return self._enviar_medido(meta)
+
+    def _enviar_medido(self, meta):
+        from email import message_from_bytes, policy
+        try:
+            with open(_ruta(meta["id"], "eml"), "rb") as f:
+                msg = message_from_bytes(f.read(), policy=policy.default)
+        except OSError as e:
+            # Sin el .eml el trabajo no se puede reintentar: va a fallidos y no bloquea la cola
+            log.error("Correo %s sin mensaje legible (%s); se mueve a fallidos", meta["id"], e)
+            meta["ultimo_error"] = f"No se pudo leer el mensaje: {e}"[:500]
+            _mover_a_fallidos(meta)
+            return False
+        version = None
+        try:
+            if meta["versionar"]:
+                fecha = contador.fecha_hoy()
+                with tiempos.span("contador"):
+                    version = contador.next_version(fecha)
+                msg["Subject"] = asunto_versionado(meta["asunto_base"], fecha, version)
+            else:
+                msg["Subject"] = meta["asunto_base"]
+            with tiempos.span("smtp"):
+                self._conexion().send_message(msg)
+            self._ultimo_uso = time.time()
+        except Exception as e:
+            self._cerrar()
+            if version is not None:
+                # El correo no salió: se devuelve el número reservado
+                try: contador.liberar_version(fecha, version)
+                except Exception: log.exception("No se pudo liberar la versión %s del %s", version, fecha)
+            meta["intentos"] += 1
+            meta["ultimo_error"] = str(e)[:500]
+            meta["proximo_intento"] = time.time() + min(BACKOFF_BASE * 2 ** (meta["intentos"] - 1), BACKOFF_MAX)
+            if meta["intentos"] >= MAX_INTENTOS:
+                log.error("Correo %s descartado tras %s intentos: %s", meta["id"], meta["intentos"], e)
+                _mover_a_fallidos(meta)
+            else:
+                log.warning("Fallo enviando correo %s (intento %s): %s", meta["id"], meta["intentos"], e)
+                _guardar_meta(meta)
+            return False
+
+        _descartar(meta["id"])
+        return True
+
+    def procesar(self):
+        # Una pasada sobre el outbox; devuelve cuántos segundos esperar hasta la próxima
+        with self._lock:
+            espera = ESPERA_MAX
+            for meta in pendientes():
+                restante = meta["proximo_intento"] - time.time()
+                if restante > 0:
+                    espera = min(espera, restante)
+                elif not self._enviar(meta):
+                    espera = min(espera, meta["proximo_intento"] - time.time())
+            if self._smtp is not None and time.time() - self._ultimo_uso > SMTP_IDLE:
+                self._cerrar()
+            return max(espera, 1)
+
+    def _bucle(self):
+        while True:
+            try:
+                espera = self.procesar()
+            except Exception:
+                log.exception("Error procesando el outbox de correo")
+                espera = ESPERA_MAX
+            self._evento.wait(timeout=espera)
+            self._evento.clear()
+
+_despachador = None
+_lock_inicio = threading.Lock()
+
+def iniciar_despachador():
+    # Un único worker por proceso; al arrancar retoma lo que haya quedado en el outbox
+    global _despachador
+    with _lock_inicio:
+        if _despachador is None:
+            _despachador = _Despachador().iniciar()
+        return _despachador
@@ -0,0 +1,121 @@
+# ==============================================================
+# Esquema tipado de los Masterfiles
+# Cada columna tiene un tipo lógico con su tipo Arrow equivalente:
+# el data_editor recibe columnas homogéneas (sin el object+fillna('')
+# que forzaba a Streamlit a convertir todo a texto en cada rerun) y
+# las columnas numéricas siguen siendo numéricas al guardar.
+# ==============================================================
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+from cambios import ROWKEY
+
+TIPOS_ARROW = {
+    "texto": pa.string(),
+    "entero": pa.int64(),
+    "decimal": pa.float64(),
+    "fecha": pa.timestamp("ns"),
+    "booleano": pa.bool_(),
+}
+
+TIPOS_PANDAS = {
+    "texto": object,
+    "entero": "Int64",
+    "decimal": "Float64",
+    "fecha": "datetime64[ns]",
+    "booleano": "boolean",
+}
+
+# Columnas declaradas por masterfile; el resto se infiere al cargar cada versión
+ESQUEMAS = {
+    "Fijo": {"Stm": "texto"},
+    "Movilidad": {"NOMBRE PANELISTA": "texto"},
+}
+
+ENTERO_MAX = 2 ** 53   # por encima, un float ya no representa enteros exactos
+
+# ========= Inferencia =========
+def _es_numero(v):
+    return isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+
+def _inferir_tipo(serie):
+    valores = serie.dropna()
+    if valores.empty: return "texto"
+    if pd.api.types.is_bool_dtype(serie): return "booleano"
+    if pd.api.types.is_datetime64_any_dtype(serie): return "fecha"
+    if pd.api.types.is_numeric_dtype(serie) or all(_es_numero(v) for v in valores):
+        numeros = valores.to_numpy(dtype=float)
+        return "entero" if np.all(np.mod(numeros, 1) == 0) and np.all(np.abs(numeros) < ENTERO_MAX) else "decimal"
+    if all(isinstance(v, pd.Timestamp) for v in valores): return "fecha"
+    return "texto"
+
+def inferir_esquema(df, modo):
+    declarado = ESQUEMAS.get(modo, {})
+    return {c: declarado.get(c) or _inferir_tipo(df[c]) for c in df.columns if c != ROWKEY}
+
+def esquema_arrow(tipos):
+    return pa.schema([(str(c), TIPOS_ARROW[t]) for c, t in tipos.items()])
+
+# ========= Conversión =========
+def _a_texto(v):
+    if v is None or (not isinstance(v, str) and pd.isna(v)): return ""
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def tipar(df, tipos):
+    # Devuelve un DataFrame nuevo con un dtype homogéneo por columna
+    out = {}
+    for c in df.columns:
+        t = tipos.get(c)
+        if t is None: out[c] = df[c]
+        elif t == "texto": out[c] = df[c].map(_a_texto).astype(object)
+        elif t in ("entero", "decimal"): out[c] = pd.to_numeric(df[c].replace("", np.nan), errors="coerce").astype(TIPOS_PANDAS[t])
+        elif t == "fecha": out[c] = pd.to_datetime(df[c].replace("", np.nan), errors="coerce")
+        else: out[c] = df[c].replace("", np.nan).astype("boolean")
+    return pd.DataFrame(out, index=df.index)
+
+def validar_arrow(df, tipos):
+    # Falla al cargar (una vez por versión) y no en cada rerun del editor
+    pa.Table.from_pandas(df[list(tipos)], schema=esquema_arrow(tipos), preserve_index=False)
+
+def numeros_originales(df, tipos, modo=None):
+    # Celdas numéricas de las columnas de texto inferidas, tal como se leyeron (df antes
+    # de tipar, en el orden de ROWKEY): {columna: Serie ROWKEY -> número}. Las columnas
+    # declaradas como texto en ESQUEMAS no se registran: se guardan siempre como texto
+    declarado = ESQUEMAS.get(modo, {})
+    out = {}
+    for c, t in tipos.items():
+        if t != "texto" or c in declarado or c not in df.columns: continue
+        valores = df[c].to_numpy(dtype=object)
+        posiciones = [i for i, v in enumerate(valores) if _es_numero(v) and not pd.isna(v)]
+        if posiciones: out[c] = pd.Series(valores[posiciones], index=np.array(posiciones).astype(str), dtype=object)
+    return out
+
+def para_guardar(df, numeros=None):
+    # numeros: numeros_originales() de la versión base. tipar() pasó esas celdas a texto;
+    # vuelven a escribirse como número solo si siguen con el texto que dejó _a_texto, es
+    # decir, si nadie las editó. Lo escrito en el editor se guarda como texto aunque
+    # parezca un número (el "5" tecleado en una columna de códigos sigue siendo "5")
+    out = df.drop(columns=[ROWKEY], errors="ignore").copy()
+    if not numeros or ROWKEY not in df.columns: return out
+    for c, originales in numeros.items():
+        if c not in out.columns: continue
+        base = originales.reindex(df[ROWKEY].to_numpy()).to_numpy(dtype=object)
+        valores = out[c].to_numpy(dtype=object, copy=True)
+        for i in np.flatnonzero(pd.notna(base)):
+            if valores[i] == _a_texto(base[i]): valores[i] = base[i]
+        out[c] = pd.Series(valores, index=out.index, dtype=object)
+    return out
+
+# ========= Editor =========
+def column_config(tipos):
+    config = {ROWKEY: None}
+    for c, t in tipos.items():
+        if t == "entero": config[c] = st.column_config.NumberColumn(c, step=1, format="%d")
+        elif t == "decimal": config[c] = st.column_config.NumberColumn(c)
+        elif t == "fecha": config[c] = st.column_config.DatetimeColumn(c)
+        elif t == "booleano": config[c] = st.column_config.CheckboxColumn(c)
+        else: config[c] = st.column_config.TextColumn(c)
+    return config
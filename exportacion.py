@@ -0,0 +1,81 @@
+# ==============================================================
+# Exportación de la vista actual (filtros + ediciones de la sesión)
+# a CSV, Parquet o Excel. Cada formato es un generador de bytes que
+# recorre el DataFrame por tramos de filas: solo se copia el tramo
+# en curso, nunca el DataFrame completo. El archivo se arma recién
+# cuando se pide la descarga (st.download_button con data diferida).
+#
+# Secret: exportacion_filas_tramo (filas por tramo, 20000 por defecto)
+# ==============================================================
+
+from almacenamiento import archivo_temporal
+from cambios import ROWKEY
+from opciones import get_secret_opcional
+import esquema
+import libro
+import tiempos
+
+FILAS_POR_TRAMO = int(get_secret_opcional("exportacion_filas_tramo", 20000))
+
+FORMATOS = {
+    "Excel": {"extension": "xlsx", "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "CSV": {"extension": "csv", "mime": "text/csv"},
+    "Parquet": {"extension": "parquet", "mime": "application/vnd.apache.parquet"},
+}
+
+# ========= Tramos =========
+def tramos(df, posiciones=None, filas=None):
+    # posiciones: filas a exportar (p. ej. las que pasan los filtros); None = todas.
+    # Siempre hay al menos un tramo (vacío si no hay filas) para escribir el encabezado.
+    filas = filas or FILAS_POR_TRAMO
+    total = len(df) if posiciones is None else len(posiciones)
+    for ini in range(0, max(total, 1), filas):
+        yield df.iloc[ini:ini + filas] if posiciones is None else df.iloc[posiciones[ini:ini + filas]]
+
+# ========= Formatos =========
+def csv_por_partes(df, tipos, posiciones=None, numeros=None):
+    columnas = [c for c in df.columns if c != ROWKEY]
+    for i, tramo in enumerate(tramos(df, posiciones)):
+        # BOM solo al inicio: Excel abre el CSV como UTF-8
+        yield tramo.to_csv(index=False, header=i == 0, columns=columnas).encode("utf-8-sig" if i == 0 else "utf-8")
+
+def parquet_por_partes(df, tipos, posiciones=None, numeros=None):
+    # Un row group por tramo, con el esquema Arrow de la carga (ver esquema.py)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    esquema_arrow = esquema.esquema_arrow(tipos)
+    salida = libro.SalidaPorPartes()
+    with pq.ParquetWriter(salida, esquema_arrow) as escritor:
+        for tramo in tramos(df, posiciones):
+            escritor.write_table(pa.Table.from_pandas(tramo[list(tipos)], schema=esquema_arrow, preserve_index=False))
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+def xlsx_por_partes(df, tipos, posiciones=None, numeros=None):
+    # Mismos valores que al guardar (esquema.para_guardar), tramo por tramo
+    return libro.libro_por_partes(esquema.para_guardar(tramo, numeros) for tramo in tramos(df, posiciones))
+
+GENERADORES = {"Excel": xlsx_por_partes, "CSV": csv_por_partes, "Parquet": parquet_por_partes}
+
+def exportar(formato, df, tipos, posiciones=None, numeros=None):
+    # Bytes de la exportación completa. Las partes se acumulan en un archivo temporal
+    # (en memoria hasta DESCARGA_SPOOL_MAX, en disco por encima) y se leen una sola vez:
+    # st.download_button solo acepta bytes/str o ciertos file-like desde un callable.
+    with archivo_temporal() as archivo:
+        with tiempos.span(f"exportar.{FORMATOS[formato]['extension']}"):
+            for parte in GENERADORES[formato](df, tipos, posiciones, numeros):
+                archivo.write(parte)
+        archivo.seek(0)
+        return archivo.read()
+
+def descarga_diferida(formato, df, df_filtrado, tipos, numeros=None):
+    # Callable para st.download_button(data=...): la exportación se genera al hacer clic.
+    # df_filtrado son las filas visibles (filtros) y df el dataframe con las ediciones;
+    # numeros: carga.numeros_masterfile de la versión base (ver esquema.para_guardar).
+    def generar():
+        posiciones = None if len(df_filtrado) == len(df) else df.index.get_indexer(df_filtrado.index)
+        return exportar(formato, df, tipos, posiciones, numeros)
+    return generar
+
+def nombre_exportacion(nombre_archivo, formato):
+    return f"{nombre_archivo.rsplit('.', 1)[0]}_vista.{FORMATOS[formato]['extension']}"
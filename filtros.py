@@ -0,0 +1,16 @@
+# ==============================================================
+# Filtros por columna de los Masterfiles (sin dependencias de UI)
+# ==============================================================
+
+import numpy as np
+
+def opciones_filtro(df, columna):
+    return sorted(x for x in df[columna].dropna().astype(str).unique() if x.strip() != '')
+
+def aplicar_filtros(df, filtros):
+    # filtros: {columna: [valores como texto]}; se combina una sola máscara
+    # en lugar de ir copiando el DataFrame filtro por filtro
+    mascara = np.ones(len(df), dtype=bool)
+    for columna, seleccion in filtros.items():
+        if seleccion: mascara &= df[columna].astype(str).isin(seleccion).to_numpy()
+    return df if mascara.all() else df[mascara]
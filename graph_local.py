@@ -0,0 +1,423 @@
+# ==============================================================
+# Stand-in local de Microsoft Graph y SMTP para pruebas sin red
+#
+# En proceso: GraphMemoria imita la interfaz de requests.Session
+# (request/get/put/post) y reemplaza a sharepoint_graph._http:
+#
+#     graph = GraphMemoria()
+#     sharepoint_graph._http = graph
+#     sharepoint_graph.get_access_token_cached = lambda: "token-local"
+#
+# Como servidor (token, Graph y un sumidero SMTP):
+#
+#     python graph_local.py --puerto 8765 --smtp-puerto 1025 --generar-filas 5000 \
+#         --latencia 0.05 --tasa-429 0.05 --tasa-fallo 0.01
+#
+# y en secrets: graph_base_url = "http://127.0.0.1:8765/v1.0",
+# login_base_url = "http://127.0.0.1:8765", smtp_server = "127.0.0.1",
+# smtp_port = 1025, smtp_starttls = false
+# ==============================================================
+
+import os
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import socketserver
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote, parse_qsl
+
+SITE_ID = "sitio-local"
+DRIVE_ID = "drive-local"
+CARPETA_MASTERFILE = "01. Documentos MedUX/Automatizacion/Masterfile"
+
+def _leer_cuerpo(data):
+    if data is None: return b""
+    if isinstance(data, (bytes, bytearray, memoryview)): return bytes(data)
+    return data.read()
+
+class RespuestaMemoria:
+    def __init__(self, status_code, contenido=b"", datos=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(datos).encode("utf-8") if datos is not None else contenido
+        self.headers = headers or {}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for ini in range(0, len(self.content), chunk_size): yield self.content[ini:ini + chunk_size]
+
+    def close(self):
+        pass
+
+class GraphMemoria:
+    # latencia: segundos por llamada; tasa_429: fracción de llamadas que responden
+    # 429 + Retry-After; tasa_fallo: fracción que responde 503 sin Retry-After
+    def __init__(self, site_name="Sutel", latencia=0.0, tasa_429=0.0, retry_after=1, tasa_fallo=0.0,
+                 base_url="https://graph.microsoft.com/v1.0", semilla=None):
+        self.site = {"id": SITE_ID, "name": site_name, "webUrl": f"https://local/sites/{site_name}"}
+        self.drive = {"id": DRIVE_ID, "name": "Documentos"}
+        self.latencia = latencia
+        self.tasa_429 = tasa_429
+        self.retry_after = retry_after
+        self.tasa_fallo = tasa_fallo
+        self.base_url = base_url
+        self.items = {}             # ruta -> driveItem (+ "_datos" para archivos)
+        self.registro = []          # rutas en el orden en que cambiaron (para /delta)
+        self.sesiones = {}          # id -> sesión de subida en curso
+        self.llamadas = Counter()   # (método, tipo de operación) -> cantidad
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    # ----- estado -----
+    def _nuevo_item(self, ruta, datos=None):
+        previo = self.items.get(ruta)
+        item_id = previo["id"] if previo else uuid.uuid4().hex
+        version = previo["_version"] + 1 if previo else 1
+        item = {
+            "id": item_id,
+            "name": ruta.rsplit("/", 1)[-1],
+            "eTag": f'"{{{item_id}}},{version}"',
+            "lastModifiedDateTime": datetime.now(timezone.utc).isoformat(),
+            "_version": version,
+        }
+        if datos is None:
+            item["folder"] = {"childCount": 0}
+        else:
+            item.update({"file": {}, "size": len(datos), "_datos": bytes(datos)})
+        self.items[ruta] = item
+        self.registro.append(ruta)
+        return item
+
+    def escribir(self, ruta, datos):
+        # Siembra directa de un archivo (y sus carpetas) sin pasar por HTTP
+        partes = ruta.split("/")
+        for i in range(1, len(partes)):
+            carpeta = "/".join(partes[:i])
+            if carpeta not in self.items: self._nuevo_item(carpeta)
+        return self._publico(self._nuevo_item(ruta, datos))
+
+    def leer(self, ruta):
+        return self.items[ruta]["_datos"]
+
+    @staticmethod
+    def _publico(item):
+        return {k: v for k, v in item.items() if not k.startswith("_")}
+
+    # ----- interfaz tipo requests.Session -----
+    def request(self, method, url, headers=None, data=None, json=None, **kwargs):
+        return self.despachar(method, url, headers or {}, data=data, cuerpo=json)
+
+    def get(self, url, headers=None, **kwargs):
+        return self.request("GET", url, headers)
+
+    def put(self, url, headers=None, data=None, **kwargs):
+        return self.request("PUT", url, headers, data=data)
+
+    def post(self, url, headers=None, json=None, data=None, **kwargs):
+        return self.request("POST", url, headers, data=data, json=json)
+
+    # ----- enrutamiento -----
+    def despachar(self, metodo, url, headers, data=None, cuerpo=None):
+        if self.latencia: time.sleep(self.latencia)
+        sorteo = self._rng.random()
+        if sorteo < self.tasa_429:
+            self.llamadas[(metodo, "429")] += 1
+            return RespuestaMemoria(429, datos={"error": {"code": "tooManyRequests"}}, headers={"Retry-After": str(self.retry_after)})
+        if sorteo < self.tasa_429 + self.tasa_fallo:
+            self.llamadas[(metodo, "503")] += 1
+            return RespuestaMemoria(503, datos={"error": {"code": "serviceNotAvailable"}})
+        headers = {k.lower(): v for k, v in headers.items()}
+        with self._lock:
+            return self._enrutar(metodo, url, headers, data, cuerpo)
+
+    def _enrutar(self, metodo, url, headers, data, cuerpo):
+        partes = urlsplit(url)
+        ruta_url = unquote(partes.path)
+        query = parse_qs(partes.query)
+        prefijo = f"/v1.0/sites/{SITE_ID}/drives/{DRIVE_ID}/"
+
+        if ruta_url == "/v1.0/sites":
+            self.llamadas[(metodo, "sites")] += 1
+            buscado = query.get("search", [""])[0].lower()
+            return RespuestaMemoria(200, datos={"value": [self.site] if buscado in self.site["name"].lower() else []})
+        if ruta_url == f"/v1.0/sites/{SITE_ID}/drives":
+            self.llamadas[(metodo, "drives")] += 1
+            return RespuestaMemoria(200, datos={"value": [self.drive]})
+        if ruta_url.startswith("/v1.0/_upload/"):
+            self.llamadas[(metodo, "uploadSession")] += 1
+            return self._fragmento(ruta_url.rsplit("/", 1)[-1], data, headers)
+        if not ruta_url.startswith(prefijo):
+            return RespuestaMemoria(404, datos={"error": {"code": "itemNotFound", "message": ruta_url}})
+
+        resto = ruta_url[len(prefijo):]
+        if resto == "root/delta" and metodo == "GET":
+            self.llamadas[(metodo, "delta")] += 1
+            return self._delta(query)
+        if resto == "root/children":
+            return self._crear_carpeta("", cuerpo)
+        if not resto.startswith("root:/"):
+            return RespuestaMemoria(400, datos={"error": {"code": "invalidRequest", "message": resto}})
+        resto = resto[len("root:/"):]
+        ruta, _, accion = resto.partition(":/")
+        ruta = ruta.rstrip(":")
+        self.llamadas[(metodo, accion or "item")] += 1
+
+        if accion == "content" and metodo == "GET":
+            item = self.items.get(ruta)
+            if item is None or "_datos" not in item: return self._no_encontrado(ruta)
+            return RespuestaMemoria(200, contenido=item["_datos"], headers={"ETag": item["eTag"]})
+        if accion == "content" and metodo == "PUT":
+            return self._subir(ruta, data, headers, query)
+        if accion == "children" and metodo == "GET":
+            return self._listar(ruta)
+        if accion == "children" and metodo == "POST":
+            return self._crear_carpeta(ruta, cuerpo)
+        if accion == "createUploadSession" and metodo == "POST":
+            sesion_id = uuid.uuid4().hex
+            self.sesiones[sesion_id] = {"ruta": ruta, "datos": bytearray()}
+            vence = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+            return RespuestaMemoria(200, datos={"uploadUrl": f"{self.base_url}/_upload/{sesion_id}", "expirationDateTime": vence})
+        if accion == "createLink" and metodo == "POST":
+            if ruta not in self.items: return self._no_encontrado(ruta)
+            return RespuestaMemoria(200, datos={"link": {"type": (cuerpo or {}).get("type", "view"), "webUrl": f"https://local/compartido/{ruta}"}})
+        if accion == "" and metodo == "GET":
+            item = self.items.get(ruta)
+            return RespuestaMemoria(200, datos=self._publico(item)) if item else self._no_encontrado(ruta)
+        return RespuestaMemoria(405, datos={"error": {"code": "notSupported", "message": f"{metodo} {accion}"}})
+
+    @staticmethod
+    def _no_encontrado(ruta):
+        return RespuestaMemoria(404, datos={"error": {"code": "itemNotFound", "message": ruta}})
+
+    def _subir(self, ruta, data, headers, query):
+        previo = self.items.get(ruta)
+        if_match = headers.get("if-match")
+        if if_match is not None and (previo is None or previo["eTag"] != if_match):
+            return RespuestaMemoria(412, datos={"error": {"code": "preconditionFailed", "message": ruta}})
+        if previo is not None and query.get("@microsoft.graph.conflictBehavior") == ["fail"]:
+            return RespuestaMemoria(409, datos={"error": {"code": "nameAlreadyExists", "message": ruta}})
+        padre = ruta.rsplit("/", 1)[0] if "/" in ruta else ""
+        if padre and padre not in self.items:
+            return self._no_encontrado(padre)
+        item = self._nuevo_item(ruta, _leer_cuerpo(data))
+        return RespuestaMemoria(201 if previo is None else 200, datos=self._publico(item))
+
+    def _fragmento(self, sesion_id, data, headers):
+        sesion = self.sesiones.get(sesion_id)
+        if sesion is None: return RespuestaMemoria(404, datos={"error": {"code": "itemNotFound", "message": sesion_id}})
+        rango, _, total = headers.get("content-range", "").replace("bytes ", "").partition("/")
+        ini = int(rango.split("-")[0])
+        if ini != len(sesion["datos"]):
+            return RespuestaMemoria(416, datos={"nextExpectedRanges": [f"{len(sesion['datos'])}-"]})
+        sesion["datos"] += _leer_cuerpo(data)
+        if len(sesion["datos"]) < int(total):
+            return RespuestaMemoria(202, datos={"nextExpectedRanges": [f"{len(sesion['datos'])}-"]})
+        del self.sesiones[sesion_id]
+        previo = self.items.get(sesion["ruta"])
+        item = self._nuevo_item(sesion["ruta"], sesion["datos"])
+        return RespuestaMemoria(201 if previo is None else 200, datos=self._publico(item))
+
+    def _delta(self, query, pagina=200):
+        # token = posición en el registro de cambios; "latest" no devuelve items
+        token = query.get("token", ["0"])[0]
+        desde = len(self.registro) if token == "latest" else int(token)
+        if desde > len(self.registro):
+            return RespuestaMemoria(410, datos={"error": {"code": "resyncRequired"}})
+        hasta = min(desde + pagina, len(self.registro))
+        rutas = dict.fromkeys(self.registro[desde:hasta])     # una entrada por item, en orden
+        valor = [{**self._publico(self.items[r]), "parentReference": {"driveId": DRIVE_ID}} for r in rutas]
+        enlace = f"{self.base_url}/sites/{SITE_ID}/drives/{DRIVE_ID}/root/delta?token={hasta}"
+        clave = "@odata.nextLink" if hasta < len(self.registro) else "@odata.deltaLink"
+        return RespuestaMemoria(200, datos={"value": valor, clave: enlace})
+
+    def _listar(self, ruta):
+        if ruta not in self.items: return self._no_encontrado(ruta)
+        hijos = [self._publico(i) for r, i in self.items.items() if r.rsplit("/", 1)[0] == ruta and r != ruta]
+        return RespuestaMemoria(200, datos={"value": hijos})
+
+    def _crear_carpeta(self, padre, cuerpo):
+        if padre and padre not in self.items: return self._no_encontrado(padre)
+        ruta = f"{padre}/{cuerpo['name']}" if padre else cuerpo["name"]
+        if ruta in self.items:
+            return RespuestaMemoria(409, datos={"error": {"code": "nameAlreadyExists", "message": ruta}})
+        return RespuestaMemoria(201, datos=self._publico(self._nuevo_item(ruta)))
+
+# ========= Servidor HTTP (token + Graph) =========
+class _ManejadorGraph(BaseHTTPRequestHandler):
+    graph = None
+
+    def _atender(self, metodo):
+        largo = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(largo) if largo else None
+        ruta = urlsplit(self.path).path
+        if metodo == "POST" and ruta.endswith("/oauth2/v2.0/token"):
+            form = dict(parse_qsl((data or b"").decode("utf-8")))
+            if form.get("grant_type") != "client_credentials":
+                resp = RespuestaMemoria(400, datos={"error": "unsupported_grant_type"})
+            else:
+                resp = RespuestaMemoria(200, datos={"token_type": "Bearer", "expires_in": 3599, "access_token": f"token-local-{uuid.uuid4().hex}"})
+        elif not ruta.startswith("/v1.0/_upload/") and not self.headers.get("Authorization", "").startswith("Bearer "):
+            resp = RespuestaMemoria(401, datos={"error": {"code": "InvalidAuthenticationToken"}})
+        else:
+            cuerpo = json.loads(data) if data and self.headers.get("Content-Type", "").startswith("application/json") else None
+            resp = self.graph.despachar(metodo, f"http://local{self.path}", dict(self.headers), data=data, cuerpo=cuerpo)
+        self.send_response(resp.status_code)
+        for k, v in resp.headers.items(): self.send_header(k, v)
+        self.send_header("Content-Length", str(len(resp.content)))
+        if resp.content[:1] in (b"{", b"["): self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(resp.content)
+
+    def do_GET(self): self._atender("GET")
+    def do_PUT(self): self._atender("PUT")
+    def do_POST(self): self._atender("POST")
+
+    def log_message(self, *args):
+        pass
+
+def servidor_graph(graph, host="127.0.0.1", puerto=8765):
+    manejador = type("ManejadorGraph", (_ManejadorGraph,), {"graph": graph})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    graph.base_url = f"http://{host}:{servidor.server_address[1]}/v1.0"
+    return servidor
+
+# ========= Sumidero SMTP =========
+class _ManejadorSMTP(socketserver.StreamRequestHandler):
+    sumidero = None
+
+    def _responder(self, linea):
+        self.wfile.write(f"{linea}\r\n".encode("utf-8"))
+
+    def _leer(self):
+        return self.rfile.readline().decode("utf-8", errors="replace").rstrip("\r\n")
+
+    def handle(self):
+        self._responder("220 sumidero-smtp-local")
+        remitente, destinos = None, []
+        while True:
+            linea = self._leer()
+            if not linea and self.rfile.closed: return
+            comando = linea.split(" ", 1)[0].upper()
+            if comando == "":
+                return
+            if comando == "EHLO":
+                self._responder("250-sumidero-smtp-local")
+                self._responder("250-AUTH PLAIN LOGIN")
+                self._responder("250 SIZE 104857600")
+            elif comando == "HELO":
+                self._responder("250 sumidero-smtp-local")
+            elif comando == "AUTH":
+                partes = linea.split()
+                if partes[1].upper() == "LOGIN":
+                    if len(partes) < 3:
+                        self._responder("334 VXNlcm5hbWU6"); self._leer()
+                    self._responder("334 UGFzc3dvcmQ6"); self._leer()
+                self._responder("235 2.7.0 Autenticado")
+            elif comando == "MAIL":
+                remitente, destinos = linea[10:].strip(), []
+                self._responder("250 OK")
+            elif comando == "RCPT":
+                destinos.append(linea[8:].strip())
+                self._responder("250 OK")
+            elif comando == "DATA":
+                self._responder("354 Fin con <CRLF>.<CRLF>")
+                lineas = []
+                while True:
+                    l = self.rfile.readline()
+                    if l in (b".\r\n", b".\n", b""): break
+                    lineas.append(l[1:] if l.startswith(b"..") else l)
+                if self.sumidero.latencia: time.sleep(self.sumidero.latencia)
+                if self.sumidero._rng.random() < self.sumidero.tasa_fallo:
+                    self._responder("451 4.3.0 Fallo simulado")
+                else:
+                    self.sumidero.guardar(remitente, destinos, b"".join(lineas))
+                    self._responder("250 OK: encolado")
+            elif comando == "RSET":
+                remitente, destinos = None, []
+                self._responder("250 OK")
+            elif comando == "NOOP":
+                self._responder("250 OK")
+            elif comando == "QUIT":
+                self._responder("221 Adiós")
+                return
+            else:
+                self._responder("502 Comando no implementado")
+
+class SumideroSMTP:
+    def __init__(self, host="127.0.0.1", puerto=1025, carpeta=None, latencia=0.0, tasa_fallo=0.0, semilla=None):
+        self.mensajes = []      # (remitente, destinos, bytes del mensaje)
+        self.carpeta = carpeta
+        self.latencia = latencia
+        self.tasa_fallo = tasa_fallo
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        manejador = type("ManejadorSMTP", (_ManejadorSMTP,), {"sumidero": self})
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.servidor = socketserver.ThreadingTCPServer((host, puerto), manejador)
+        self.servidor.daemon_threads = True
+
+    def guardar(self, remitente, destinos, datos):
+        with self._lock:
+            self.mensajes.append((remitente, destinos, datos))
+            if self.carpeta:
+                os.makedirs(self.carpeta, exist_ok=True)
+                with open(os.path.join(self.carpeta, f"{time.time_ns()}.eml"), "wb") as f:
+                    f.write(datos)
+
+    def iniciar(self):
+        threading.Thread(target=self.servidor.serve_forever, name="sumidero-smtp", daemon=True).start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+# ========= CLI =========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in local de Microsoft Graph + SMTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--smtp-puerto", type=int, default=1025, help="0 para no levantar el sumidero SMTP")
+    parser.add_argument("--smtp-carpeta", help="Guardar cada correo recibido como .eml en esta carpeta")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos añadidos a cada llamada")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="Fracción de llamadas con 429 + Retry-After")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--tasa-fallo", type=float, default=0.0, help="Fracción de llamadas (y envíos SMTP) que fallan")
+    parser.add_argument("--carpeta", default=CARPETA_MASTERFILE, help="Carpeta del drive donde se siembran archivos")
+    parser.add_argument("--sembrar", help="Directorio local cuyos archivos se suben a --carpeta al arrancar")
+    parser.add_argument("--generar-filas", type=int, default=0, help="Sembrar Masterfiles sintéticos con N filas")
+    args = parser.parse_args(argv)
+
+    graph = GraphMemoria(latencia=args.latencia, tasa_429=args.tasa_429, retry_after=args.retry_after, tasa_fallo=args.tasa_fallo)
+    if args.sembrar:
+        for nombre in sorted(os.listdir(args.sembrar)):
+            ruta = os.path.join(args.sembrar, nombre)
+            if os.path.isfile(ruta):
+                with open(ruta, "rb") as f: graph.escribir(f"{args.carpeta}/{nombre}", f.read())
+    if args.generar_filas:
+        from benchmarks.generador import generar_masterfile, a_excel
+        for modo, nombre in (("Fijo", "MasterfileSutel.xlsx"), ("Movilidad", "MasterfileSutel_Movilidad.xlsx")):
+            graph.escribir(f"{args.carpeta}/{nombre}", a_excel(generar_masterfile(modo, args.generar_filas)))
+
+    servidor = servidor_graph(graph, args.host, args.puerto)
+    print(f"Graph local en {graph.base_url}  (login_base_url = http://{args.host}:{servidor.server_address[1]})")
+    if args.smtp_puerto:
+        SumideroSMTP(args.host, args.smtp_puerto, args.smtp_carpeta, args.latencia, args.tasa_fallo).iniciar()
+        print(f"SMTP local en {args.host}:{args.smtp_puerto}  (smtp_starttls = false)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
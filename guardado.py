@@ -0,0 +1,166 @@
+# ==============================================================
+# Pipeline de guardado: diff, Excel, backup, sobrescritura,
+# catálogo de backups y correo de notificación, como una
+# transacción con bitácora de pasos (ver transaccion.py)
+# ==============================================================
+
+import shutil
+import hashlib
+import logging
+from io import BytesIO
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from almacenamiento import FOLDER_PATH, upload_file_to_sharepoint, ensure_folder
+from cambios import componer_cambios, conjunto_cambios, filas_modificadas, huella
+from registro import masterfile
+import carga
+import esquema
+import libro
+import catalogo_backups
+import payload_correo
+import correo
+import reporte_cambios
+import transaccion
+import tiempos
+
+log = logging.getLogger(__name__)
+
+def _publicado(tx, modo, n_arc, etag):
+    # Lo que un intento anterior de este mismo guardado ya publicó (la persona editó
+    # de nuevo antes de reintentar y la transacción empezó de nuevo, ver
+    # transaccion.conservar), si sigue siendo la versión vigente
+    publicado = tx.conservado(f"publicado:{modo}")
+    if publicado is None or publicado["etag"] == etag: return publicado
+    log.warning("Guardado %s: %s cambió desde el intento anterior; el correo solo informa los cambios sobre la versión vigente", tx.clave, n_arc)
+    return None
+
+def _preparar(tx, modo, df_mod, n_arc, productos):
+    # Diff y Excel. Los productos quedan también en la carpeta de la transacción:
+    # al reintentar, el original ya puede ser la versión subida y el diff no se repite
+    contenido, df_orig, _, etag = carga.cargar_masterfile(modo, n_arc)
+
+    with tiempos.span("diff"):
+        cambios = conjunto_cambios(df_orig, df_mod, modo)
+        nuevos = len(cambios)
+        # La versión vigente ya tiene lo publicado por el intento anterior: el correo
+        # informa los cambios desde la versión previa al guardado
+        publicado = _publicado(tx, modo, n_arc, etag)
+        if publicado is not None: cambios = componer_cambios(pd.read_pickle(tx.archivo_conservado(f"{modo}_cambios.pkl")), cambios)
+
+    # Guardar en Excel
+    with tiempos.span("to_excel"):
+        df_save = esquema.para_guardar(df_mod, carga.numeros_masterfile(modo, n_arc, etag))
+        # Se serializa una sola vez: backup, sobrescritura y correo leen el mismo
+        # buffer (de solo lectura) por vistas, sin copiar el libro
+        hojas = contenido.hojas()
+        if len(hojas) > 1:
+            # Libro con varias hojas: solo se reescribe la primera (la editada);
+            # las demás se copian del original sin parsearlas
+            with contenido.abierto() as original:
+                datos = libro.reemplazar_hojas(original, {hojas[0]: df_save})
+        else:
+            buf = BytesIO()
+            df_save.to_excel(buf, index=False)
+            datos = buf.getbuffer().toreadonly()
+    filas_cambiadas = filas_modificadas(df_mod, cambios) if payload_correo.CORREO_ADJUNTOS == "cambios" else None
+
+    with tiempos.span("bitacora"):
+        with open(tx.archivo(f"{modo}.xlsx"), "wb") as f: f.write(datos)
+        cambios.to_pickle(tx.archivo(f"{modo}_cambios.pkl"))
+        if filas_cambiadas is not None: filas_cambiadas.to_pickle(tx.archivo(f"{modo}_filas.pkl"))
+    productos.update(datos=datos, cambios=cambios, filas_cambiadas=filas_cambiadas)
+    return {"filas": len(df_save), "filas_cambiadas": filas_cambiadas is not None,
+            "reutilizar": publicado is not None and nuevos == 0}
+
+def _productos_guardados(tx, modo, preparado):
+    # Reintento: lo que produjo _preparar en el intento anterior
+    with open(tx.archivo(f"{modo}.xlsx"), "rb") as f: datos = memoryview(f.read())
+    return {
+        "datos": datos,
+        "cambios": pd.read_pickle(tx.archivo(f"{modo}_cambios.pkl")),
+        "filas_cambiadas": pd.read_pickle(tx.archivo(f"{modo}_filas.pkl")) if preparado["filas_cambiadas"] else None,
+    }
+
+def _subir_backup(carpeta_bkp, bkp_path, datos):
+    ensure_folder(carpeta_bkp)
+    return upload_file_to_sharepoint(bkp_path, datos)
+
+def _guardar_masterfile(tx, modo, df_mod, n_arc, timestamp):
+    # Un Masterfile completo: diff, Excel, backup y sobrescritura.
+    # Independiente de los demás, así que se ejecutan en paralelo.
+    # Cada paso queda en la bitácora y no se repite al reintentar.
+    productos = {}
+    preparado = tx.paso(f"preparar:{modo}", lambda: _preparar(tx, modo, df_mod, n_arc, productos))
+    if not productos: productos = _productos_guardados(tx, modo, preparado)
+    datos, cambios = productos["datos"], productos["cambios"]
+
+    # Backups y Sobrescribir
+    if preparado.get("reutilizar"):
+        # Sin ediciones nuevas desde que un intento anterior lo publicó: no se vuelve
+        # a respaldar ni a subir
+        publicado = tx.conservado(f"publicado:{modo}")
+        timestamp, bkp_path = publicado["timestamp"], publicado["ruta"]
+        item_bkp, item = publicado["backup"], publicado["sobrescritura"]
+    else:
+        carpeta_bkp = f"{FOLDER_PATH}/{masterfile(modo)['backups']}"
+        bkp_path = f"{carpeta_bkp}/{n_arc.replace('.xlsx','')}_{timestamp}.xlsx"
+        item_bkp = tx.paso(f"backup:{modo}", lambda: _subir_backup(carpeta_bkp, bkp_path, datos))
+        item = tx.paso(f"sobrescritura:{modo}", lambda: upload_file_to_sharepoint(f"{FOLDER_PATH}/{n_arc}", datos))
+        # Publicado: si la transacción empieza de nuevo, sus cambios siguen en el correo
+        shutil.copyfile(tx.archivo(f"{modo}_cambios.pkl"), tx.archivo_conservado(f"{modo}_cambios.pkl"))
+        tx.conservar(f"publicado:{modo}", {"etag": item["eTag"], "timestamp": timestamp, "ruta": bkp_path, "backup": item_bkp, "sobrescritura": item})
+    # Las demás sesiones del proceso dejan de usar la versión anterior
+    carga.publicar(modo, n_arc, item["eTag"], item.get("id"))
+    return {
+        "cambios": cambios,
+        "backup": catalogo_backups.entrada_backup(modo, n_arc, bkp_path, timestamp, item_bkp, preparado["filas"], cambios),
+        "correo": {
+            "nombre": f"{n_arc.replace('.xlsx','')}_{timestamp}.xlsx",
+            "datos": datos,
+            "ruta": bkp_path,
+            "filas_cambiadas": productos["filas_cambiadas"],
+        },
+    }
+
+def _huella(modificados):
+    with tiempos.span("huella"):
+        h = hashlib.sha256()
+        for modo, df_mod, n_arc in modificados: h.update(f"{modo}|{n_arc}|{huella(df_mod)}\n".encode("utf-8"))
+        return h.hexdigest()
+
+def _encolar_correo(resultados, resumen, timestamp):
+    cuerpo = f"Reporte de cambios - {timestamp}\n\n"
+    for modo, r in resultados:
+        cuerpo += f"📌 ENTORNO {modo.upper()}:\n"
+        cuerpo += reporte_cambios.resumen_texto(r["cambios"]) + "\n\n"
+
+    # Notificación Correo: queda en el outbox y la envía el worker en segundo plano
+    with tiempos.span("correo.payload"):
+        cuerpo, adjuntos = payload_correo.preparar_payload(cuerpo, [r["correo"] for _, r in resultados], f"Masterfile_Sutel_{timestamp}.zip")
+        # El cuerpo lleva un resumen acotado; si no alcanza, el detalle va como reporte adjunto
+        adjuntos += reporte_cambios.adjuntos_reporte(resumen, timestamp)
+    with tiempos.span("correo.outbox"):
+        return correo.encolar_correo("Masterfile Sutel", cuerpo + "\nSaludos.", adjuntos)
+
+def guardar_masterfiles(modificados, clave=None, huella=None):
+    # modificados: lista de (modo, df_modificado, nombre_archivo).
+    # clave: clave de idempotencia del guardado (ver transaccion.py); con la misma
+    # clave y los mismos datos, un reintento retoma desde el primer paso incompleto.
+    # huella: identifica los datos del guardado entre intentos. La interfaz pasa la de
+    # sus deltas (cambios.huella_deltas): tras una sobrescritura la base ya es la versión
+    # nueva y la huella de los DataFrames cambiaría. Sin huella se calcula de los DataFrames.
+    # Devuelve {modo: conjunto de cambios (DataFrame, ver cambios.conjunto_cambios)}.
+    tx = transaccion.abrir(clave, huella or _huella(modificados))
+    timestamp = tx.dato("timestamp", lambda: datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%Y%m%d_%H%M%S"))
+    with ThreadPoolExecutor(max(1, min(len(modificados), carga.MAX_HILOS_CARGA)), thread_name_prefix="guardado") as pool:
+        futuros = [(modo, pool.submit(tiempos.propagar(_guardar_masterfile), tx, modo, df_mod, n_arc, timestamp)) for modo, df_mod, n_arc in modificados]
+        resultados = [(modo, f.result()) for modo, f in futuros]
+
+    resumen = {modo: r["cambios"] for modo, r in resultados}
+    tx.paso("catalogo", lambda: catalogo_backups.registrar_backups([r["backup"] for _, r in resultados]))
+    # El contador de envíos lo actualiza el worker del outbox al enviar (ver correo.py)
+    tx.paso("correo", lambda: _encolar_correo(resultados, resumen, timestamp))
+    tx.terminar()
+    return resumen
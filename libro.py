@@ -0,0 +1,295 @@
+# ==============================================================
+# Libros con varias hojas
+# - hojas(): nombres de las hojas leyendo solo xl/workbook.xml
+#   (sin parsear ninguna hoja)
+# - reemplazar_hojas(): reescribe las hojas editadas dentro del
+#   libro original y copia el resto de las partes tal cual, así
+#   las hojas que nadie abrió no se parsean ni se pierden al guardar
+# - libro_por_partes(): libro nuevo de una hoja escrito por tramos
+#   de filas, entregado como un generador de bytes (exportación)
+#
+# Las hojas reescritas usan cadenas en línea (inlineStr), así no
+# dependen de la tabla de cadenas compartidas del libro original;
+# las fechas usan un estilo de fecha que se agrega a styles.xml.
+# De la hoja original se reemplaza solo <sheetData>: anchos de
+# columna, formato condicional, tablas, dibujos, etc. se conservan.
+# ==============================================================
+
+import re
+import math
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL_DOC = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_REL_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+WORKBOOK = "xl/workbook.xml"
+WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+ESTILOS = "xl/styles.xml"
+CALC_CHAIN = "xl/calcChain.xml"
+
+FORMATO_FECHA = 22      # formato integrado "m/d/yy h:mm"
+_EPOCA = pd.Timestamp("1899-12-30")
+_RE_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# ========= Estructura del libro =========
+def _hojas_y_partes(zf):
+    # [(nombre de la hoja, parte del zip con su XML)] en el orden del libro
+    libro = ET.fromstring(zf.read(WORKBOOK))
+    rels = ET.fromstring(zf.read(WORKBOOK_RELS))
+    destinos = {r.get("Id"): r.get("Target") for r in rels.iter(f"{{{NS_REL_PKG}}}Relationship")}
+    out = []
+    for hoja in libro.iter(f"{{{NS_MAIN}}}sheet"):
+        destino = destinos[hoja.get(f"{{{NS_REL_DOC}}}id")]
+        parte = destino.lstrip("/") if destino.startswith("/") else posixpath.normpath(posixpath.join("xl", destino))
+        out.append((hoja.get("name"), parte))
+    return out
+
+def hojas(archivo):
+    # archivo: ruta, bytes-like o file-like del .xlsx
+    with zipfile.ZipFile(_abrir(archivo)) as zf:
+        return [nombre for nombre, _ in _hojas_y_partes(zf)]
+
+def _abrir(archivo):
+    return BytesIO(archivo) if isinstance(archivo, (bytes, bytearray, memoryview)) else archivo
+
+# ========= XML de una hoja =========
+def _columna(i):
+    letras = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        letras = chr(65 + r) + letras
+    return letras
+
+def _texto(v):
+    v = _RE_CONTROL.sub("", v).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return f' t="inlineStr"><is><t xml:space="preserve">{v}</t></is></c>'
+
+def _celda(v, estilo_fecha):
+    # Resto de la celda (después de r="A1") o None si va vacía
+    if v is None or v is pd.NA or v is pd.NaT: return None
+    if isinstance(v, str): return _texto(v) if v else None
+    if isinstance(v, (bool, np.bool_)): return f' t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, np.integer)): return f"><v>{int(v)}</v></c>"
+    if isinstance(v, (float, np.floating)): return f"><v>{float(v)!r}</v></c>" if math.isfinite(v) else None
+    if isinstance(v, (datetime, date, np.datetime64)):
+        serial = (pd.Timestamp(v).tz_localize(None) - _EPOCA) / pd.Timedelta(days=1)
+        return f' s="{estilo_fecha}"><v>{serial!r}</v></c>'
+    return _texto(str(v))
+
+def _encabezado_xml(columnas):
+    letras = [_columna(j) for j in range(len(columnas))]
+    return '<row r="1">' + "".join(f'<c r="{l}1"{_texto(str(c))}' for l, c in zip(letras, columnas)) + "</row>"
+
+def _filas_xml(df, estilo_fecha, desde=2):
+    # Una fila <row> por registro, numeradas desde `desde`
+    letras = [_columna(j) for j in range(len(df.columns))]
+    columnas = []
+    for l, c in zip(letras, df.columns):
+        columnas.append([
+            None if resto is None else f'<c r="{l}{i}"{resto}'
+            for i, resto in enumerate((_celda(v, estilo_fecha) for v in df[c].tolist()), start=desde)
+        ])
+    for i, celdas in enumerate(zip(*columnas), start=desde):
+        yield f'<row r="{i}">' + "".join(c for c in celdas if c is not None) + "</row>"
+
+_INICIO_HOJA = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{NS_MAIN}"><sheetData>'
+_FIN_HOJA = "</sheetData></worksheet>"
+
+# ========= Hoja reescrita dentro del libro original =========
+BLOQUE_LECTURA = 1024 * 1024
+_RE_DATOS_INICIO = re.compile(rb"<(\w+:)?sheetData\b[^>]*?(/?)>")
+_RE_DATOS_FIN = re.compile(rb"</(\w+:)?sheetData>")
+_RE_DIMENSION = re.compile(r"<(\w+:)?dimension\b[^>]*/>")
+
+def _marco_hoja(zf, parte):
+    # (XML antes de <sheetData>, XML después de </sheetData>, prefijo del espacio de
+    # nombres) de la hoja original. Se lee por bloques: las filas se descartan sin
+    # cargarlas enteras en memoria.
+    with zf.open(parte) as f:
+        buf = b""
+        while (m := _RE_DATOS_INICIO.search(buf)) is None:
+            bloque = f.read(BLOQUE_LECTURA)
+            if not bloque: raise ValueError(f"{parte} no tiene <sheetData>")
+            buf += bloque
+        inicio, prefijo, buf = buf[:m.start()], (m.group(1) or b"").decode(), buf[m.end():]
+        if not m.group(2):
+            while (fin := _RE_DATOS_FIN.search(buf)) is None:
+                bloque = f.read(BLOQUE_LECTURA)
+                if not bloque: raise ValueError(f"{parte} no cierra <sheetData>")
+                buf = buf[-32:] + bloque   # una etiqueta de cierre puede quedar partida entre bloques
+            buf = buf[fin.end():]
+        resto = buf + f.read()
+    # La dimensión declarada es la de los datos anteriores; es opcional y Excel la recalcula
+    return _RE_DIMENSION.sub("", inicio.decode("utf-8")), resto.decode("utf-8"), prefijo
+
+def _xml_hoja(df, estilo_fecha, marco):
+    # Genera el XML por partes: marco original + encabezado + una fila por registro
+    inicio, fin, prefijo = marco
+    yield inicio
+    # Las filas se escriben sin prefijo: si la hoja usa uno para el espacio de nombres
+    # principal, sheetData declara ese espacio como predeterminado
+    yield f'<{prefijo}sheetData xmlns="{NS_MAIN}">' if prefijo else "<sheetData>"
+    yield _encabezado_xml(df.columns)
+    yield from _filas_xml(df, estilo_fecha)
+    yield f"</{prefijo}sheetData>"
+    yield fin
+
+# ========= Partes que cambian junto con las hojas =========
+def _agregar_estilo_fecha(estilos):
+    # Agrega un xf con formato de fecha al final de cellXfs; devuelve (xml, índice)
+    texto = estilos.decode("utf-8")
+    apertura = re.search(r"<(\w+:)?cellXfs\b[^>]*>", texto)
+    cierre = re.search(r"</(\w+:)?cellXfs>", texto)
+    prefijo = apertura.group(1) or ""
+    indice = len(re.findall(rf"<{re.escape(prefijo)}xf\b", texto[apertura.end():cierre.start()]))
+    xf = f'<{prefijo}xf numFmtId="{FORMATO_FECHA}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    nueva_apertura = re.sub(r'count="\d+"', f'count="{indice + 1}"', apertura.group(0))
+    texto = texto[:apertura.start()] + nueva_apertura + texto[apertura.end():cierre.start()] + xf + texto[cierre.start():]
+    return texto.encode("utf-8"), indice
+
+def _sin_calc_chain(xml):
+    # calcChain referencia celdas de las hojas reescritas: se quita y Excel lo regenera
+    return re.sub(rb"<(\w+:)?(Override|Relationship)\b[^>]*calcChain[^>]*/>", b"", xml)
+
+def _rels(parte):
+    carpeta, nombre = posixpath.split(parte)
+    return posixpath.join(carpeta, "_rels", f"{nombre}.rels")
+
+def _tablas(zf, parte):
+    # Partes de las tablas (ListObjects) de una hoja, según sus relaciones
+    rels = _rels(parte)
+    if rels not in zf.namelist(): return []
+    carpeta = posixpath.dirname(parte)
+    return [
+        r.get("Target").lstrip("/") if r.get("Target").startswith("/") else posixpath.normpath(posixpath.join(carpeta, r.get("Target")))
+        for r in ET.fromstring(zf.read(rels)).iter(f"{{{NS_REL_PKG}}}Relationship")
+        if r.get("Type", "").endswith("/table")
+    ]
+
+def _ajustar_tabla(xml, df):
+    # Una tabla anclada en A1 con las mismas columnas pasa a cubrir las filas nuevas
+    # (ref de la tabla y de su autofiltro); cualquier otra se deja como estaba
+    texto = xml.decode("utf-8")
+    m = re.search(r'<(\w+:)?table\b[^>]*?\sref="A1:([A-Z]+)\d+"', texto)
+    if m is None or m.group(2) != _columna(len(df.columns) - 1): return xml
+    ref = f"A1:{m.group(2)}{len(df) + 1}"
+    texto = re.sub(r'(<(\w+:)?(table|autoFilter)\b[^>]*?\sref=")A1:[A-Z]+\d+"', rf'\g<1>{ref}"', texto, count=2)
+    return texto.encode("utf-8")
+
+# ========= Reescritura =========
+def reemplazar_hojas(original, nuevas):
+    # original: .xlsx (bytes-like o file-like); nuevas: {nombre de hoja: DataFrame}.
+    # Devuelve el libro nuevo como memoryview de solo lectura.
+    salida = BytesIO()
+    with zipfile.ZipFile(_abrir(original)) as zin:
+        partes = {nombre: parte for nombre, parte in _hojas_y_partes(zin)}
+        faltantes = [h for h in nuevas if h not in partes]
+        if faltantes: raise KeyError(f"Hojas que no existen en el libro: {faltantes}")
+        reescritas = {partes[h]: df for h, df in nuevas.items()}
+        tablas = {t: df for parte, df in reescritas.items() for t in _tablas(zin, parte)}
+        estilos, estilo_fecha = _agregar_estilo_fecha(zin.read(ESTILOS)) if ESTILOS in zin.namelist() else (None, 0)
+
+        with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename == CALC_CHAIN: continue
+                if info.filename in reescritas:
+                    nueva = zipfile.ZipInfo(info.filename, info.date_time)
+                    nueva.compress_type = zipfile.ZIP_DEFLATED
+                    marco = _marco_hoja(zin, info.filename)
+                    with zout.open(nueva, "w") as destino:
+                        for parte in _xml_hoja(reescritas[info.filename], estilo_fecha, marco):
+                            destino.write(parte.encode("utf-8"))
+                elif info.filename in tablas:
+                    zout.writestr(info, _ajustar_tabla(zin.read(info.filename), tablas[info.filename]))
+                elif info.filename == ESTILOS and estilos is not None:
+                    zout.writestr(info, estilos)
+                elif info.filename in ("[Content_Types].xml", WORKBOOK_RELS):
+                    zout.writestr(info, _sin_calc_chain(zin.read(info.filename)))
+                else:
+                    zout.writestr(info, zin.read(info.filename))
+    return salida.getbuffer().toreadonly()
+
+# ========= Libro nuevo por partes =========
+_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_TIPO_DOC = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_CT = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+_ESTILO_FECHA_NUEVO = 1
+
+def _partes_fijas(nombre_hoja):
+    nombre = nombre_hoja.replace("&", "&amp;").replace('"', "&quot;").replace("<", "&lt;")
+    return {
+        "[Content_Types].xml": _XML + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{_CT}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{_CT}.worksheet+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{_CT}.styles+xml"/></Types>',
+        "_rels/.rels": _XML + f'<Relationships xmlns="{NS_REL_PKG}">'
+            f'<Relationship Id="rId1" Type="{_TIPO_DOC}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        WORKBOOK: _XML + f'<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL_DOC}">'
+            f'<sheets><sheet name="{nombre}" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        WORKBOOK_RELS: _XML + f'<Relationships xmlns="{NS_REL_PKG}">'
+            f'<Relationship Id="rId1" Type="{_TIPO_DOC}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{_TIPO_DOC}/styles" Target="styles.xml"/></Relationships>',
+        ESTILOS: _XML + f'<styleSheet xmlns="{NS_MAIN}">'
+            '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            f'<xf numFmtId="{FORMATO_FECHA}" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>',
+    }
+
+class SalidaPorPartes:
+    # Destino de solo escritura (no posicionable): acumula lo escrito hasta que
+    # el generador lo entrega con vaciar(). zipfile y pyarrow escriben en él en
+    # modo streaming.
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(self._partes[-1])
+        return len(self._partes[-1])
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes.clear()
+        return datos
+
+def libro_por_partes(tramos, nombre_hoja="Datos"):
+    # tramos: DataFrames consecutivos con las mismas columnas (el primero define el
+    # encabezado). Entrega el .xlsx en bloques de bytes a medida que escribe cada tramo.
+    salida = SalidaPorPartes()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        for nombre, xml in _partes_fijas(nombre_hoja).items():
+            zout.writestr(nombre, xml)
+        with zout.open("xl/worksheets/sheet1.xml", "w") as hoja:
+            hoja.write(_INICIO_HOJA.encode("utf-8"))
+            fila = 2
+            for i, tramo in enumerate(tramos):
+                if i == 0: hoja.write(_encabezado_xml(tramo.columns).encode("utf-8"))
+                for xml in _filas_xml(tramo, _ESTILO_FECHA_NUEVO, fila):
+                    hoja.write(xml.encode("utf-8"))
+                fila += len(tramo)
+                yield salida.vaciar()
+            hoja.write(_FIN_HOJA.encode("utf-8"))
+    yield salida.vaciar()
@@ -7,15 +7,20 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import time
-from io import BytesIO
 from datetime import datetime
-from zoneinfo import ZoneInfo
-import smtplib
-from email.message import EmailMessage
-import requests
-import msal
-from config import get_secret
+import zlib
+from opciones import get_secret_opcional
+from cambios import ROWKEY, huella_deltas
+from registro import ARCHIVOS, masterfile
+from filtros import opciones_filtro, aplicar_filtros
+import carga
+import exportacion
+import vigilancia
+import esquema
+import correo
+import tiempos
+import perfilado
+import parche
 
 # ------ Configuración de vista ----------
 st.set_page_config(
@@ -23,6 +28,8 @@ st.set_page_config(
     page_icon="📋",
     layout="wide"
 )
+tiempos.iniciar_rerun()
+perfilado.iniciar_rerun()
 
 st.markdown("""
 <div style="background: linear-gradient(90deg,#0f2027,#203a43,#2c5364); padding: 18px 24px; border-radius: 12px; margin-bottom: 10px;">
@@ -32,175 +39,143 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ================== CONFIGURACIÓN ==================
-TENANT_ID = get_secret("tenant_id")
-CLIENT_ID = get_secret("client_id")
-CLIENT_SECRET = get_secret("client_secret")
-
-SITE_HOST = "caseonit.sharepoint.com"
-SITE_NAME = "Sutel"
-FOLDER_PATH = "01. Documentos MedUX/Automatizacion/Masterfile"
-
-ARCHIVOS = {
-    "Fijo": "MasterfileSutel.xlsx",
-    "Movilidad": "MasterfileSutel_Movilidad.xlsx"
-}
-
-SMTP_SERVER = get_secret("smtp_server")
-SMTP_PORT = get_secret("smtp_port")
-SMTP_USER = get_secret("smtp_user")
-SMTP_PASS = get_secret("smtp_pass")
-EMAIL_FROM = get_secret("email_from")
-EMAIL_TO = get_secret("email_to")
-
-ID_COL = "ID SONDA"
-ROWKEY = "_row_id"
-
-# ========= Autenticación y Graph API =========
-@st.cache_data(ttl=3000)
-def get_access_token_cached():
-    app = msal.ConfidentialClientApplication(CLIENT_ID, authority=f"https://login.microsoftonline.com/{TENANT_ID}", client_credential=CLIENT_SECRET)
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-    if "access_token" not in result: raise Exception(f"Error Token: {result}")
-    return result["access_token"]
-
-
-@st.cache_data(ttl=3600)
-def get_site_drive_cached():
-    token = get_access_token_cached()
-    headers = {"Authorization": f"Bearer {token}"}
-    r_sites = requests.get(f"https://graph.microsoft.com/v1.0/sites?search={SITE_NAME}", headers=headers)
-    sites = r_sites.json().get("value", [])
-    if not sites:
-        raise Exception(f"No se encontro ningun sitio para '{SITE_NAME}': {r_sites.status_code} {r_sites.text[:300]}")
-
-    # Coincidencia EXACTA por nombre -- "Sutel" es substring de "ProyectoSUTEL"
-    # y "ProyectoSUTEL-MEDUX2024", asi que un "in"/substring agarra el sitio
-    # equivocado (ese era el bug: siempre caia en ProyectoSUTEL-MEDUX2024).
-    site = next(
-        (s for s in sites if s.get("name", "").strip().lower() == SITE_NAME.strip().lower()),
-        None,
-    )
-    if site is None:
-        raise Exception(
-            f"No se encontro un sitio con nombre EXACTO '{SITE_NAME}'. "
-            f"Candidatos encontrados: {[s.get('name') for s in sites]}"
-        )
-
-    r_drives = requests.get(f"https://graph.microsoft.com/v1.0/sites/{site['id']}/drives", headers=headers)
-    drives = r_drives.json().get("value", [])
-    if not drives:
-        raise Exception(f"El sitio '{site.get('webUrl')}' no tiene drives: {r_drives.status_code} {r_drives.text[:300]}")
-    drive = next((d for d in drives if d.get("name", "").lower() in ("documents", "documentos")), drives[0])
-    return site["id"], drive["id"]
-
-def get_file_from_sharepoint(path):
-    token = get_access_token_cached()
-    s_id, d_id = get_site_drive_cached()
-    url = f"https://graph.microsoft.com/v1.0/sites/{s_id}/drives/{d_id}/root:/{path}:/content"
-    resp = requests.get(url, headers={"Authorization": f"Bearer {token}"})
-    if resp.status_code != 200:
-        raise Exception(f"Error descarga {path} — HTTP {resp.status_code}: {resp.text[:500]}")
-    return BytesIO(resp.content)
-
-
-def upload_file_to_sharepoint(path, file_bytes):
-    token = get_access_token_cached()
-    s_id, d_id = get_site_drive_cached()
-    url = f"https://graph.microsoft.com/v1.0/sites/{s_id}/drives/{d_id}/root:/{path}:/content"
-    resp = requests.put(url, headers={"Authorization": f"Bearer {token}"}, data=file_bytes.getvalue())
-    if resp.status_code not in (200, 201): raise Exception(f"Error subida {path}")
-
-def ensure_folder(path):
-    token = get_access_token_cached()
-    s_id, d_id = get_site_drive_cached()
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    parts = path.split('/')
-    current_path = ""
-    for part in parts:
-        parent = current_path
-        current_path = f"{current_path}/{part}" if current_path else part
-        url = f"https://graph.microsoft.com/v1.0/sites/{s_id}/drives/{d_id}/root:/{current_path}"
-        if requests.get(url, headers=headers).status_code != 200:
-            c_url = f"https://graph.microsoft.com/v1.0/sites/{s_id}/drives/{d_id}/root{':/'+parent+':' if parent else ''}/children"
-            requests.post(c_url, headers=headers, json={"name": part, "folder": {}})
-
-# ========= Lógica de Correo y Contador =========
-def enviar_correo_con_adjuntos(asunto, cuerpo, archivos_adjuntos):
-    msg = EmailMessage()
-    msg["Subject"], msg["From"], msg["To"] = asunto, EMAIL_FROM, EMAIL_TO
-    msg.set_content(cuerpo)
-    for f_bytes, f_name in archivos_adjuntos:
-        msg.add_attachment(f_bytes.getvalue(), maintype="application", subtype="vnd.openxmlformats-officedocument.spreadsheetml.sheet", filename=f_name)
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as smtp:
-        smtp.starttls()
-        smtp.login(SMTP_USER, SMTP_PASS)
-        smtp.send_message(msg)
-
-def _leer_contador_hoy():
-    fecha_hoy = datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%d%m%Y")
-    try:
-        stream = get_file_from_sharepoint(f"{FOLDER_PATH}/contador_envios.txt")
-        f_guardada, cnt = stream.read().decode("utf-8").strip().split(",")
-        return (fecha_hoy, int(cnt)) if f_guardada == fecha_hoy else (fecha_hoy, 0)
-    except: return fecha_hoy, 0
-
-def _guardar_contador_hoy(fecha, nuevo_cnt):
-    upload_file_to_sharepoint(f"{FOLDER_PATH}/contador_envios.txt", BytesIO(f"{fecha},{nuevo_cnt}".encode("utf-8")))
-
-# ========= Detección de Cambios =========
-def normalize_val(v):
-    if v is None or (isinstance(v, float) and np.isnan(v)): return ""
-    return str(v).strip()
-
-def detectar_cambios(df_orig, df_mod, tipo):
-    cambios = []
-    # Aseguramos que ambos tengan el mismo index por ROWKEY para comparar fila a fila correctamente
-    df_o = df_orig.set_index(ROWKEY)
-    df_m = df_mod.set_index(ROWKEY)
-    
-    comunes = df_o.index.intersection(df_m.index)
-    cols = [c for c in df_o.columns if c in df_m.columns]
-
-    for idx in comunes:
-        row_o = df_o.loc[idx]
-        row_m = df_m.loc[idx]
-        for c in cols:
-            val_o = normalize_val(row_o[c])
-            val_m = normalize_val(row_m[c])
-            if val_o != val_m:
-                ident = f"ID {row_o[ID_COL]}" if ID_COL in row_o else f"Fila {idx}"
-                if "Stm" in row_o: ident = f"Stm {row_o['Stm']}"
-                cambios.append(f"{ident}: {c} de '{val_o}' → '{val_m}'")
-    return cambios
+# Masterfiles: ver registro.py (configurable desde secrets)
+FILAS_POR_PAGINA = int(get_secret_opcional("filas_por_pagina", 100))
+OPCIONES_FILAS_PAGINA = sorted({50, 100, 250, 500, FILAS_POR_PAGINA})
+
+# Solo la vista activa se descarga y renderiza (st.tabs ejecuta todas las pestañas)
+VISTAS = {**{f"📄 Masterfile {modo}": modo for modo in ARCHIVOS}, "🕓 Historial de versiones": None}
+# Widgets por masterfile cuyo valor debe sobrevivir mientras su vista no se renderiza
+PREFIJOS_ESTADO_VISTA = ("selector_cols_", "filter_", "orden_", "desc_", "tam_", "pag_", "hoja_", "exportar_")
+
+def _conservar_estado_vistas():
+    # Streamlit descarta el estado de los widgets que no se dibujan en un rerun;
+    # reasignarlo lo convierte en estado propio de la sesión y lo conserva
+    for k in list(st.session_state.keys()):
+        if k.startswith(PREFIJOS_ESTADO_VISTA): st.session_state[k] = st.session_state[k]
+
+# ========= Edición paginada =========
+def _deltas(nombre_modo):
+    # {clave de fila: {columna: valor}} con las ediciones pendientes de guardar.
+    # La clave es la del registro (p. ej. ID SONDA, ver carga.claves_filas) y no la
+    # posición: si otra sesión inserta o borra filas, la edición sigue en su fila.
+    return st.session_state.setdefault(f"deltas_{nombre_modo}", {})
+
+def _deltas_vigentes(nombre_modo, nombre_archivo, etag):
+    # (ediciones pendientes, claves de fila de la versión vigente); las ediciones de
+    # filas que ya no existen se descartan con un aviso
+    claves = carga.claves_masterfile(nombre_modo, nombre_archivo, etag)
+    deltas = _deltas(nombre_modo)
+    huerfanas = carga.descartar_huerfanas(deltas, claves)
+    if huerfanas:
+        st.warning(f"⚠️ {len(huerfanas)} filas con ediciones pendientes ya no existen en {nombre_archivo} "
+                   f"(otro usuario las eliminó); sus ediciones se descartaron: {', '.join(map(str, huerfanas[:10]))}")
+    return deltas, claves
+
+def _avisar_nueva_version(nombre_modo, etag, deltas):
+    # Otra sesión guardó este Masterfile: las ediciones pendientes siguen
+    # vigentes y se aplican sobre la nueva versión
+    key = f"base_{nombre_modo}"
+    if deltas and st.session_state.get(key) not in (None, etag):
+        st.warning("⚠️ Otro usuario guardó una versión nueva de este Masterfile. Sus ediciones pendientes se aplican sobre ella; revíselas antes de guardar.")
+    st.session_state[key] = etag
+
+def _registrar_ediciones(ventana, editado, deltas, claves):
+    # ROWKEY es la posición de la fila en la base (cambios.asignar_rowkey): de ahí su clave
+    iguales = (editado == ventana).astype("boolean").fillna(False) | (editado.isna() & ventana.isna())
+    distintas = ~iguales.astype(bool)
+    nuevos = {}
+    for i, c in zip(*np.nonzero(distintas.to_numpy())):
+        rid, col = ventana.iat[i, ventana.columns.get_loc(ROWKEY)], ventana.columns[c]
+        nuevos.setdefault(claves[int(rid)], {})[col] = editado.iat[i, c]
+    for rid, cols in nuevos.items():
+        deltas.setdefault(rid, {}).update(cols)
+    return nuevos
+
+def _controles_pagina(nombre_modo, df_filtrado):
+    columnas = [c for c in df_filtrado.columns if c != ROWKEY]
+    c_orden, c_dir, c_tam, c_pag = st.columns([3, 1, 1, 1])
+    with c_orden: orden = st.selectbox("Ordenar por", ["(orden original)"] + columnas, key=f"orden_{nombre_modo}")
+    with c_dir: descendente = st.toggle("Descendente", key=f"desc_{nombre_modo}")
+    st.session_state.setdefault(f"tam_{nombre_modo}", FILAS_POR_PAGINA)
+    with c_tam: tam = st.selectbox("Filas por página", OPCIONES_FILAS_PAGINA, key=f"tam_{nombre_modo}")
+    n_paginas = max(1, -(-len(df_filtrado) // tam))
+    key_pag = f"pag_{nombre_modo}"
+    if st.session_state.get(key_pag, 1) > n_paginas: st.session_state[key_pag] = n_paginas
+    with c_pag: pagina = st.number_input(f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, step=1, key=key_pag)
+
+    # Se ordenan solo posiciones; el dataframe completo nunca se copia ni se serializa
+    if orden == "(orden original)": posiciones = np.arange(len(df_filtrado))
+    else: posiciones = df_filtrado[orden].reset_index(drop=True).sort_values(kind="stable", na_position="last").index.to_numpy()
+    if descendente: posiciones = posiciones[::-1]
+    ini = (pagina - 1) * tam
+    ventana = df_filtrado.iloc[posiciones[ini:ini + tam]]
+    st.caption(f"Mostrando filas {min(ini + 1, len(df_filtrado))}–{ini + len(ventana)} de {len(df_filtrado)}")
+    return ventana
+
+# ========= Importación masiva =========
+MAX_CAMBIOS_VISTA_PREVIA = 500
+
+def _importar_parche(nombre_modo, df, tipos, claves):
+    # Un archivo de cambios se aplica en un solo paso como deltas de la sesión
+    with st.expander(f"📥 Importar cambios masivos - {nombre_modo}"):
+        if st.session_state.get(f"parche_ok_{nombre_modo}"):
+            st.success(f"✅ {st.session_state.pop(f'parche_ok_{nombre_modo}')} cambios aplicados. Revíselos y guarde para publicarlos.")
+        st.caption(f"CSV o XLSX con la columna `{masterfile(nombre_modo)['clave']}` (o `{ROWKEY}`) y solo las columnas a modificar. Las celdas vacías no modifican nada.")
+        n = st.session_state.get(f"parche_n_{nombre_modo}", 0)
+        archivo = st.file_uploader("Archivo de cambios", type=["csv", "xlsx"], key=f"parche_{nombre_modo}_{n}")
+        if archivo is None: return
+        omitir = st.checkbox("Omitir claves que no existen en el Masterfile", key=f"parche_omitir_{nombre_modo}")
+        try:
+            df_mod, faltantes = parche.aplicar_parche(df, tipos, parche.leer_parche(archivo.getvalue(), archivo.name),
+                                                     ignorar_faltantes=omitir, modo=nombre_modo)
+        except parche.ErrorParche as e:
+            st.error(f"❌ {e}")
+            return
+        nuevos = parche.deltas(df, df_mod)
+        lista_cambios = parche.cambios_parche(df, df_mod, nombre_modo, nuevos)
+
+        st.markdown(f"**Cambios a aplicar:** {len(lista_cambios)} en {len(nuevos)} filas")
+        if faltantes: st.warning(f"⚠️ {len(faltantes)} claves omitidas (no existen): {', '.join(map(str, faltantes[:10]))}")
+        if not lista_cambios: return
+        st.text("\n".join(f"• {c}" for c in lista_cambios[:MAX_CAMBIOS_VISTA_PREVIA])
+                + (f"\n… y {len(lista_cambios) - MAX_CAMBIOS_VISTA_PREVIA} más" if len(lista_cambios) > MAX_CAMBIOS_VISTA_PREVIA else ""))
+        if st.button("✅ Aplicar cambios", key=f"parche_aplicar_{nombre_modo}"):
+            deltas = _deltas(nombre_modo)
+            for rid, cols in nuevos.items(): deltas.setdefault(claves[int(rid)], {}).update(cols)
+            st.session_state[f"parche_n_{nombre_modo}"] = n + 1   # vacía el uploader
+            st.session_state[f"parche_ok_{nombre_modo}"] = len(lista_cambios)
+            st.rerun()
 
 # ========= Manejo de Archivo y Filtros =========
 def manejar_archivo(nombre_modo, nombre_archivo):
-    # 1. Carga de datos
-    file_stream = get_file_from_sharepoint(f"{FOLDER_PATH}/{nombre_archivo}")
-    contenido_binario = file_stream.getvalue()
-    
-    df = pd.read_excel(file_stream).fillna('')
-    df = df.astype(object)
-    df[ROWKEY] = np.arange(len(df)).astype(str)
+    # 1. Carga de datos (tipada y compartida por versión entre sesiones; ver carga.py).
+    # La sesión solo aporta sus deltas sobre la base compartida.
+    contenido_binario, df_base, tipos, etag = carga.cargar_masterfile(nombre_modo, nombre_archivo)
+    deltas, claves = _deltas_vigentes(nombre_modo, nombre_archivo, etag)
+    _avisar_nueva_version(nombre_modo, etag, deltas)
+    df = carga.con_deltas(df_base, deltas, claves)
 
     # --- DISEÑO SUPERIOR ---
     col_msg, col_btn = st.columns([3, 1])
     with col_msg: st.success(f"📂 {nombre_archivo} cargado.")
-    with col_btn: st.download_button("Descargar Excel", data=contenido_binario, file_name=nombre_archivo, key=f"dl_{nombre_modo}")
+    with col_btn: st.download_button("Descargar Excel", data=contenido_binario.leer, file_name=nombre_archivo, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key=f"dl_{nombre_modo}")
+
+    _importar_parche(nombre_modo, df, tipos, claves)
 
     # --- SECCIÓN DE FILTROS DINÁMICOS ---
     with st.expander(f"🔍 Panel de Filtros Personalizados - {nombre_modo}", expanded=True):
         # Permitimos al usuario elegir qué columnas quiere usar para filtrar
         columnas_disponibles = [c for c in df.columns if c != ROWKEY]
+        # El valor inicial va en session_state (y no en default=) porque se conserva al cambiar de vista
+        st.session_state.setdefault(f"selector_cols_{nombre_modo}", columnas_disponibles[:3] if len(columnas_disponibles) > 3 else columnas_disponibles)
         cols_a_filtrar = st.multiselect(
             "Selecciona las columnas por las que deseas filtrar:",
             options=columnas_disponibles,
-            default=columnas_disponibles[:3] if len(columnas_disponibles) > 3 else columnas_disponibles,
             key=f"selector_cols_{nombre_modo}"
         )
 
-        df_filtrado = df.copy()
-        
+        filtros = {}
         if cols_a_filtrar:
             # Creamos filas de 3 columnas para que los filtros no ocupen demasiado espacio vertical
             filas_filtros = [cols_a_filtrar[i:i + 3] for i in range(0, len(cols_a_filtrar), 3)]
@@ -208,75 +183,139 @@ def manejar_archivo(nombre_modo, nombre_archivo):
             for fila in filas_filtros:
                 st_cols = st.columns(len(fila))
                 for i, col_name in enumerate(fila):
-                    opciones = sorted([str(x) for x in df[col_name].unique() if str(x).strip() != ''])
-                    seleccion = st_cols[i].multiselect(
+                    filtros[col_name] = st_cols[i].multiselect(
                         f"Filtrar {col_name}", 
-                        options=opciones, 
+                        options=opciones_filtro(df, col_name), 
                         key=f"filter_{nombre_modo}_{col_name}"
                     )
-                    if seleccion:
-                        df_filtrado = df_filtrado[df_filtrado[col_name].astype(str).isin(seleccion)]
+        with tiempos.span("filtros"):
+            df_filtrado = aplicar_filtros(df, filtros)
 
     st.markdown(f"**Registros encontrados:** {len(df_filtrado)}")
 
-    # --- TABLA EDITABLE ---
-    df_editado_vista = st.data_editor(
-        df_filtrado,
-        hide_index=True,
-        column_config={ROWKEY: None},
-        use_container_width=True,
-        height=500,
-        key=f"ed_{nombre_modo}"
-    )
+    # --- TABLA EDITABLE (solo se serializa la página visible) ---
+    with tiempos.span("paginacion"):
+        ventana = _controles_pagina(nombre_modo, df_filtrado)
+    with tiempos.span("editor"):
+        df_editado_vista = st.data_editor(
+            ventana,
+            hide_index=True,
+            column_config=esquema.column_config(tipos),
+            use_container_width=True,
+            height=500,
+            # Un estado de edición por página y por versión base: tras un cambio remoto la
+            # misma ventana de posiciones puede mostrar otras filas, y el editor no debe
+            # reaplicar sobre ellas lo editado en la versión anterior
+            key=f"ed_{nombre_modo}_{zlib.crc32('|'.join([etag, *ventana[ROWKEY]]).encode())}"
+        )
 
-    # Sincronización: Actualiza el dataframe original con los cambios hechos en la vista filtrada
-    if not df_editado_vista.equals(df_filtrado):
-        # Usamos el ROWKEY para asegurar que el cambio vaya a la fila correcta del original
-        df.set_index(ROWKEY, inplace=True)
-        df.update(df_editado_vista.set_index(ROWKEY))
-        df.reset_index(inplace=True)
-    
-    return df
+    # Sincronización: las ediciones de la página se guardan como deltas por clave de fila
+    # y se aplican al dataframe completo, así sobreviven a cambios de página/filtro
+    with tiempos.span("ediciones"):
+        nuevos = _registrar_ediciones(ventana, df_editado_vista, deltas, claves)
+        if nuevos: df = carga.con_deltas(df, nuevos, claves)
 
-    # --- TABLA EDITABLE ---
-    df_editado_vista = st.data_editor(
-        df_filtrado,
-        hide_index=True,
-        column_config={ROWKEY: None},
-        use_container_width=True,
-        height=500,
-        key=f"ed_{nombre_modo}"
-    )
-
-    # Sincronización de cambios
-    if not df_editado_vista.equals(df_filtrado):
-        df.set_index(ROWKEY, inplace=True)
-        df.update(df_editado_vista.set_index(ROWKEY))
-        df.reset_index(inplace=True)
-    
+    _exportar_vista(nombre_modo, nombre_archivo, df, df_filtrado, tipos, carga.numeros_masterfile(nombre_modo, nombre_archivo, etag))
+    _otras_hojas(nombre_modo, nombre_archivo, contenido_binario, etag)
     return df
-    # --- INTERFAZ ---
-    col_msg, col_btn = st.columns([3, 1])
-    with col_msg: st.info(f"📂 {nombre_archivo} | {len(df_filtrado)} filas filtradas.")
-    with col_btn:
-        st.download_button("Descargar Excel", data=contenido_binario, file_name=nombre_archivo, key=f"dl_{nombre_modo}")
 
-    df_editado_vista = st.data_editor(
-        df_filtrado,
+def _exportar_vista(nombre_modo, nombre_archivo, df, df_filtrado, tipos, numeros):
+    # Vista filtrada con las ediciones de la sesión; el archivo se genera por tramos
+    # solo al hacer clic (ver exportacion.py), sin copiar el dataframe completo
+    col_fmt, col_exp = st.columns([1, 3])
+    with col_fmt: formato = st.selectbox("Formato de exportación", list(exportacion.FORMATOS), key=f"exportar_{nombre_modo}", label_visibility="collapsed")
+    with col_exp:
+        st.download_button(f"Exportar vista ({len(df_filtrado)} filas)", data=exportacion.descarga_diferida(formato, df, df_filtrado, tipos, numeros),
+                           file_name=exportacion.nombre_exportacion(nombre_archivo, formato),
+                           mime=exportacion.FORMATOS[formato]["mime"], key=f"exp_{nombre_modo}")
+
+def _otras_hojas(nombre_modo, nombre_archivo, contenido_binario, etag):
+    # Hojas adicionales del libro: solo lectura, y se parsean solo al elegirlas.
+    # Al guardar se copian sin cambios (ver libro.py)
+    otras = contenido_binario.hojas()[1:]
+    if not otras: return
+    with st.expander(f"📑 Otras hojas del libro ({len(otras)})"):
+        st.caption("Solo lectura: se editan únicamente los datos del Masterfile; estas hojas se conservan tal cual al guardar.")
+        hoja = st.selectbox("Hoja", ["(ninguna)"] + otras, key=f"hoja_{nombre_modo}")
+        if hoja == "(ninguna)": return
+        with st.spinner(f"Leyendo hoja {hoja}..."):
+            df_hoja = carga.cargar_hoja(nombre_modo, nombre_archivo, etag, hoja)
+        st.dataframe(df_hoja, hide_index=True, use_container_width=True, height=400)
+
+def _dfs_con_deltas(modos):
+    # Masterfiles no visibles en este rerun: se cargan (en paralelo, caché por eTag) solo al guardar
+    cargados = carga.cargar_varios({modo: ARCHIVOS[modo] for modo in modos})
+    return {modo: carga.con_deltas(df, *_deltas_vigentes(modo, ARCHIVOS[modo], etag)) for modo, (_, df, _, etag) in cargados.items()}
+
+@st.fragment(run_every=vigilancia.INTERVALO if vigilancia.INTERVALO > 0 else None)
+def _aviso_cambios_remotos():
+    # Solo lee el mapa local de versiones (lo mantiene vigilancia.py): sin llamadas a Graph
+    for modo, n_arc in ARCHIVOS.items():
+        base, vigente = st.session_state.get(f"base_{modo}"), carga.etag_vigente(n_arc)
+        if base is None or vigente in (None, base) or st.session_state.get(f"avisado_{modo}") == vigente: continue
+        st.session_state[f"avisado_{modo}"] = vigente
+        st.toast(f"🔄 {n_arc} fue modificado por otro usuario. La vista se actualiza en la próxima interacción.")
+
+# ========= Historial de versiones (catálogo de backups) =========
+def _fecha_version(e):
+    return datetime.strptime(e["timestamp"], "%Y%m%d_%H%M%S").strftime("%d/%m/%Y %H:%M:%S")
+
+def _etiqueta_version(e):
+    filas = f"{e['filas']} filas" if e.get("filas") is not None else "filas ?"
+    return f"{_fecha_version(e)} · {filas}"
+
+def mostrar_historial():
+    import catalogo_backups   # diferido: solo lo usa esta vista
+    import reporte_cambios
+    col_modo, col_idx = st.columns([3, 1])
+    with col_modo: modo = st.selectbox("Masterfile", list(ARCHIVOS.keys()), key="hist_modo")
+    with col_idx:
+        if st.button("🔄 Reconstruir índice", key="hist_reindex", use_container_width=True):
+            with st.spinner("Indexando backups existentes..."):
+                nuevos = catalogo_backups.reconstruir_catalogo(ARCHIVOS)
+            st.info(f"{nuevos} backups agregados al catálogo.")
+
+    entradas = catalogo_backups.versiones(modo)
+    if not entradas:
+        st.info("No hay backups registrados en el catálogo para este masterfile.")
+        return
+
+    st.dataframe(
+        pd.DataFrame([{
+            "Fecha": _fecha_version(e),
+            "Tamaño (KB)": round(e["size"] / 1024, 1) if e.get("size") else None,
+            "Filas": e.get("filas"),
+            "Cambios": e.get("n_cambios"),
+            "Resumen": " | ".join(e.get("muestra_cambios") or []),
+            "eTag": e.get("eTag"),
+        } for e in entradas]),
         hide_index=True,
-        column_config={ROWKEY: None},
         use_container_width=True,
-        height=500,
-        key=f"ed_{nombre_modo}"
     )
 
-    # Sincronización de cambios: Actualizar el DF original con lo editado en la vista filtrada
-    if not df_editado_vista.equals(df_filtrado):
-        df.set_index(ROWKEY, inplace=True)
-        df.update(df_editado_vista.set_index(ROWKEY))
-        df.reset_index(inplace=True)
-    
-    return df
+    if len(entradas) < 2: return
+    col_a, col_b = st.columns(2)
+    with col_a: base = st.selectbox("Versión base", entradas, index=1, format_func=_etiqueta_version, key="hist_base")
+    with col_b: nueva = st.selectbox("Versión comparada", entradas, index=0, format_func=_etiqueta_version, key="hist_nueva")
+
+    par = (base["ruta"], nueva["ruta"])
+    if st.button("🔎 Comparar versiones", key="hist_comparar"):
+        with st.spinner("Comparando versiones..."):
+            st.session_state["hist_cambios"] = (par, catalogo_backups.comparar_versiones(base, nueva))
+    # El resultado se conserva en la sesión para que las descargas no lo descarten
+    comparado, cambios = st.session_state.get("hist_cambios", (None, None))
+    if comparado != par: return
+    st.markdown(f"**Cambios detectados:** {len(cambios)}")
+    if cambios.empty:
+        st.text("Sin cambios detectados.")
+        return
+    st.dataframe(cambios.drop(columns=[ROWKEY]).rename(columns=reporte_cambios.ENCABEZADOS), hide_index=True, use_container_width=True)
+    nombre = f"Cambios_{modo}_{nueva['timestamp']}_vs_{base['timestamp']}"
+    col_x, col_h = st.columns(2)
+    with col_x: st.download_button("Descargar Excel de cambios", data=reporte_cambios.xlsx_cambios({modo: cambios}).tobytes(),
+                                   file_name=f"{nombre}.xlsx", key="hist_dl_xlsx")
+    with col_h: st.download_button("Descargar reporte HTML", data=reporte_cambios.html_agrupado({modo: cambios}, nombre).tobytes(),
+                                   file_name=f"{nombre}.html", mime="text/html", key="hist_dl_html")
 
 # ================== MAIN UI ==================
 
@@ -289,53 +328,56 @@ def manejar_archivo(nombre_modo, nombre_archivo):
 #        drives = requests.get(f"https://graph.microsoft.com/v1.0/sites/{s['id']}/drives", headers=headers).json().get("value", [])
 #        st.write(f"Drives de '{s.get('webUrl')}':", [(d.get("name"), d.get("id")) for d in drives])
 
-try:
-    tab1, tab2 = st.tabs(["📄 Masterfile Fijo", "📄 Masterfile Movilidad"])
+# Token, sitio y ambos Masterfiles se precargan en segundo plano (una vez por proceso)
+carga.precalentar(ARCHIVOS)
+# Cambios remotos vía /delta: invalida la caché sin descargar los libros
+vigilancia.iniciar()
 
-    with tab1:
-        df_fijo_final = manejar_archivo("Fijo", ARCHIVOS["Fijo"])
-    with tab2:
-        df_movilidad_final = manejar_archivo("Movilidad", ARCHIVOS["Movilidad"])
+# Retoma correos que hayan quedado pendientes de una ejecución anterior
+correo.iniciar_despachador()
+n_pendientes, n_fallidos = len(correo.pendientes()), len(correo.fallidos())
+if n_pendientes: st.sidebar.info(f"📬 Correos en cola: {n_pendientes}")
+if n_fallidos: st.sidebar.warning(f"⚠️ Correos no enviados tras varios intentos: {n_fallidos} (ver carpeta outbox/fallidos)")
+
+try:
+    _aviso_cambios_remotos()
+    _conservar_estado_vistas()
+    vista = st.radio("Vista", list(VISTAS), horizontal=True, key="vista", label_visibility="collapsed")
+    modo_activo = VISTAS[vista]
+    if modo_activo is None:
+        mostrar_historial()
+    else:
+        df_activo = manejar_archivo(modo_activo, ARCHIVOS[modo_activo])
 
     st.markdown("---")
+    if "guardado_clave" in st.session_state:
+        st.warning("⚠️ El último guardado quedó incompleto. Al guardar de nuevo se retoma desde donde quedó, sin repetir las subidas ya hechas.")
     if st.button("💾 GUARDAR CAMBIOS Y ENVIAR CORREO", use_container_width=True):
         with st.spinner("Procesando cambios y subiendo a SharePoint..."):
-            timestamp = datetime.now(ZoneInfo("America/Costa_Rica")).strftime("%Y%m%d_%H%M%S")
-            adjuntos = []
-            cuerpo = f"Reporte de cambios - {timestamp}\n\n"
-
-            for modo, df_mod, n_arc in [("Fijo", df_fijo_final, ARCHIVOS["Fijo"]), ("Movilidad", df_movilidad_final, ARCHIVOS["Movilidad"])]:
-                # Obtener original puro para comparar cambios reales
-                df_orig = pd.read_excel(get_file_from_sharepoint(f"{FOLDER_PATH}/{n_arc}")).fillna('')
-                df_orig[ROWKEY] = np.arange(len(df_orig)).astype(str)
-
-                lista_cambios = detectar_cambios(df_orig, df_mod, modo)
-                cuerpo += f"📌 ENTORNO {modo.upper()}:\n"
-                cuerpo += ("\n".join([f"• {c}" for c in lista_cambios]) if lista_cambios else "Sin cambios detectados.") + "\n\n"
-
-                # Guardar en Excel
-                df_save = df_mod.drop(columns=[ROWKEY], errors='ignore')
-                buf = BytesIO()
-                df_save.to_excel(buf, index=False)
-                buf.seek(0)
-
-                # Backups y Sobrescribir
-                bkp_path = f"{FOLDER_PATH}/Backups/{modo}/{n_arc.replace('.xlsx','')}_{timestamp}.xlsx"
-                ensure_folder(f"{FOLDER_PATH}/Backups/{modo}")
-                upload_file_to_sharepoint(bkp_path, buf)
-                buf.seek(0)
-                upload_file_to_sharepoint(f"{FOLDER_PATH}/{n_arc}", buf)
-                buf.seek(0)
-                adjuntos.append((BytesIO(buf.getvalue()), f"{n_arc.replace('.xlsx','')}_{timestamp}.xlsx"))
-
-            # Notificación Correo
-            f_hoy, c_act = _leer_contador_hoy()
-            asunto = f"Masterfile Sutel {f_hoy}" + (f" V{c_act+1}" if c_act > 0 else "")
-            enviar_correo_con_adjuntos(asunto, cuerpo + "\nSaludos.", adjuntos)
-            _guardar_contador_hoy(f_hoy, c_act + 1)
-            
-            st.success("✅ Guardado exitoso. Archivos actualizados y correo enviado.")
+            import guardado   # diferido: pipeline de guardado, zip y correo solo al guardar
+            # Clave de idempotencia: se conserva en la sesión hasta que el guardado termina bien
+            clave = st.session_state.setdefault("guardado_clave", guardado.transaccion.nueva_clave())
+            with tiempos.medicion("guardado") as med_guardado, perfilado.perfil("guardado") as perfil_guardado:
+                finales = _dfs_con_deltas([m for m in ARCHIVOS if m != modo_activo])
+                if modo_activo is not None: finales[modo_activo] = df_activo
+                huella = huella_deltas({modo: _deltas(modo) for modo in ARCHIVOS})
+                guardado.guardar_masterfiles([(modo, finales[modo], n_arc) for modo, n_arc in ARCHIVOS.items()], clave, huella)
+            if med_guardado is not None: st.session_state["tiempos_guardado"] = med_guardado.resumen()
+            if perfil_guardado is not None: st.session_state["perfil_guardado"] = perfil_guardado.reporte
+
+            st.session_state.pop("guardado_clave", None)
+            for modo in ARCHIVOS:
+                st.session_state.pop(f"deltas_{modo}", None)
+                st.session_state.pop(f"base_{modo}", None)
+            st.success("✅ Guardado exitoso. Archivos actualizados; el correo se enviará en segundo plano.")
             st.balloons()
 
 except Exception as e:
     st.error(f"❌ Error en la aplicación: {e}")
+
+perfilado.mostrar_reporte(perfilado.finalizar_rerun())
+perfilado.mostrar_reporte(st.session_state.pop("perfil_guardado", None))
+
+med_rerun = tiempos.finalizar_rerun()
+if med_rerun is not None:
+    tiempos.mostrar_panel({"Último rerun": med_rerun.resumen(), "Último guardado": st.session_state.get("tiempos_guardado")})
@@ -0,0 +1,24 @@
+# ==============================================================
+# Lectura de secretos opcionales (con valor por defecto)
+# ==============================================================
+
+try:
+    from config import get_secret
+except ImportError:
+    # Scripts standalone (p. ej. el Gestor) sin config.py: los secrets salen de st.secrets
+    def get_secret(key):
+        import streamlit as st
+        return st.secrets[key]
+
+def get_secret_opcional(key, default=None):
+    # get_secret falla o devuelve vacío si la clave no existe en secrets
+    try:
+        valor = get_secret(key)
+    except Exception:
+        return default
+    return default if valor is None or valor == "" else valor
+
+def opcion_activa(key, default=False):
+    valor = get_secret_opcional(key, default)
+    if isinstance(valor, str): return valor.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+    return bool(valor)
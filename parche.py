@@ -0,0 +1,144 @@
+# ==============================================================
+# Ediciones masivas sin UI: aplica un archivo de parche (CSV/XLSX
+# con columna clave `ID SONDA` o `_row_id` + columnas a modificar)
+# a un Masterfile y lo guarda con el mismo pipeline que la app
+# (diff, backup, subida, catálogo y correo).
+#
+#     python parche.py Fijo reasignacion.csv --dry-run
+#     python parche.py Movilidad cambios.xlsx
+#
+# Las celdas vacías del parche no modifican el Masterfile.
+# ==============================================================
+
+import sys
+import argparse
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from cambios import ROWKEY, detectar_cambios
+from registro import ARCHIVOS, masterfile
+import carga
+import esquema
+
+class ErrorParche(Exception):
+    pass
+
+# ========= Lectura =========
+def leer_parche(origen, nombre=None, hoja=0):
+    # origen: ruta o bytes; se lee sin inferir tipos (los impone el esquema del Masterfile)
+    nombre = nombre or (origen if isinstance(origen, str) else "")
+    datos = BytesIO(origen) if isinstance(origen, (bytes, bytearray)) else origen
+    if nombre.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(datos, sheet_name=hoja, dtype=object)
+    return pd.read_csv(datos, dtype=str, keep_default_na=False, na_values=[""], encoding="utf-8-sig")
+
+def _como_texto(serie):
+    return esquema.tipar(serie.to_frame(), {serie.name: "texto"})[serie.name]
+
+def _clave(parche, clave=None, modo=None):
+    if clave is None: clave = ROWKEY if ROWKEY in parche.columns else masterfile(modo)["clave"]
+    if clave not in parche.columns: raise ErrorParche(f"El parche no tiene la columna clave '{clave}' (ni '{ROWKEY}')")
+    return clave
+
+# ========= Aplicación vectorizada =========
+def aplicar_parche(df, tipos, parche, clave=None, ignorar_faltantes=False, modo=None):
+    # Devuelve (copia de df con el parche aplicado, claves del parche que no existen en df).
+    # Un join por clave y una asignación por columna: sin recorrer filas.
+    clave = _clave(parche, clave, modo)
+    columnas = [c for c in parche.columns if c != clave]
+    desconocidas = [c for c in columnas if c not in tipos]
+    if desconocidas: raise ErrorParche(f"Columnas del parche que no existen en el Masterfile: {desconocidas}")
+    if clave == ROWKEY and ROWKEY in columnas: raise ErrorParche(f"'{ROWKEY}' no se puede modificar")
+
+    claves_parche = _como_texto(parche[clave])
+    if claves_parche.eq("").any(): raise ErrorParche(f"Hay filas del parche sin valor en '{clave}'")
+    repetidas = claves_parche[claves_parche.duplicated()].unique()
+    if len(repetidas): raise ErrorParche(f"Claves repetidas en el parche: {list(repetidas[:10])}")
+
+    claves_df = pd.Index(df[ROWKEY] if clave == ROWKEY else _como_texto(df[clave]))
+    if not claves_df.is_unique: raise ErrorParche(f"'{clave}' no es única en el Masterfile; use '{ROWKEY}' como clave")
+    posiciones = claves_df.get_indexer(claves_parche)
+    encontradas = posiciones >= 0
+    faltantes = list(claves_parche[~encontradas])
+    if faltantes and not ignorar_faltantes:
+        raise ErrorParche(f"{len(faltantes)} claves del parche no existen en el Masterfile: {faltantes[:10]}")
+
+    crudo = parche.loc[encontradas, columnas]
+    tipado = esquema.tipar(crudo, {c: tipos[c] for c in columnas})
+    con_valor = crudo.notna() & crudo.astype(str).apply(lambda s: s.str.strip().ne(""))
+    invalidas = con_valor & tipado.isna()
+    if invalidas.to_numpy().any():
+        filas, cols = np.nonzero(invalidas.to_numpy())
+        ejemplos = [f"{claves_parche[encontradas].iloc[f]}/{columnas[c]}={crudo.iat[f, c]!r}" for f, c in zip(filas[:10], cols[:10])]
+        raise ErrorParche(f"Valores que no corresponden al tipo de su columna: {ejemplos}")
+
+    out = df.copy()
+    pos = posiciones[encontradas]
+    for c in columnas:
+        mascara = con_valor[c].to_numpy()
+        if not mascara.any(): continue
+        serie = out[c].copy()
+        serie.iloc[pos[mascara]] = tipado[c].to_numpy()[mascara]
+        out[c] = serie
+    return out, faltantes
+
+def deltas(df, df_mod):
+    # {row_id: {columna: valor nuevo}} de las celdas que cambiaron: el mismo
+    # formato que las ediciones pendientes de la app
+    out = {}
+    for c in df.columns:
+        if c == ROWKEY: continue
+        a, b = df[c], df_mod[c]
+        iguales = (a == b).astype("boolean").fillna(False) | (a.isna() & b.isna())
+        for i in np.flatnonzero(~iguales.to_numpy(dtype=bool)):
+            out.setdefault(df[ROWKEY].iat[i], {})[c] = b.iat[i]
+    return out
+
+def cambios_parche(df, df_mod, modo, nuevos):
+    # Diff en el formato del correo, restringido a las filas que tocó el parche
+    filas = df[ROWKEY].isin(list(nuevos)).to_numpy()
+    return detectar_cambios(df[filas], df_mod[filas], modo)
+
+def preparar(modo, origen, nombre=None, clave=None, ignorar_faltantes=False, hoja=0):
+    # Carga el Masterfile vigente (mismo módulo de carga que la app) y aplica el parche.
+    # Devuelve (df_original, df_parcheado, cambios en el formato del correo, claves faltantes)
+    _, df, tipos, _ = carga.cargar_masterfile(modo, ARCHIVOS[modo])
+    parche = leer_parche(origen, nombre, hoja)
+    df_mod, faltantes = aplicar_parche(df, tipos, parche, clave, ignorar_faltantes, modo)
+    return df, df_mod, cambios_parche(df, df_mod, modo, deltas(df, df_mod)), faltantes
+
+# ========= CLI =========
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aplica un parche (CSV/XLSX) a un Masterfile")
+    parser.add_argument("modo", choices=list(ARCHIVOS))
+    parser.add_argument("parche", help="Archivo CSV o XLSX con la columna clave y las columnas a modificar")
+    parser.add_argument("--clave", help=f"Columna clave (por defecto '{ROWKEY}' si existe, si no la del registro)")
+    parser.add_argument("--hoja", default=0, help="Hoja del XLSX (nombre o índice)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo muestra los cambios; no guarda ni envía correo")
+    parser.add_argument("--ignorar-faltantes", action="store_true", help="Omite claves que no existen en el Masterfile")
+    args = parser.parse_args(argv)
+
+    hoja = int(args.hoja) if str(args.hoja).isdigit() else args.hoja
+    try:
+        _, df_mod, cambios, faltantes = preparar(args.modo, args.parche, clave=args.clave,
+                                                 ignorar_faltantes=args.ignorar_faltantes, hoja=hoja)
+    except ErrorParche as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    print(f"📌 ENTORNO {args.modo.upper()}: {len(cambios)} cambios")
+    print("\n".join(f"• {c}" for c in cambios) if cambios else "Sin cambios detectados.")
+    if faltantes: print(f"⚠️ {len(faltantes)} claves omitidas (no existen): {faltantes[:10]}")
+    if args.dry_run or not cambios: return 0
+
+    import guardado
+    import correo
+    guardado.guardar_masterfiles([(args.modo, df_mod, ARCHIVOS[args.modo])])
+    # El worker del outbox es un hilo daemon: se hace una pasada antes de salir
+    correo.iniciar_despachador().procesar()
+    pendientes = len(correo.pendientes())
+    print(f"✅ {ARCHIVOS[args.modo]} actualizado." + (f" {pendientes} correo(s) quedan en el outbox ({correo.OUTBOX_DIR})." if pendientes else " Correo enviado."))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# ==============================================================
+# Armado del payload del correo de notificación
+# - Adjuntos agrupados en un único .zip
+# - Opcional: solo las filas modificadas (CSV) en lugar de los libros
+# - Por encima de un umbral se envían enlaces de SharePoint, no bytes
+# ==============================================================
+
+import logging
+import zipfile
+from io import BytesIO
+from opciones import get_secret_opcional
+from almacenamiento import create_sharing_link
+
+# "completo": libros completos dentro del zip | "cambios": solo filas modificadas (CSV)
+CORREO_ADJUNTOS = get_secret_opcional("correo_adjuntos", "completo")
+CORREO_MAX_ADJUNTO_MB = float(get_secret_opcional("correo_max_adjunto_mb", 15))
+
+ZIP_MIME = ("application", "zip")
+
+log = logging.getLogger(__name__)
+
+def _zip(entradas):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre, datos in entradas:
+            zf.writestr(nombre, datos)
+    return buf.getbuffer()
+
+def _entradas_zip(archivos, solo_cambios):
+    if not solo_cambios:
+        return [(a["nombre"], a["datos"]) for a in archivos]
+    return [
+        (a["nombre"].replace(".xlsx", "_cambios.csv"), a["filas_cambiadas"].to_csv(index=False).encode("utf-8-sig"))
+        for a in archivos if a.get("filas_cambiadas") is not None and len(a["filas_cambiadas"])
+    ]
+
+def _enlaces(archivos):
+    return "\n".join(f"• {a['nombre']}: {create_sharing_link(a['ruta'])}" for a in archivos)
+
+def preparar_payload(cuerpo, archivos, nombre_zip, solo_cambios=None, max_mb=None):
+    # archivos: lista de dicts con "nombre", "datos" (bytes del xlsx), "ruta"
+    # (ubicación ya subida a SharePoint) y opcionalmente "filas_cambiadas" (DataFrame).
+    # Devuelve (cuerpo, adjuntos) con adjuntos como [(datos, nombre, (maintype, subtype))].
+    solo_cambios = CORREO_ADJUNTOS == "cambios" if solo_cambios is None else solo_cambios
+    max_mb = CORREO_MAX_ADJUNTO_MB if max_mb is None else max_mb
+
+    entradas = _entradas_zip(archivos, solo_cambios)
+    if not entradas:
+        return cuerpo, []
+    datos_zip = _zip(entradas)
+    if datos_zip.nbytes <= max_mb * 1024 * 1024:
+        return cuerpo, [(datos_zip, nombre_zip, ZIP_MIME)]
+
+    # Demasiado grande para el correo: se comparten los archivos ya subidos
+    try:
+        enlaces = _enlaces(archivos)
+    except Exception:
+        log.exception("No se pudieron crear enlaces de SharePoint; se adjunta el zip")
+        return cuerpo, [(datos_zip, nombre_zip, ZIP_MIME)]
+    aviso = f"Los archivos superan {max_mb:g} MB y no se adjuntan. Enlaces en SharePoint:\n{enlaces}\n"
+    return cuerpo + aviso, []
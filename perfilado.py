@@ -0,0 +1,131 @@
+# ==============================================================
+# Perfilado bajo demanda de un rerun o un guardado (cProfile)
+# Se activa sin reiniciar la app con ?perfil=rerun|guardado en la
+# URL (una sola vez) o con el secret `perfil` (mientras esté puesto).
+# El reporte (.prof para snakeviz/pstats + resumen .txt) se guarda
+# en una carpeta local o en la carpeta Perfiles de SharePoint.
+# ==============================================================
+
+import io
+import os
+import time
+import uuid
+import marshal
+import pstats
+import logging
+import cProfile
+import threading
+from contextlib import nullcontext
+import streamlit as st
+from opciones import get_secret_opcional
+
+ALCANCES = ("rerun", "guardado")
+FILAS_RESUMEN = 40
+
+log = logging.getLogger(__name__)
+_NULO = nullcontext()
+_local = threading.local()
+
+def _destino():
+    # Se leen en cada uso: cambiar secrets no requiere reiniciar la app
+    return get_secret_opcional("perfil_destino", "local").strip().lower()
+
+def _carpeta_local():
+    return get_secret_opcional("perfil_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfiles"))
+
+def _alcances(valor):
+    if valor is None: return set()
+    valor = str(valor).strip().lower()
+    if valor in ("1", "true", "si", "sí", "todo"): return set(ALCANCES)
+    return {v.strip() for v in valor.split(",")} & set(ALCANCES)
+
+def solicitado(alcance):
+    return alcance in _alcances(st.query_params.get("perfil")) | _alcances(get_secret_opcional("perfil"))
+
+def _consumir_query(alcance):
+    # El parámetro de URL perfila una sola vez; el secret sigue activo hasta quitarlo
+    if "perfil" not in st.query_params: return
+    restantes = _alcances(st.query_params.get("perfil")) - {alcance}
+    if restantes: st.query_params["perfil"] = ",".join(sorted(restantes))
+    else: del st.query_params["perfil"]
+
+# ========= Reporte =========
+def _resumen(prof):
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    stats.strip_dirs()
+    for orden in ("cumulative", "tottime"):
+        out.write(f"===== Ordenado por {orden} =====\n")
+        stats.sort_stats(orden).print_stats(FILAS_RESUMEN)
+    return out.getvalue()
+
+def _guardar_reporte(prof, alcance):
+    nombre = f"{alcance}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    datos_prof = marshal.dumps(pstats.Stats(prof).stats)   # mismo formato que Stats.dump_stats
+    resumen = _resumen(prof)
+    if _destino() == "sharepoint":
+        from almacenamiento import FOLDER_PATH, ensure_folder, upload_file_to_sharepoint
+        carpeta = f"{FOLDER_PATH}/Perfiles"
+        ensure_folder(carpeta)
+        upload_file_to_sharepoint(f"{carpeta}/{nombre}.prof", io.BytesIO(datos_prof))
+        upload_file_to_sharepoint(f"{carpeta}/{nombre}.txt", io.BytesIO(resumen.encode("utf-8")))
+    else:
+        carpeta = _carpeta_local()
+        os.makedirs(carpeta, exist_ok=True)
+        with open(os.path.join(carpeta, f"{nombre}.prof"), "wb") as f: f.write(datos_prof)
+        with open(os.path.join(carpeta, f"{nombre}.txt"), "w", encoding="utf-8") as f: f.write(resumen)
+    return {"alcance": alcance, "nombre": nombre, "carpeta": carpeta, "resumen": resumen, "prof": datos_prof}
+
+# ========= Perfilado =========
+class Perfil:
+    def __init__(self, alcance):
+        self.alcance = alcance
+        self.reporte = None
+        self._prof = None
+
+    def __enter__(self):
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Solo puede haber un profiler activo a la vez (otra sesión perfilando)
+            log.warning("Perfilado de %s omitido: ya hay otro perfil en curso", self.alcance)
+            return self
+        self._prof = prof
+        return self
+
+    def __exit__(self, *exc):
+        if self._prof is None: return False
+        self._prof.disable()
+        _consumir_query(self.alcance)
+        try:
+            self.reporte = _guardar_reporte(self._prof, self.alcance)
+        except Exception:
+            log.exception("No se pudo guardar el perfil de %s", self.alcance)
+        return False
+
+def perfil(alcance):
+    return Perfil(alcance) if solicitado(alcance) else _NULO
+
+# Para el rerun completo, que no cabe en un bloque `with` (el script entero)
+def iniciar_rerun():
+    previo = getattr(_local, "rerun", None)
+    if previo is not None and previo._prof is not None: previo._prof.disable()   # quedó abierto tras un st.stop()
+    _local.rerun = Perfil("rerun").__enter__() if solicitado("rerun") else None
+    return _local.rerun
+
+def finalizar_rerun():
+    actual = getattr(_local, "rerun", None)
+    _local.rerun = None
+    if actual is None: return None
+    actual.__exit__(None, None, None)
+    return actual.reporte
+
+# ========= Panel =========
+def mostrar_reporte(reporte):
+    if reporte is None: return
+    with st.sidebar.expander(f"🔬 Perfil de {reporte['alcance']}"):
+        st.caption(f"Guardado en {reporte['carpeta']}/{reporte['nombre']}.prof")
+        st.download_button("Descargar .prof", data=reporte["prof"], file_name=f"{reporte['nombre']}.prof",
+                           key=f"perfil_{reporte['nombre']}")
+        st.code(reporte["resumen"][:6000], language=None)
@@ -0,0 +1,44 @@
+# ==============================================================
+# Registro de Masterfiles (entornos de medición)
+# Cada entrada declara su archivo, la columna clave, la columna que
+# identifica la fila en las líneas de cambio y su carpeta de backups
+# (relativa a FOLDER_PATH). Sin identificador declarado se usa Stm
+# cuando la columna existe, como hacía detectar_cambios antes del
+# registro (identificador = "" usa siempre la clave). Se puede
+# reemplazar desde secrets:
+#
+#   [masterfiles.Fijo]
+#   archivo = "MasterfileSutel.xlsx"
+#
+#   [masterfiles.Movilidad]
+#   archivo = "MasterfileSutel_Movilidad.xlsx"
+# ==============================================================
+
+from opciones import get_secret_opcional
+
+CLAVE_DEFECTO = "ID SONDA"
+IDENTIFICADOR_DEFECTO = "Stm"
+
+MASTERFILES_DEFECTO = {
+    "Fijo": {"archivo": "MasterfileSutel.xlsx"},
+    "Movilidad": {"archivo": "MasterfileSutel_Movilidad.xlsx"},
+}
+
+def _entrada(modo, cfg):
+    return {
+        "modo": modo,
+        "archivo": cfg.get("archivo"),
+        "clave": cfg.get("clave", CLAVE_DEFECTO),
+        "identificador": cfg.get("identificador", IDENTIFICADOR_DEFECTO),
+        "backups": cfg.get("backups", f"Backups/{modo}"),
+    }
+
+MASTERFILES = {
+    modo: _entrada(modo, dict(cfg))
+    for modo, cfg in (get_secret_opcional("masterfiles") or MASTERFILES_DEFECTO).items()
+}
+ARCHIVOS = {modo: m["archivo"] for modo, m in MASTERFILES.items()}
+
+def masterfile(modo):
+    # Modos fuera del registro (p. ej. en benchmarks) usan los valores por defecto
+    return MASTERFILES.get(modo) or _entrada(modo, {})
@@ -0,0 +1,93 @@
+# ==============================================================
+# Reportes del conjunto de cambios (ver cambios.conjunto_cambios)
+# - Resumen de texto acotado para el cuerpo del correo
+# - Tabla HTML agrupada por fila, generada por partes
+# - Excel compacto con solo las celdas modificadas
+# El cuerpo del correo no crece con el volumen de ediciones: el
+# detalle completo viaja en el reporte adjunto.
+# ==============================================================
+
+from io import BytesIO
+from html import escape
+import pandas as pd
+from opciones import get_secret_opcional
+from cambios import ROWKEY, lineas_cambios
+
+MAX_LINEAS_CORREO = int(get_secret_opcional("correo_max_lineas_cambios", 50))
+# "xlsx" | "html" | "ambos": formato del reporte que se adjunta cuando el detalle no cabe en el cuerpo
+FORMATO_REPORTE = get_secret_opcional("correo_reporte_cambios", "xlsx")
+
+XLSX_MIME = ("application", "vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+HTML_MIME = ("text", "html")
+
+ENCABEZADOS = {"identificador": "Fila", "columna": "Columna", "anterior": "Valor anterior", "nuevo": "Valor nuevo"}
+
+# ========= Texto =========
+def resumen_texto(conjunto, max_lineas=MAX_LINEAS_CORREO):
+    if conjunto.empty: return "Sin cambios detectados."
+    lineas = [f"• {c}" for c in lineas_cambios(conjunto.head(max_lineas))]
+    if len(conjunto) > max_lineas:
+        por_columna = conjunto["columna"].value_counts().head(10)
+        lineas.append(f"… y {len(conjunto) - max_lineas} cambios más "
+                      f"({len(conjunto)} en {conjunto[ROWKEY].nunique()} filas). Por columna: "
+                      + ", ".join(f"{c}: {n}" for c, n in por_columna.items()))
+        lineas.append("El detalle completo va en el reporte de cambios adjunto.")
+    return "\n".join(lineas)
+
+def excede_cuerpo(conjuntos, max_lineas=MAX_LINEAS_CORREO):
+    return any(len(c) > max_lineas for c in conjuntos.values())
+
+# ========= HTML =========
+_ESTILO = (
+    "body{font-family:Segoe UI,Arial,sans-serif;font-size:13px}"
+    "table{border-collapse:collapse;margin-bottom:18px}"
+    "th,td{border:1px solid #ccc;padding:3px 8px;text-align:left;vertical-align:top}"
+    "th{background:#203a43;color:#fff}td.ant{color:#a00}td.nue{color:#070}"
+)
+
+def iter_html(conjuntos, titulo="Reporte de cambios"):
+    # Genera el documento por partes: nunca arma el HTML completo como una sola cadena
+    yield f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{escape(titulo)}</title><style>{_ESTILO}</style></head><body>"
+    yield f"<h1>{escape(titulo)}</h1>"
+    for modo, conjunto in conjuntos.items():
+        yield f"<h2>Entorno {escape(str(modo))}: {len(conjunto)} cambios</h2>"
+        if conjunto.empty:
+            yield "<p>Sin cambios detectados.</p>"
+            continue
+        yield "<table><tr>" + "".join(f"<th>{escape(ENCABEZADOS[c])}</th>" for c in ENCABEZADOS) + "</tr>"
+        for ident, grupo in conjunto.groupby("identificador", sort=False):
+            celda_fila = f"<td rowspan='{len(grupo)}'>{escape(str(ident))}</td>"
+            for c, a, b in zip(grupo["columna"], grupo["anterior"], grupo["nuevo"]):
+                yield f"<tr>{celda_fila}<td>{escape(str(c))}</td><td class='ant'>{escape(str(a))}</td><td class='nue'>{escape(str(b))}</td></tr>"
+                celda_fila = ""
+        yield "</table>"
+    yield "</body></html>"
+
+def html_agrupado(conjuntos, titulo="Reporte de cambios"):
+    buf = BytesIO()
+    for parte in iter_html(conjuntos, titulo): buf.write(parte.encode("utf-8"))
+    return buf.getbuffer()
+
+# ========= Excel =========
+def xlsx_cambios(conjuntos):
+    # Una hoja por entorno con solo las celdas modificadas
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+        for modo, conjunto in conjuntos.items():
+            hoja = conjunto.drop(columns=[ROWKEY]).rename(columns=ENCABEZADOS)
+            hoja.to_excel(writer, sheet_name=str(modo)[:31], index=False)
+            writer.sheets[str(modo)[:31]].autofilter(0, 0, max(len(hoja), 1), len(hoja.columns) - 1)
+    return buf.getbuffer()
+
+# ========= Adjuntos del correo =========
+def adjuntos_reporte(conjuntos, timestamp, formato=None):
+    # [(datos, nombre, mime)] en el formato que usa correo.construir_mensaje;
+    # vacío si todos los cambios ya caben en el cuerpo
+    if not excede_cuerpo(conjuntos): return []
+    formato = (formato or FORMATO_REPORTE).strip().lower()
+    adjuntos = []
+    if formato in ("xlsx", "ambos"):
+        adjuntos.append((xlsx_cambios(conjuntos), f"Cambios_{timestamp}.xlsx", XLSX_MIME))
+    if formato in ("html", "ambos"):
+        adjuntos.append((html_agrupado(conjuntos, f"Reporte de cambios - {timestamp}"), f"Cambios_{timestamp}.html", HTML_MIME))
+    return adjuntos
@@ -0,0 +1,252 @@
+# ==============================================================
+# Acceso a SharePoint vía Microsoft Graph: backend "graph" (por
+# defecto) de almacenamiento.py, que es lo que importan la app, el
+# catálogo de backups y demás módulos
+# ==============================================================
+
+import streamlit as st
+from io import BytesIO
+import requests
+from config import get_secret
+from opciones import get_secret_opcional
+from almacenamiento import DESCARGA_CHUNK, DeltaExpirado, archivo_temporal, reintentar
+import tiempos
+
+# ================== CONFIGURACIÓN ==================
+TENANT_ID = get_secret("tenant_id")
+CLIENT_ID = get_secret("client_id")
+CLIENT_SECRET = get_secret("client_secret")
+
+SITE_HOST = "caseonit.sharepoint.com"
+SITE_NAME = "Sutel"
+
+# Configurables para apuntar la app al stand-in local (ver graph_local.py)
+GRAPH_URL = get_secret_opcional("graph_base_url", "https://graph.microsoft.com/v1.0").rstrip("/")
+LOGIN_URL = get_secret_opcional("login_base_url", "https://login.microsoftonline.com").rstrip("/")
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+
+UPLOAD_SIMPLE_MAX = 4 * 1024 * 1024         # Graph recomienda sesión de subida por encima de 4 MB
+UPLOAD_CHUNK = 32 * 320 * 1024              # los fragmentos deben ser múltiplos de 320 KiB
+
+# Una sesión compartida reutiliza conexiones (TLS keep-alive) entre llamadas
+_http = requests.Session()
+
+def _request(method, url, **kwargs):
+    # Reintentos ante 429/503: ver almacenamiento.reintentar
+    return reintentar(lambda: _http.request(method, url, **kwargs))
+
+# ========= Autenticación y Graph API =========
+@st.cache_data(ttl=3000)
+def get_access_token_cached():
+    with tiempos.span("graph.token"):
+        return _pedir_token()
+
+def _pedir_token():
+    if LOGIN_URL != "https://login.microsoftonline.com":
+        # MSAL solo acepta autoridades https conocidas: contra el stand-in local
+        # se pide el mismo token client_credentials directamente al endpoint
+        resp = _request("POST", f"{LOGIN_URL}/{TENANT_ID}/oauth2/v2.0/token", data={
+            "grant_type": "client_credentials", "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET, "scope": GRAPH_SCOPE,
+        })
+        result = resp.json()
+    else:
+        import msal   # diferido: solo se necesita al renovar el token
+        app = msal.ConfidentialClientApplication(CLIENT_ID, authority=f"{LOGIN_URL}/{TENANT_ID}", client_credential=CLIENT_SECRET)
+        result = app.acquire_token_for_client(scopes=[GRAPH_SCOPE])
+    if "access_token" not in result: raise Exception(f"Error Token: {result}")
+    return result["access_token"]
+
+
+@st.cache_data(ttl=3600)
+def get_site_drive_cached():
+    with tiempos.span("graph.sitio"):
+        return _resolver_site_drive()
+
+def _resolver_site_drive():
+    token = get_access_token_cached()
+    headers = {"Authorization": f"Bearer {token}"}
+    r_sites = _request("GET", f"{GRAPH_URL}/sites?search={SITE_NAME}", headers=headers)
+    sites = r_sites.json().get("value", [])
+    if not sites:
+        raise Exception(f"No se encontro ningun sitio para '{SITE_NAME}': {r_sites.status_code} {r_sites.text[:300]}")
+
+    # Coincidencia EXACTA por nombre -- "Sutel" es substring de "ProyectoSUTEL"
+    # y "ProyectoSUTEL-MEDUX2024", asi que un "in"/substring agarra el sitio
+    # equivocado (ese era el bug: siempre caia en ProyectoSUTEL-MEDUX2024).
+    site = next(
+        (s for s in sites if s.get("name", "").strip().lower() == SITE_NAME.strip().lower()),
+        None,
+    )
+    if site is None:
+        raise Exception(
+            f"No se encontro un sitio con nombre EXACTO '{SITE_NAME}'. "
+            f"Candidatos encontrados: {[s.get('name') for s in sites]}"
+        )
+
+    r_drives = _request("GET", f"{GRAPH_URL}/sites/{site['id']}/drives", headers=headers)
+    drives = r_drives.json().get("value", [])
+    if not drives:
+        raise Exception(f"El sitio '{site.get('webUrl')}' no tiene drives: {r_drives.status_code} {r_drives.text[:300]}")
+    drive = next((d for d in drives if d.get("name", "").lower() in ("documents", "documentos")), drives[0])
+    return site["id"], drive["id"]
+
+def preparar():
+    get_access_token_cached()
+    get_site_drive_cached()
+
+def get_file_from_sharepoint(path):
+    # Descarga por fragmentos a un archivo temporal (ver almacenamiento.archivo_temporal).
+    # Devuelve el archivo posicionado al inicio (sin copia en bytes).
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/content"
+    with tiempos.span("graph.descarga"):
+        resp = _request("GET", url, headers={"Authorization": f"Bearer {token}"}, stream=True)
+        try:
+            if resp.status_code != 200:
+                raise Exception(f"Error descarga {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+            archivo = archivo_temporal()
+            for bloque in resp.iter_content(DESCARGA_CHUNK):
+                archivo.write(bloque)
+        finally:
+            resp.close()
+    archivo.seek(0)
+    return archivo
+
+def get_file_if_exists(path):
+    # Igual que get_file_from_sharepoint, pero devuelve None si el archivo no existe
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/content"
+    with tiempos.span("graph.descarga"):
+        resp = _request("GET", url, headers={"Authorization": f"Bearer {token}"})
+    if resp.status_code == 404: return None
+    if resp.status_code != 200:
+        raise Exception(f"Error descarga {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+    return BytesIO(resp.content)
+
+def upload_file_to_sharepoint(path, file_bytes):
+    # file_bytes: BytesIO o cualquier objeto bytes-like (p. ej. un memoryview);
+    # se sube desde vistas del mismo buffer, sin copiarlo.
+    # Devuelve el driveItem creado/actualizado (incluye eTag y size)
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/content"
+    data = memoryview(file_bytes.getbuffer() if hasattr(file_bytes, "getbuffer") else file_bytes)
+    with tiempos.span("graph.subida"):
+        if data.nbytes > UPLOAD_SIMPLE_MAX:
+            return _upload_session(path, data, token, s_id, d_id)
+        resp = _request("PUT", url, headers={"Authorization": f"Bearer {token}"}, data=data)
+    if resp.status_code not in (200, 201): raise Exception(f"Error subida {path}")
+    return resp.json()
+
+def _upload_session(path, data, token, s_id, d_id):
+    # Subida por fragmentos (archivos grandes); la uploadUrl ya viene autenticada
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/createUploadSession"
+    resp = _request("POST", url, headers={"Authorization": f"Bearer {token}"}, json={"item": {"@microsoft.graph.conflictBehavior": "replace"}})
+    if resp.status_code != 200: raise Exception(f"Error creando sesión de subida {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+    upload_url, total = resp.json()["uploadUrl"], data.nbytes
+    for ini in range(0, total, UPLOAD_CHUNK):
+        fin = min(ini + UPLOAD_CHUNK, total)
+        resp = _request("PUT", upload_url, data=data[ini:fin], headers={
+            "Content-Length": str(fin - ini), "Content-Range": f"bytes {ini}-{fin - 1}/{total}",
+        })
+        if resp.status_code not in (200, 201, 202):
+            raise Exception(f"Error subida {path} (bytes {ini}-{fin - 1}) — HTTP {resp.status_code}: {resp.text[:500]}")
+    return resp.json()
+
+def get_item_metadata(path):
+    # driveItem (eTag, size, lastModifiedDateTime...) o None si no existe
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}"
+    with tiempos.span("graph.metadata"):
+        resp = _request("GET", url, headers={"Authorization": f"Bearer {token}"})
+    if resp.status_code == 404: return None
+    if resp.status_code != 200:
+        raise Exception(f"Error metadata {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+    return resp.json()
+
+def upload_if_match(path, data, etag):
+    # Subida condicional: solo escribe si el archivo sigue en la versión `etag`
+    # (o, con etag=None, si todavía no existe). Devuelve el driveItem nuevo,
+    # o None si otra escritura ganó la carrera (412/409).
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/content"
+    headers = {"Authorization": f"Bearer {token}"}
+    if etag is None:
+        url += "?@microsoft.graph.conflictBehavior=fail"
+    else:
+        headers["If-Match"] = etag
+    with tiempos.span("graph.subida"):
+        resp = _request("PUT", url, headers=headers, data=data)
+    if resp.status_code in (409, 412): return None
+    if resp.status_code not in (200, 201):
+        raise Exception(f"Error subida condicional {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+    return resp.json()
+
+def ensure_folder(path):
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    parts = path.split('/')
+    current_path = ""
+    with tiempos.span("graph.carpetas"):
+        for part in parts:
+            parent = current_path
+            current_path = f"{current_path}/{part}" if current_path else part
+            url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{current_path}"
+            if _request("GET", url, headers=headers).status_code != 200:
+                c_url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root{':/'+parent+':' if parent else ''}/children"
+                _request("POST", c_url, headers=headers, json={"name": part, "folder": {}})
+
+def create_sharing_link(path, link_type="view", scope="organization"):
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/createLink"
+    with tiempos.span("graph.enlace"):
+        resp = _request("POST", url, headers={"Authorization": f"Bearer {token}"}, json={"type": link_type, "scope": scope})
+    if resp.status_code not in (200, 201):
+        raise Exception(f"Error creando enlace {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+    return resp.json()["link"]["webUrl"]
+
+def list_children(path):
+    # Lista los elementos de una carpeta (siguiendo la paginación de Graph)
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root:/{path}:/children"
+    items = []
+    while url:
+        with tiempos.span("graph.listado"):
+            resp = _request("GET", url, headers=headers)
+        if resp.status_code == 404: return []
+        if resp.status_code != 200:
+            raise Exception(f"Error listando {path} — HTTP {resp.status_code}: {resp.text[:500]}")
+        data = resp.json()
+        items.extend(data.get("value", []))
+        url = data.get("@odata.nextLink")
+    return items
+
+def drive_delta(delta_link=None):
+    # Cambios del drive desde `delta_link` (sin descargar contenido). Sin enlace
+    # previo se pide token=latest: solo establece el punto de partida.
+    # Devuelve (driveItems cambiados, nuevo deltaLink). En SharePoint /delta solo
+    # existe sobre la raíz y no trae parentReference.path: se identifica por id.
+    token = get_access_token_cached()
+    s_id, d_id = get_site_drive_cached()
+    headers = {"Authorization": f"Bearer {token}"}
+    url = delta_link or f"{GRAPH_URL}/sites/{s_id}/drives/{d_id}/root/delta?token=latest"
+    items = []
+    while True:
+        with tiempos.span("graph.delta"):
+            resp = _request("GET", url, headers=headers)
+        if resp.status_code == 410: raise DeltaExpirado(resp.text[:500])
+        if resp.status_code != 200:
+            raise Exception(f"Error consultando cambios del drive — HTTP {resp.status_code}: {resp.text[:500]}")
+        data = resp.json()
+        items.extend(data.get("value", []))
+        if "@odata.nextLink" in data: url = data["@odata.nextLink"]
+        else: return items, data["@odata.deltaLink"]
@@ -0,0 +1,31 @@
+# ==============================================================
+# Configuración de las pruebas: secrets mínimos (en lugar del
+# config.py del despliegue) y almacenamiento, outbox y estado en
+# un directorio temporal, sin red ni SharePoint.
+# ==============================================================
+
+import os
+import sys
+import types
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+TMP = tempfile.mkdtemp(prefix="masterfile-pruebas-")
+SECRETS = {
+    "tenant_id": "t", "client_id": "c", "client_secret": "s",
+    "smtp_server": "127.0.0.1", "smtp_port": 1025, "smtp_user": "", "smtp_pass": "", "smtp_starttls": "false",
+    "email_from": "masterfile@pruebas", "email_to": "equipo@pruebas",
+    "almacenamiento": "local",
+    "almacenamiento_local_dir": os.path.join(TMP, "almacenamiento"),
+    "outbox_dir": os.path.join(TMP, "outbox"),
+    "guardado_estado": os.path.join(TMP, "guardados"),
+    "delta_estado": os.path.join(TMP, "delta.json"),
+    "delta_intervalo": 0,
+    "precalentar": "false",
+}
+
+config = types.ModuleType("config")
+config.get_secret = lambda key: SECRETS[key]
+sys.modules["config"] = config
@@ -0,0 +1,25 @@
+# ==============================================================
+# Funciones del Gestor para las pruebas: el script de Streamlit
+# dibuja la interfaz al importarse, así que se extraen solo las
+# definiciones pedidas (funciones y constantes) y se ejecutan
+# aisladas, con los nombres que cada prueba agregue al namespace.
+# ==============================================================
+
+import os
+import ast
+import numpy as np
+import pandas as pd
+
+SCRIPT_GESTOR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Gestor_MF_Fijo_Movilidad_versio_envio.py")
+
+def cargar_funciones(nombres, **globales):
+    with open(SCRIPT_GESTOR, encoding="utf-8") as f:
+        arbol = ast.parse(f.read(), filename=SCRIPT_GESTOR)
+    nodos = [
+        n for n in arbol.body
+        if (isinstance(n, ast.FunctionDef) and n.name in nombres)
+        or (isinstance(n, ast.Assign) and all(isinstance(t, ast.Name) and t.id in nombres for t in n.targets))
+    ]
+    ns = {"pd": pd, "np": np, **globales}
+    exec(compile(ast.Module(nodos, type_ignores=[]), SCRIPT_GESTOR, "exec"), ns)
+    return ns
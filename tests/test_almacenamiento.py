@@ -0,0 +1,25 @@
+import types
+import pytest
+import almacenamiento
+import contador
+
+@pytest.fixture
+def backend_limitado(monkeypatch):
+    # Backend sin escritura condicional ni consulta de cambios (como office365)
+    limitado = types.SimpleNamespace(
+        get_item_metadata=lambda path: {"eTag": "v1"},
+        get_file_if_exists=lambda path: None,
+        upload_file_to_sharepoint=lambda path, data: pytest.fail("no debe subir sin comparar el eTag"),
+    )
+    monkeypatch.setattr(almacenamiento, "_modulo", limitado)
+    monkeypatch.setattr(contador, "_cache", None)
+    return limitado
+
+def test_sin_escritura_condicional_el_contador_no_pierde_incrementos(backend_limitado):
+    with pytest.raises(almacenamiento.NoSoportado):
+        contador.next_version(contador.fecha_hoy())
+
+def test_sin_consulta_de_cambios(backend_limitado):
+    assert not almacenamiento.soporta_delta()
+    with pytest.raises(almacenamiento.NoSoportado):
+        almacenamiento.drive_delta()
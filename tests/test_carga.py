@@ -0,0 +1,26 @@
+import pandas as pd
+import carga
+import esquema
+from cambios import asignar_rowkey
+
+def _base(ids, isp):
+    df = pd.DataFrame({"ID SONDA": ids, "ISP": isp})
+    return asignar_rowkey(esquema.tipar(df, esquema.inferir_esquema(df, "Fijo")))
+
+def test_deltas_siguen_a_su_fila_si_cambian_las_posiciones():
+    base = _base([10, 20, 30], ["ICE", "Tigo", "Claro"])
+    claves = carga.claves_filas(base, "Fijo")
+    deltas = {"20": {"ISP": "Liberty"}, "30": {"ISP": "Kölbi"}}
+    assert carga.con_deltas(base, deltas, claves)["ISP"].tolist() == ["ICE", "Liberty", "Kölbi"]
+
+    # Otra sesión inserta una fila al inicio y borra la 30: la edición de 20 sigue en
+    # su fila y la de 30 se descarta
+    nueva = _base([5, 10, 20], ["Claro", "ICE", "Tigo"])
+    claves = carga.claves_filas(nueva, "Fijo")
+    assert carga.descartar_huerfanas(deltas, claves) == ["30"]
+    assert deltas == {"20": {"ISP": "Liberty"}}
+    assert carga.con_deltas(nueva, deltas, claves)["ISP"].tolist() == ["Claro", "ICE", "Liberty"]
+
+def test_sin_clave_unica_se_usa_la_posicion():
+    base = _base([10, 10, 30], ["ICE", "Tigo", "Claro"])
+    assert list(carga.claves_filas(base, "Fijo")) == ["0", "1", "2"]
@@ -0,0 +1,22 @@
+import pandas as pd
+import catalogo_backups
+from cambios import COLUMNAS_CAMBIOS
+
+def _entrada(ruta, timestamp):
+    return catalogo_backups.entrada_backup("Fijo", "MF.xlsx", ruta, timestamp, None, 10, pd.DataFrame(columns=COLUMNAS_CAMBIOS))
+
+def test_registros_concurrentes_no_se_pisan(monkeypatch):
+    # Otra sesión registra su backup entre la lectura del índice y la subida
+    subir = catalogo_backups.upload_if_match
+    intercalado = []
+    def subir_tras_otra_sesion(path, data, etag):
+        if not intercalado:
+            intercalado.append(True)
+            catalogo_backups.registrar_backups([_entrada("Backups/otra.xlsx", "20240101_000000")])
+        return subir(path, data, etag)
+    monkeypatch.setattr(catalogo_backups, "upload_if_match", subir_tras_otra_sesion)
+
+    catalogo_backups.registrar_backups([_entrada("Backups/propia.xlsx", "20240102_000000")])
+
+    rutas = {e["ruta"] for e in catalogo_backups.leer_catalogo()}
+    assert {"Backups/otra.xlsx", "Backups/propia.xlsx"} <= rutas
@@ -0,0 +1,23 @@
+import os
+import correo
+
+class SmtpFalso:
+    def __init__(self): self.enviados = []
+    def send_message(self, msg): self.enviados.append(msg["Subject"])
+    def noop(self): return (250, b"ok")
+    def quit(self): pass
+
+def test_eml_faltante_va_a_fallidos_sin_bloquear_la_cola(monkeypatch):
+    monkeypatch.setattr(correo, "iniciar_despachador", lambda: type("D", (), {"despertar": lambda self: None})())
+    roto = correo.encolar_correo("Roto", "cuerpo", [], versionar=False)
+    sano = correo.encolar_correo("Sano", "cuerpo", [], versionar=False)
+    os.remove(correo._ruta(roto, "eml"))
+
+    despachador = correo._Despachador()
+    smtp = SmtpFalso()
+    monkeypatch.setattr(despachador, "_conexion", lambda: smtp)
+    despachador.procesar()
+
+    assert smtp.enviados == ["Sano"]
+    assert correo.pendientes() == []
+    assert [m["id"] for m in correo.fallidos()] == [roto]
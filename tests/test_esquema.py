@@ -0,0 +1,25 @@
+import pandas as pd
+import esquema
+from cambios import asignar_rowkey
+
+def test_para_guardar_conserva_texto_con_forma_de_numero():
+    # Inferida como texto por la mezcla; Stm está declarada como texto en ESQUEMAS
+    df = pd.DataFrame({"CODIGO": [3, 2.5, "3.50", "1.0", "A-1"], "Stm": ["3.50", "7", "STM-1", "8", "9"]})
+    tipos = esquema.inferir_esquema(df, "Fijo")
+    assert tipos == {"CODIGO": "texto", "Stm": "texto"}
+    numeros = esquema.numeros_originales(df, tipos, "Fijo")
+    guardado = esquema.para_guardar(asignar_rowkey(esquema.tipar(df, tipos)), numeros)
+    # Los números que tipar pasó a texto vuelven a ser números; lo escrito como texto no cambia
+    assert guardado["CODIGO"].tolist() == [3, 2.5, "3.50", "1.0", "A-1"]
+    assert guardado["Stm"].tolist() == ["3.50", "7", "STM-1", "8", "9"]
+
+def test_para_guardar_no_convierte_lo_tecleado():
+    df = pd.DataFrame({"CODIGO": [3, "A-1", "B-2", 4]})
+    tipos = esquema.inferir_esquema(df, None)
+    numeros = esquema.numeros_originales(df, tipos)
+    editado = asignar_rowkey(esquema.tipar(df, tipos))
+    # Texto con forma de número tecleado sobre un texto y sobre un número
+    editado.loc[[1, 3], "CODIGO"] = ["5", "7"]
+    assert esquema.para_guardar(editado, numeros)["CODIGO"].tolist() == [3, "5", "B-2", "7"]
+    # Un tramo (exportación) se alinea por ROWKEY, no por posición
+    assert esquema.para_guardar(editado.iloc[[3, 0]], numeros)["CODIGO"].tolist() == ["7", 3]
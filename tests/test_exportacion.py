@@ -0,0 +1,40 @@
+import io
+import pandas as pd
+import pytest
+from streamlit.elements.widgets.button import convert_data_to_bytes_and_infer_mime
+import esquema
+import exportacion
+from cambios import asignar_rowkey
+from filtros import aplicar_filtros
+
+@pytest.fixture
+def vista():
+    df = pd.DataFrame({
+        "ID SONDA": [1, 2, 3, 4],
+        "Stm": ["STM-1", "STM-2", "STM-3", "STM-4"],
+        "PROVINCIA": ["Limón", "Cartago", "Limón", "Heredia"],
+        "FECHA": pd.to_datetime(["2024-01-01", None, "2024-03-01", "2024-04-01"]),
+    })
+    tipos = esquema.inferir_esquema(df, "Fijo")
+    df = asignar_rowkey(esquema.tipar(df, tipos))
+    return df, aplicar_filtros(df, {"PROVINCIA": ["Limón"]}), tipos
+
+@pytest.mark.parametrize("formato", list(exportacion.FORMATOS))
+def test_generar_devuelve_bytes_aceptados_por_download_button(vista, formato):
+    df, df_filtrado, tipos = vista
+    datos = exportacion.descarga_diferida(formato, df, df_filtrado, tipos)()
+    assert isinstance(datos, bytes)
+    convertido, _ = convert_data_to_bytes_and_infer_mime(datos, unsupported_error=TypeError("tipo no soportado"))
+    assert convertido == datos
+
+@pytest.mark.parametrize("formato, leer", [
+    ("Excel", lambda b: pd.read_excel(io.BytesIO(b))),
+    ("CSV", lambda b: pd.read_csv(io.BytesIO(b), encoding="utf-8-sig")),
+    ("Parquet", lambda b: pd.read_parquet(io.BytesIO(b))),
+])
+def test_exporta_solo_filas_filtradas(vista, formato, leer, monkeypatch):
+    df, df_filtrado, tipos = vista
+    monkeypatch.setattr(exportacion, "FILAS_POR_TRAMO", 1)
+    leido = leer(exportacion.descarga_diferida(formato, df, df_filtrado, tipos)())
+    assert list(leido.columns) == list(tipos)
+    assert leido["Stm"].tolist() == ["STM-1", "STM-3"]
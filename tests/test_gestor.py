@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+from script_gestor import cargar_funciones
+
+@pytest.fixture(scope="module")
+def gestor():
+    return cargar_funciones([
+        "ROWKEY", "_valor_para_columna", "_firma_evento", "_evento_en_sincronia", "_aplicar_evento_celda",
+        "normalize_df_for_compare", "_sincronizar_con_grid",
+    ])
+
+@pytest.fixture
+def df(gestor):
+    # Tipos como los deja pd.read_excel
+    df = pd.DataFrame({
+        "ID SONDA": np.array([10, 20, 30], dtype="int64"),
+        "LATITUD": np.array([9.9, 10.1, 8.7], dtype="float64"),
+        "ISP": pd.Series(["ICE", "Cabletica", "Tigo"]),
+        "FECHA": pd.to_datetime(["2024-01-01", "2024-02-01", None]),
+    })
+    df[gestor["ROWKEY"]] = np.arange(len(df)).astype(str)
+    return df
+
+def evento(gestor, fila, col, nuevo, anterior=None):
+    return {"type": "cellValueChanged", "data": {gestor["ROWKEY"]: str(fila)}, "colDef": {"field": col},
+            "newValue": nuevo, "oldValue": anterior}
+
+def test_texto_en_columna_entera_se_convierte(gestor, df):
+    assert gestor["_aplicar_evento_celda"](df, evento(gestor, 1, "ID SONDA", "25"))
+    assert df["ID SONDA"].dtype == "int64" and df.at[1, "ID SONDA"] == 25
+
+def test_decimal_en_columna_entera_la_ensancha(gestor, df):
+    gestor["_aplicar_evento_celda"](df, evento(gestor, 0, "ID SONDA", 10.5))
+    assert df["ID SONDA"].dtype == "float64" and df.at[0, "ID SONDA"] == 10.5
+
+def test_texto_no_numerico_pasa_la_columna_a_object(gestor, df):
+    gestor["_aplicar_evento_celda"](df, evento(gestor, 2, "LATITUD", "sin dato"))
+    assert df.at[2, "LATITUD"] == "sin dato" and df.at[0, "LATITUD"] == 9.9
+
+def test_vacio_y_fechas(gestor, df):
+    gestor["_aplicar_evento_celda"](df, evento(gestor, 0, "LATITUD", ""))
+    gestor["_aplicar_evento_celda"](df, evento(gestor, 2, "FECHA", "2024-05-03"))
+    gestor["_aplicar_evento_celda"](df, evento(gestor, 1, "ISP", "Liberty"))
+    assert pd.isna(df.at[0, "LATITUD"])
+    assert df.at[2, "FECHA"] == pd.Timestamp("2024-05-03")
+    assert df.at[1, "ISP"] == "Liberty"
+
+def test_eventos_ignorados(gestor, df):
+    antes = df.copy()
+    assert not gestor["_aplicar_evento_celda"](df, None)
+    assert not gestor["_aplicar_evento_celda"](df, {"type": "cellClicked"})
+    assert not gestor["_aplicar_evento_celda"](df, evento(gestor, 0, gestor["ROWKEY"], "9"))
+    assert not gestor["_aplicar_evento_celda"](df, evento(gestor, 0, "NO EXISTE", "9"))
+    pd.testing.assert_frame_equal(df, antes)
+
+def test_firma_y_sincronia(gestor, df):
+    e = evento(gestor, 1, "ISP", "Liberty", "Cabletica")
+    assert gestor["_firma_evento"](e) == gestor["_firma_evento"](dict(e))
+    assert gestor["_evento_en_sincronia"](df, e)
+    assert not gestor["_evento_en_sincronia"](df, evento(gestor, 1, "ISP", "Liberty", "Tigo"))
+    assert gestor["_evento_en_sincronia"](df, evento(gestor, 0, "ID SONDA", "11", "10"))
+    assert gestor["_evento_en_sincronia"](df, evento(gestor, 2, "FECHA", "2024-05-03", None))
+
+def test_correo_usa_el_contador_compartido(monkeypatch):
+    # Mismo contador que el outbox (contador.py); un envío fallido devuelve su número
+    import almacenamiento
+    import contador
+    almacenamiento.ensure_folder(almacenamiento.FOLDER_PATH)
+    ns = cargar_funciones(["_enviar_correo_guardado"], contador=contador, tiempos=__import__("tiempos"), st=None)
+    enviados = []
+    fecha = contador.fecha_hoy()
+    monkeypatch.setattr(contador, "_cache", None)
+    inicial = contador._leer_remoto()
+    base = inicial["cnt"] if inicial["fecha"] == fecha else 0
+
+    def falla(**k): raise OSError("smtp caído")
+    ns["enviar_correo_con_adjuntos"] = falla
+    with pytest.raises(OSError):
+        ns["_enviar_correo_guardado"]("cuerpo", [])
+    assert contador._leer_remoto()["cnt"] == base
+
+    ns["enviar_correo_con_adjuntos"] = lambda **k: enviados.append(k["asunto"])
+    assert ns["_enviar_correo_guardado"]("cuerpo", [])["contador"] == base + 1
+    assert contador._leer_remoto() == {"fecha": fecha, "cnt": base + 1, "etag": contador._cache["etag"]}
+    assert len(enviados) == 1
+
+def test_ediciones_sin_evento_se_toman_del_grid(gestor, df):
+    # Dos ediciones en el mismo rerun: solo llega el evento de la segunda y su valor
+    # anterior ya no coincide con la sesión; los datos del grid traen ambas
+    datos = df.astype(object).copy()
+    datos.loc[0, "ISP"] = "Liberty"
+    datos.loc[1, "ID SONDA"] = "25"
+    datos["FECHA"] = ["2024-01-01T00:00:00.000Z", "2024-02-01T00:00:00.000Z", None]
+    datos = datos.drop(index=2)   # una fila que el grid no devolvió no se toca
+    antes = df.copy()
+    assert gestor["_sincronizar_con_grid"](df, datos) == 2
+    assert df.at[0, "ISP"] == "Liberty" and df.at[1, "ID SONDA"] == 25 and df["ID SONDA"].dtype == "int64"
+    pd.testing.assert_frame_equal(df.drop(index=[0, 1]), antes.drop(index=[0, 1]))
+    assert gestor["_sincronizar_con_grid"](df, None) == 0
@@ -0,0 +1,98 @@
+import pytest
+import almacenamiento
+import carga
+import guardado
+from benchmarks.generador import generar_masterfile, a_excel
+from cambios import huella_deltas
+from registro import ARCHIVOS
+
+FOLDER = almacenamiento.FOLDER_PATH
+
+@pytest.fixture
+def registro(monkeypatch):
+    # Masterfiles nuevos en el almacenamiento local; subidas y correos quedan registrados
+    almacenamiento.ensure_folder(FOLDER)
+    for modo, n_arc in ARCHIVOS.items():
+        df = generar_masterfile(modo, 50)
+        if modo == "Fijo": df.loc[5, "Stm"] = "3.50"   # texto con forma de número, sin editar
+        almacenamiento.upload_file_to_sharepoint(f"{FOLDER}/{n_arc}", a_excel(df))
+    carga._cargar_version.clear()
+    subidas, correos = [], []
+    subir = guardado.upload_file_to_sharepoint
+    monkeypatch.setattr(guardado, "upload_file_to_sharepoint", lambda path, datos: subidas.append(path) or subir(path, datos))
+    monkeypatch.setattr(guardado.correo, "encolar_correo", lambda asunto, cuerpo, *a, **k: correos.append((asunto, cuerpo)) or "job")
+    return subidas, correos
+
+def _id(fila):
+    # Clave de fila de los deltas (ID SONDA del generador, como texto)
+    return str(100000 + fila)
+
+def _deltas():
+    return {"Fijo": {_id(0): {"Stm": "3.50"}, _id(3): {"ISP": "Liberty"}}, "Movilidad": {_id(1): {"NOMBRE PANELISTA": "Ana"}}}
+
+def _modificados(deltas):
+    # Como en un rerun de la sesión: base vigente + deltas
+    modificados = []
+    for modo, n_arc in ARCHIVOS.items():
+        _, df, _, etag = carga.cargar_masterfile(modo, n_arc)
+        modificados.append((modo, carga.con_deltas(df, deltas[modo], carga.claves_masterfile(modo, n_arc, etag)), n_arc))
+    return modificados
+
+@pytest.mark.parametrize("paso_fallido", ["catalogo", "correo"])
+def test_reintento_tras_sobrescritura_no_repite_subidas(registro, monkeypatch, paso_fallido):
+    subidas, correos = registro
+    deltas = _deltas()
+    clave, huella = guardado.transaccion.nueva_clave(), huella_deltas(deltas)
+    objetivo, nombre = (guardado.catalogo_backups, "registrar_backups") if paso_fallido == "catalogo" else (guardado.correo, "encolar_correo")
+    original = getattr(objetivo, nombre)
+
+    def falla(*args, **kwargs): raise RuntimeError(f"falla {paso_fallido}")
+    monkeypatch.setattr(objetivo, nombre, falla)
+    with pytest.raises(RuntimeError):
+        guardado.guardar_masterfiles(_modificados(deltas), clave, huella)
+    assert len(subidas) == 2 * len(ARCHIVOS)   # backup + sobrescritura de cada uno
+
+    # Reintento: la base ya es la versión publicada y las ediciones siguen en los deltas
+    monkeypatch.setattr(objetivo, nombre, original)
+    resumen = guardado.guardar_masterfiles(_modificados(deltas), clave, huella)
+
+    assert len(subidas) == 2 * len(ARCHIVOS)
+    assert [asunto for asunto, _ in correos] == ["Masterfile Sutel"]
+    assert len(resumen["Fijo"]) == 2 and len(resumen["Movilidad"]) == 1
+    assert guardado.transaccion.pendientes() == []
+
+    # La celda con "3.50" no se editó: se vuelve a publicar como texto
+    publicado = carga.cargar_masterfile("Fijo", ARCHIVOS["Fijo"])[1]
+    assert publicado.loc[5, "Stm"] == "3.50"
+
+def _seccion(cuerpo, modo):
+    # Líneas del correo bajo "ENTORNO <modo>"
+    return cuerpo.split(f"ENTORNO {modo.upper()}:\n")[1].split("\n\n")[0]
+
+def test_otros_datos_empiezan_de_nuevo(registro, monkeypatch):
+    subidas, correos = registro
+    clave = guardado.transaccion.nueva_clave()
+    base = carga.cargar_masterfile("Fijo", ARCHIVOS["Fijo"])[1]
+    monkeypatch.setattr(guardado.correo, "encolar_correo", lambda *a, **k: (_ for _ in ()).throw(RuntimeError("smtp")))
+    with pytest.raises(RuntimeError):
+        guardado.guardar_masterfiles(_modificados(_deltas()), clave, huella_deltas(_deltas()))
+    monkeypatch.setattr(guardado.correo, "encolar_correo", lambda asunto, cuerpo, *a, **k: correos.append((asunto, cuerpo)) or "job")
+
+    # Otra edición antes de reintentar: la transacción empieza de nuevo sobre lo ya publicado
+    otros = _deltas()
+    otros["Fijo"][_id(7)] = {"ISP": "Tigo"}
+    resumen = guardado.guardar_masterfiles(_modificados(otros), clave, huella_deltas(otros))
+
+    # Fijo se vuelve a subir (tiene una edición nueva); Movilidad no cambió desde el primer intento
+    assert len(subidas) == 2 * len(ARCHIVOS) + 2
+    assert len(correos) == 1
+    cuerpo = correos[0][1]
+    fijo, movilidad = _seccion(cuerpo, "Fijo"), _seccion(cuerpo, "Movilidad")
+    # El correo informa todo lo publicado por este guardado, desde la versión previa
+    assert f"Stm {base.loc[0, 'Stm']}: Stm de '{base.loc[0, 'Stm']}' → '3.50'" in fijo
+    assert f"ISP de '{base.loc[3, 'ISP']}' → 'Liberty'" in fijo
+    assert f"ISP de '{base.loc[7, 'ISP']}' → 'Tigo'" in fijo
+    assert len(resumen["Fijo"]) == 3
+    assert "NOMBRE PANELISTA" in movilidad and "→ 'Ana'" in movilidad
+    assert "Sin cambios" not in cuerpo
+    assert guardado.transaccion.pendientes() == []
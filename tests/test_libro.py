@@ -0,0 +1,45 @@
+import io
+import re
+import zipfile
+import pandas as pd
+import openpyxl
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import PatternFill
+from openpyxl.worksheet.table import Table
+import libro
+
+def _libro_con_tabla():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Datos"
+    ws.append(["ID SONDA", "ISP", "VELOCIDAD"])
+    for fila in [[1, "Tigo", 10], [2, "Liberty", 20], [3, "Kolbi", 30]]:
+        ws.append(fila)
+    ws.column_dimensions["B"].width = 32
+    ws.add_table(Table(displayName="Sondas", ref="A1:C4"))
+    ws.conditional_formatting.add("C2:C4", CellIsRule(operator="greaterThan", formula=["15"], fill=PatternFill(bgColor="FFC7CE")))
+    wb.create_sheet("Notas").append(["sin tocar"])
+    salida = io.BytesIO()
+    wb.save(salida)
+    return salida.getvalue()
+
+def test_reescribir_hoja_conserva_tabla_y_formato():
+    df = pd.DataFrame({"ID SONDA": [1, 2, 3, 4], "ISP": ["Tigo", "Claro", "Kolbi", "Telecable"], "VELOCIDAD": [10, 25, 30, 40]})
+    datos = libro.reemplazar_hojas(_libro_con_tabla(), {"Datos": df})
+
+    with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+        nombres = set(zf.namelist())
+        tipos = zf.read("[Content_Types].xml").decode()
+        # Toda parte declarada en [Content_Types] sigue en el paquete y viceversa
+        for parte in [n for n in nombres if n.startswith("xl/tables/")]:
+            assert f'PartName="/{parte}"' in tipos
+        assert all(p.lstrip("/") in nombres for p in re.findall(r'PartName="([^"]+)"', tipos))
+
+    wb = openpyxl.load_workbook(io.BytesIO(datos))
+    ws = wb["Datos"]
+    assert ws.tables["Sondas"].ref == "A1:C5"
+    assert ws.column_dimensions["B"].width == 32
+    assert [str(r.sqref) for r in ws.conditional_formatting] == ["C2:C4"]
+    assert [[c.value for c in fila] for fila in ws.iter_rows(min_row=2)] == df.values.tolist()
+    assert wb["Notas"]["A1"].value == "sin tocar"
+    pd.testing.assert_frame_equal(pd.read_excel(io.BytesIO(datos), sheet_name="Datos"), df)
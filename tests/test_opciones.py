@@ -0,0 +1,13 @@
+import subprocess
+import sys
+from conftest import RAIZ
+
+def test_modulos_del_gestor_importan_sin_config(tmp_path):
+    # El Gestor standalone solo tiene st.secrets: tiempos y transaccion no deben exigir config.py
+    codigo = (
+        f"import sys; sys.path.insert(0, {RAIZ!r})\n"
+        "import opciones, tiempos, transaccion\n"
+        "assert opciones.get_secret_opcional('no_existe', 'defecto') == 'defecto'\n"
+    )
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=tmp_path, capture_output=True, text=True)
+    assert resultado.returncode == 0, resultado.stderr
@@ -0,0 +1,13 @@
+import pandas as pd
+from cambios import asignar_rowkey, conjunto_cambios
+from registro import masterfile
+
+def test_movilidad_identifica_por_stm():
+    df = asignar_rowkey(pd.DataFrame({"ID SONDA": [1, 2], "Stm": ["STM-1", "STM-2"], "ISP": ["Tigo", "Kolbi"]}))
+    editado = df.copy()
+    editado.loc[1, "ISP"] = "Claro"
+    assert masterfile("Movilidad")["identificador"] == "Stm"
+    assert conjunto_cambios(df, editado, "Movilidad")["identificador"].tolist() == ["Stm STM-2"]
+    # Sin la columna se identifica por la clave
+    sin_stm = conjunto_cambios(df.drop(columns="Stm"), editado.drop(columns="Stm"), "Movilidad")
+    assert sin_stm["identificador"].tolist() == ["ID 2"]
@@ -0,0 +1,142 @@
+# ==============================================================
+# Tiempos por fase (token, sitio, descarga, read_excel, filtros,
+# editor, diff, to_excel, subida, SMTP) agregados por rerun y por
+# guardado, como líneas JSON en el log y en un panel opcional.
+# Desactivado por defecto (secret `tiempos`): span() devuelve
+# entonces un contexto nulo compartido y no mide nada.
+# ==============================================================
+
+import json
+import time
+import logging
+import threading
+from contextlib import nullcontext
+import pandas as pd
+import streamlit as st
+from opciones import opcion_activa
+
+ACTIVO = opcion_activa("tiempos", False)
+
+log = logging.getLogger("masterfile.tiempos")
+if ACTIVO and not log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+
+_NULO = nullcontext()
+_local = threading.local()   # mediciones abiertas en este hilo (cada sesión corre en el suyo)
+
+def _abiertas():
+    if not hasattr(_local, "pila"): _local.pila = []
+    return _local.pila
+
+# ========= Mediciones (un rerun, un guardado, un envío) =========
+class Medicion:
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self.inicio = time.time()
+        self.total_s = None
+        self.fases = {}     # nombre -> [llamadas, segundos]
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, segundos):
+        with self._lock:
+            fase = self.fases.setdefault(nombre, [0, 0.0])
+            fase[0] += 1
+            fase[1] += segundos
+
+    def resumen(self):
+        return {
+            "evento": "tiempos",
+            "tipo": self.tipo,
+            "inicio": self.inicio,
+            "total_s": round(self.total_s, 6) if self.total_s is not None else None,
+            "fases": {n: {"llamadas": k, "total_s": round(s, 6)} for n, (k, s) in self.fases.items()},
+        }
+
+    def cerrar(self):
+        self.total_s = time.perf_counter() - self._t0
+        log.info(json.dumps(self.resumen(), ensure_ascii=False))
+        return self
+
+    def __enter__(self):
+        _abiertas().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        pila = _abiertas()
+        if self in pila: pila.remove(self)
+        self.cerrar()
+        return False
+
+class _Span:
+    __slots__ = ("nombre", "_t0")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        segundos = time.perf_counter() - self._t0
+        pila = _abiertas()
+        if not pila:
+            log.info(json.dumps({"evento": "tiempos", "tipo": "suelto", "fases": {self.nombre: {"llamadas": 1, "total_s": round(segundos, 6)}}}))
+        # Una fase dentro de un guardado cuenta también para el rerun que lo contiene
+        for med in pila: med.registrar(self.nombre, segundos)
+        return False
+
+def span(nombre):
+    return _Span(nombre) if ACTIVO else _NULO
+
+def medicion(tipo):
+    return Medicion(tipo) if ACTIVO else _NULO
+
+def propagar(fn):
+    # Las fases que `fn` mida en otro hilo (p. ej. un pool) cuentan para las
+    # mediciones abiertas en el hilo que la envía
+    if not ACTIVO: return fn
+    pila = list(_abiertas())
+    def envuelta(*args, **kwargs):
+        _local.pila = list(pila)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.pila = []
+    return envuelta
+
+# Para el rerun completo, que no cabe en un bloque `with` (el script entero)
+def iniciar_rerun():
+    if not ACTIVO: return None
+    _local.pila = []    # descarta lo que haya dejado abierto un st.stop() anterior
+    return Medicion("rerun").__enter__()
+
+def finalizar_rerun():
+    pila = _abiertas() if ACTIVO else []
+    if not pila: return None
+    med = pila[0]
+    med.__exit__(None, None, None)
+    return med
+
+# ========= Panel =========
+def _tabla(resumen):
+    total = resumen["total_s"] or 0
+    filas = [{
+        "Fase": n,
+        "Llamadas": f["llamadas"],
+        "Segundos": round(f["total_s"], 3),
+        "% del total": round(100 * f["total_s"] / total, 1) if total else None,
+    } for n, f in resumen["fases"].items()]
+    return pd.DataFrame(filas).sort_values("Segundos", ascending=False) if filas else pd.DataFrame(filas)
+
+def mostrar_panel(resumenes):
+    # resumenes: {titulo: resumen()} — p. ej. último rerun y último guardado
+    if not ACTIVO: return
+    with st.sidebar.expander("⏱️ Tiempos por fase"):
+        for titulo, resumen in resumenes.items():
+            if resumen is None: continue
+            st.markdown(f"**{titulo}** · {resumen['total_s']:.3f} s")
+            st.dataframe(_tabla(resumen), hide_index=True, use_container_width=True)
@@ -0,0 +1,137 @@
+# ==============================================================
+# Transacciones de guardado con bitácora de pasos en disco
+# Cada guardado tiene una clave de idempotencia (la sesión la
+# conserva hasta que termina bien). Los pasos completados y sus
+# resultados quedan en <guardado_estado>/<clave>/bitacora.json,
+# así un reintento retoma desde el primer paso incompleto y nunca
+# repite una subida que ya se hizo.
+#
+# La bitácora guarda además una huella de los datos a guardar: si
+# la persona cambió algo entre intentos, la transacción anterior se
+# descarta y se empieza de nuevo. Solo sobrevive lo conservado
+# (conservar / archivo_conservado): lo que un intento anterior ya
+# publicó sigue siendo parte del mismo guardado.
+#
+# Secrets: guardado_estado (carpeta; estado/guardados por defecto)
+# y guardado_retencion_dias (bitácoras abandonadas, 7 por defecto).
+# ==============================================================
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from opciones import get_secret_opcional
+
+CONSERVADOS = "conservados"   # subcarpeta que no se borra al empezar de nuevo
+
+ESTADO_DIR = get_secret_opcional("guardado_estado", os.path.join(os.path.dirname(os.path.abspath(__file__)), "estado", "guardados"))
+RETENCION_DIAS = float(get_secret_opcional("guardado_retencion_dias", 7))
+
+log = logging.getLogger(__name__)
+
+def nueva_clave():
+    return f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:12]}"
+
+def _escribir_atomico(path, data):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class Transaccion:
+    def __init__(self, clave, huella):
+        self.clave = clave
+        self.dir = os.path.join(ESTADO_DIR, clave)
+        self._path = os.path.join(self.dir, "bitacora.json")
+        self._lock = threading.Lock()
+        self.bitacora = self._leer()
+        self.retomada = self.bitacora is not None and self.bitacora.get("huella") == huella
+        if not self.retomada:
+            conservados = {}
+            if self.bitacora is not None:
+                log.info("Guardado %s: los datos cambiaron desde el intento anterior; se empieza de nuevo", clave)
+                conservados = self.bitacora.get("conservados", {})
+                self._vaciar()
+            self.bitacora = {"clave": clave, "huella": huella, "creado": time.time(), "datos": {}, "pasos": {}, "conservados": conservados}
+        self.bitacora.setdefault("conservados", {})
+        os.makedirs(self.dir, exist_ok=True)
+        self._guardar()
+
+    def _vaciar(self):
+        # Artefactos del intento anterior, salvo los conservados
+        for nombre in os.listdir(self.dir):
+            if nombre == CONSERVADOS: continue
+            path = os.path.join(self.dir, nombre)
+            if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+            else: os.remove(path)
+
+    def _leer(self):
+        try:
+            with open(self._path, encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _guardar(self):
+        _escribir_atomico(self._path, json.dumps(self.bitacora).encode("utf-8"))
+
+    def dato(self, nombre, calcular):
+        # Valor fijado en el primer intento (p. ej. el timestamp de los backups)
+        with self._lock:
+            if nombre not in self.bitacora["datos"]:
+                self.bitacora["datos"][nombre] = calcular()
+                self._guardar()
+            return self.bitacora["datos"][nombre]
+
+    def hecho(self, nombre):
+        return nombre in self.bitacora["pasos"]
+
+    def paso(self, nombre, ejecutar):
+        # Ejecuta el paso solo si no se completó antes; el resultado (JSON) queda en la
+        # bitácora en cuanto termina, antes de seguir con el próximo paso
+        if self.hecho(nombre): return self.bitacora["pasos"][nombre]
+        resultado = ejecutar()
+        with self._lock:
+            self.bitacora["pasos"][nombre] = resultado
+            self._guardar()
+        return resultado
+
+    def archivo(self, nombre):
+        # Artefactos del guardado (libros serializados, conjuntos de cambios)
+        return os.path.join(self.dir, nombre)
+
+    def conservar(self, nombre, valor):
+        # Como dato(), pero sobrevive a un reinicio por cambio de datos
+        with self._lock:
+            self.bitacora["conservados"][nombre] = valor
+            self._guardar()
+
+    def conservado(self, nombre):
+        return self.bitacora["conservados"].get(nombre)
+
+    def archivo_conservado(self, nombre):
+        os.makedirs(os.path.join(self.dir, CONSERVADOS), exist_ok=True)
+        return os.path.join(self.dir, CONSERVADOS, nombre)
+
+    def terminar(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+def abrir(clave, huella):
+    _limpiar_abandonadas()
+    return Transaccion(clave or nueva_clave(), huella)
+
+def pendientes():
+    # Guardados que quedaron a medias (para avisar en la interfaz)
+    if not os.path.isdir(ESTADO_DIR): return []
+    return sorted(n for n in os.listdir(ESTADO_DIR) if os.path.isfile(os.path.join(ESTADO_DIR, n, "bitacora.json")))
+
+def _limpiar_abandonadas():
+    limite = time.time() - RETENCION_DIAS * 86400
+    for clave in pendientes():
+        path = os.path.join(ESTADO_DIR, clave, "bitacora.json")
+        try:
+            if os.path.getmtime(path) < limite: shutil.rmtree(os.path.join(ESTADO_DIR, clave), ignore_errors=True)
+        except OSError:
+            continue
@@ -0,0 +1,94 @@
+# ==============================================================
+# Vigilancia de cambios remotos con /delta de Microsoft Graph
+# Un hilo por proceso consulta periódicamente los cambios del drive
+# (solo metadatos, nunca el contenido de los libros) y actualiza el
+# mapa de versiones de carga.py: la versión anterior sale de la
+# caché compartida y los reruns dejan de consultar el eTag a Graph.
+# El deltaLink se persiste para retomar desde el mismo punto.
+#
+# Secrets: delta_intervalo (segundos, 0 = desactivada; 60 por
+# defecto) y delta_estado (archivo donde se guarda el deltaLink).
+# Para probarla sin red: graph_local.py también responde /delta.
+# ==============================================================
+
+import os
+import json
+import time
+import logging
+import threading
+from opciones import get_secret_opcional
+from almacenamiento import drive_delta, soporta_delta, DeltaExpirado
+import carga
+
+INTERVALO = float(get_secret_opcional("delta_intervalo", 60))
+ESTADO_PATH = get_secret_opcional("delta_estado", os.path.join(os.path.dirname(os.path.abspath(__file__)), "estado", "delta.json"))
+
+log = logging.getLogger(__name__)
+
+def _leer_delta_link():
+    try:
+        with open(ESTADO_PATH, encoding="utf-8") as f: return json.load(f).get("delta_link")
+    except (OSError, ValueError):
+        return None
+
+def _guardar_delta_link(delta_link):
+    os.makedirs(os.path.dirname(ESTADO_PATH), exist_ok=True)
+    tmp = f"{ESTADO_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump({"delta_link": delta_link}, f)
+    os.replace(tmp, ESTADO_PATH)
+
+class Vigilante:
+    def __init__(self, intervalo=INTERVALO):
+        self.intervalo = intervalo
+        self.delta_link = _leer_delta_link()
+        self.desde = None           # momento (monotonic) desde el que se siguen los cambios
+        self.ultimos_cambios = []   # paths que cambiaron en la última consulta
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def consultar(self):
+        # Una consulta a /delta; devuelve los paths de Masterfile que cambiaron
+        momento = time.monotonic()
+        try:
+            items, self.delta_link = drive_delta(self.delta_link)
+        except DeltaExpirado:
+            log.warning("El deltaLink expiró; se reinicia el seguimiento de cambios")
+            carga.confirmar_vigilancia(None, 0.0)
+            self.desde = None
+            items, self.delta_link = drive_delta(None)
+        _guardar_delta_link(self.delta_link)
+        # Lo registrado antes del inicio del seguimiento no está cubierto por /delta
+        if self.desde is None: self.desde = momento
+        self.ultimos_cambios = carga.aplicar_cambios_remotos(items, momento)
+        carga.confirmar_vigilancia(self.desde, time.monotonic() + 2 * self.intervalo)
+        for path in self.ultimos_cambios: log.info("Cambio remoto detectado en %s", path)
+        return self.ultimos_cambios
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                self.consultar()
+            except Exception:
+                # Sin confirmación la carga vuelve a consultar el eTag en cada rerun
+                log.exception("Falló la consulta de cambios remotos")
+            self._detener.wait(self.intervalo)
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, name="vigilancia-delta", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+        carga.confirmar_vigilancia(None, 0.0)
+
+_vigilante = None
+_lock_inicio = threading.Lock()
+
+def iniciar():
+    # Un único vigilante por proceso
+    global _vigilante
+    if INTERVALO <= 0 or not soporta_delta(): return None
+    with _lock_inicio:
+        if _vigilante is None: _vigilante = Vigilante().iniciar()
+    return _vigilante